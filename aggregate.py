@@ -0,0 +1,315 @@
+"""
+we-are-what-we-eat · Survey Aggregation
+=======================================
+Computes every count analyse.py reports — single-choice and multi-select
+frequency tables, option pairs ticked together, avatar distribution, mean
+Flavour Dimensions and neophobia bins — once, into an Aggregates object. The console summary and
+summary.json are both rendered from that one result.
+
+Aggregates from separate batches of responses can be merged, giving the
+same result as aggregating all of them at once.
+
+AggregateStore keeps one Aggregates per school level on disk, together with
+the (submitted_at, id) watermark of the newest response it has counted, so
+summary.json can be refreshed by reading only the responses that arrived
+since (analyse.py --state).
+"""
+
+import os
+import json
+from collections import Counter
+from datetime import datetime, timedelta
+
+from fetch import lookback_cursor
+from multiselect import MULTI_SELECT, encode
+from scoring import DIMENSIONS
+
+SINGLE_CHOICE = [
+    "q1_who", "q2_level", "q3_gender",
+    "q4_texture", "q5_flavour", "q6_snack", "q7_spicy", "q8_fruit", "q9_new", "q10_new_food",
+    "q11_veg", "q12_drinks", "q13_fried", "q14_family", "q15_snack_decide", "q16_breakfast", "q17_school",
+    "q20_substitute", "q21_intro", "q22_convo",
+    "q23_feel", "q25_improve",
+]
+
+# 0–8: 0-2 Neophobic, 3-5 Moderate, 6-8 Adventurous
+NEOPHOBIA_BINS = [("Neophobic (0–2)", 2), ("Moderate (3–5)", 5), ("Adventurous (6–8)", 8)]
+OPEN_TO_SUBSTITUTION = ["Definitely yes!", "Maybe, if it tastes similar"]
+
+
+def _counts(series):
+    """Value counts in order of first appearance (the tie order value_counts uses)."""
+    vc = series.value_counts(sort=False)
+    return Counter({v: int(c) for v, c in vc.items() if c})
+
+
+def _merge_into(dst, src):
+    # Keeps dst's key order and appends new keys at the end, so ties still
+    # break by first appearance across batches
+    for k, v in src.items():
+        dst[k] = dst.get(k, 0) + v
+
+
+def _merge_pairs(dst, src):
+    # A pair is keyed in its batch's first-appearance order, so another batch
+    # may hold (b, a) for dst's (a, b): fold it into the existing key
+    for (a, b), v in src.items():
+        key = (b, a) if (b, a) in dst else (a, b)
+        dst[key] = dst.get(key, 0) + v
+
+
+def _neo_bin(score):
+    for label, upper in NEOPHOBIA_BINS:
+        if score <= upper:
+            return label
+    return NEOPHOBIA_BINS[-1][0]
+
+
+class Aggregates:
+    """Mergeable counts and sums for one set of survey responses."""
+
+    def __init__(self):
+        self.n          = 0
+        self.first      = None       # earliest submitted_at
+        self.last       = None       # latest submitted_at
+        self.emails     = 0
+        self.single     = {col: Counter() for col in SINGLE_CHOICE}
+        self.multi      = {col: Counter() for col in MULTI_SELECT}
+        self.pairs      = {col: Counter() for col in MULTI_SELECT}   # (a, b) ticked together
+        self.avatars    = Counter()
+        self.dim_sums   = {d: 0 for d in DIMENSIONS}
+        self.neo_sum    = 0
+        self.neo_bins   = Counter({label: 0 for label, _ in NEOPHOBIA_BINS})
+        self.open_to_substitution = 0
+
+    @classmethod
+    def from_frame(cls, df, scores, multi=None):
+        """Aggregate a DataFrame of responses and its score_profiles() result.
+
+        `multi` is multiselect.encode(df), if the caller already has it.
+        """
+        agg = cls()
+        agg.n = len(df)
+        if not agg.n:
+            return agg
+        agg.first = df["submitted_at"].min()
+        agg.last  = df["submitted_at"].max()
+
+        emails = df["email"].dropna() if "email" in df else []
+        agg.emails = int((emails.str.strip() != "").sum()) if len(emails) else 0
+
+        for col in SINGLE_CHOICE:
+            if col in df:
+                agg.single[col] = _counts(df[col])
+        if multi is None:
+            multi = encode(df)
+        for col in MULTI_SELECT:
+            agg.multi[col] = multi[col].counts()
+            agg.pairs[col] = multi[col].pairs()
+
+        agg.avatars  = _counts(scores["avatar_name"])
+        agg.dim_sums = {d: int(scores[d].sum()) for d in DIMENSIONS}
+        agg.neo_sum  = int(scores["neo_score"].sum())
+        for score, c in _counts(scores["neo_score"]).items():
+            agg.neo_bins[_neo_bin(score)] += c
+        if "q20_substitute" in df:
+            agg.open_to_substitution = int(df["q20_substitute"].isin(OPEN_TO_SUBSTITUTION).sum())
+        return agg
+
+    def merge(self, other):
+        """Fold another batch's aggregates into this one (in place)."""
+        if not other.n:
+            return self
+        self.n += other.n
+        self.first = other.first if self.first is None else min(self.first, other.first)
+        self.last  = other.last  if self.last  is None else max(self.last, other.last)
+        self.emails += other.emails
+        for col, counts in other.single.items():
+            _merge_into(self.single.setdefault(col, Counter()), counts)
+        for col, counts in other.multi.items():
+            _merge_into(self.multi.setdefault(col, Counter()), counts)
+        for col, counts in other.pairs.items():
+            _merge_pairs(self.pairs.setdefault(col, Counter()), counts)
+        _merge_into(self.avatars, other.avatars)
+        for d in DIMENSIONS:
+            self.dim_sums[d] += other.dim_sums[d]
+        self.neo_sum += other.neo_sum
+        _merge_into(self.neo_bins, other.neo_bins)
+        self.open_to_substitution += other.open_to_substitution
+        return self
+
+    # ── persistence ──────────────────────────────────────────────────────────
+
+    def to_state(self):
+        """JSON-safe dict that from_state() turns back into equal Aggregates."""
+        return {
+            "n": self.n,
+            "first": self.first.isoformat() if self.first is not None else None,
+            "last":  self.last.isoformat() if self.last is not None else None,
+            "emails": self.emails,
+            "single": {col: dict(c) for col, c in self.single.items()},
+            "multi":  {col: dict(c) for col, c in self.multi.items()},
+            # JSON has no tuple keys: [a, b, count] triples, in order
+            "pairs":  {col: [[a, b, n] for (a, b), n in c.items()] for col, c in self.pairs.items()},
+            "avatars": dict(self.avatars),
+            "dim_sums": self.dim_sums,
+            "neo_sum": self.neo_sum,
+            "neo_bins": dict(self.neo_bins),
+            "open_to_substitution": self.open_to_substitution,
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        agg = cls()
+        agg.n      = state["n"]
+        agg.first  = datetime.fromisoformat(state["first"]) if state["first"] else None
+        agg.last   = datetime.fromisoformat(state["last"]) if state["last"] else None
+        agg.emails = state["emails"]
+        agg.single.update({col: Counter(c) for col, c in state["single"].items()})
+        agg.multi.update({col: Counter(c) for col, c in state["multi"].items()})
+        agg.pairs.update({col: Counter({(a, b): n for a, b, n in triples})
+                          for col, triples in state["pairs"].items()})
+        agg.avatars  = Counter(state["avatars"])
+        agg.dim_sums = dict(state["dim_sums"])
+        agg.neo_sum  = state["neo_sum"]
+        agg.neo_bins = Counter(state["neo_bins"])
+        agg.open_to_substitution = state["open_to_substitution"]
+        return agg
+
+    # ── read-outs ────────────────────────────────────────────────────────────
+
+    def top(self, col, n=None):
+        """(value, count) pairs, most common first, for a question column."""
+        counts = self.single.get(col) or self.multi.get(col) or Counter()
+        return counts.most_common(n)
+
+    def top_pairs(self, col, n=None):
+        """("A + B", count) for the options most often ticked together."""
+        return [(" + ".join(pair), c) for pair, c in self.pairs[col].most_common(n)]
+
+    def answered(self, col):
+        """How many responses answered a single-choice question."""
+        return sum(self.single.get(col, {}).values())
+
+    def mean_dimension(self, dim):
+        return self.dim_sums[dim] / self.n if self.n else 0.0
+
+    def mean_neophobia(self):
+        return self.neo_sum / self.n if self.n else 0.0
+
+    def to_summary(self):
+        """The summary.json document."""
+        N = self.n
+        return {
+            "generated_at": datetime.now().isoformat(),
+            "total_responses": N,
+            "date_range": {"from": str(self.first.date()), "to": str(self.last.date())},
+            "by_level": dict(self.top("q2_level")),
+            "by_gender": dict(self.top("q3_gender")),
+            "top_flavour": dict(self.top("q5_flavour", 3)),
+            "top_texture": dict(self.top("q4_texture", 3)),
+            "top_snack":   dict(self.top("q6_snack", 3)),
+            "cuisine_pairs": dict(self.top_pairs("q18_cuisine", 10)),
+            "avatar_distribution": dict(self.avatars.most_common()),
+            "mean_dimensions": {d: round(self.mean_dimension(d), 2) for d in DIMENSIONS},
+            "neophobia": {
+                "mean_score": round(self.mean_neophobia(), 2),
+                "distribution": {label: self.neo_bins[label] for label, _ in NEOPHOBIA_BINS},
+            },
+            "emails_collected": self.emails,
+            "open_to_substitution_pct": int(self.open_to_substitution / N * 100),
+        }
+
+
+# ── PERSISTED STATE ────────────────────────────────────────────────────────────
+# Partials are kept per q2_level, so a --level summary is read straight from
+# its partial and the full summary is their merge. Counts only ever grow:
+# responses edited or deleted after they were counted need a --rebuild.
+#
+# submitted_at is the inserting transaction's start time, so a response can
+# commit after newer ones were counted. Each update re-reads STATE_LOOKBACK
+# seconds behind the watermark and skips the ids it already counted there.
+
+STATE_VERSION  = 2     # bump when scoring or the state layout changes
+STATE_LOOKBACK = 300   # seconds re-read behind the watermark on every update
+
+
+def _ts(value):
+    return datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+
+
+class AggregateStore:
+    """Per-level Aggregates plus the watermark of the newest response counted."""
+
+    def __init__(self, lookback=STATE_LOOKBACK):
+        self.watermark = None    # (submitted_at, id) of the newest response counted
+        self.levels    = {}      # q2_level ("" when missing) → Aggregates
+        self.recent    = {}      # id → submitted_at of counted responses within lookback
+        self.lookback  = lookback
+
+    @classmethod
+    def load(cls, path):
+        """The saved store, or an empty one if there is none (or it is outdated)."""
+        store = cls()
+        if not os.path.exists(path):
+            return store
+        with open(path) as f:
+            state = json.load(f)
+        if state.get("version") != STATE_VERSION:
+            return store
+        store.watermark = tuple(state["watermark"]) if state["watermark"] else None
+        store.levels = {level: Aggregates.from_state(s) for level, s in state["levels"].items()}
+        store.recent = state["recent"]
+        return store
+
+    def save(self, path):
+        """Write atomically so an interrupted run can't corrupt the state."""
+        state = {"version": STATE_VERSION, "saved_at": datetime.now().isoformat(),
+                 "watermark": list(self.watermark) if self.watermark else None,
+                 "recent": self.recent,
+                 "levels": {level: agg.to_state() for level, agg in self.levels.items()}}
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp, path)
+
+    def after(self):
+        """Keyset start of the next update: `lookback` seconds before the watermark."""
+        return lookback_cursor(self.watermark, self.lookback)
+
+    def uncounted(self, rows):
+        """The rows of a page read from after() that aren't counted yet."""
+        return [r for r in rows if str(r["id"]) not in self.recent]
+
+    def add(self, df, scores, watermark):
+        """Fold a batch of responses (oldest first) into the per-level partials.
+
+        `scores` is score_profiles(df); `watermark` is the (submitted_at, id)
+        of the batch's last row. An empty `df` just moves the watermark.
+        """
+        if len(df):
+            levels = df["q2_level"].astype(object).fillna("") if "q2_level" in df else None
+            groups = df.groupby(levels, sort=False) if levels is not None else [("", df)]
+            for level, part in groups:
+                batch = Aggregates.from_frame(part, scores.loc[part.index])
+                self.levels.setdefault(level, Aggregates()).merge(batch)
+            for rid, ts in zip(df["id"], df["submitted_at"]):
+                self.recent[str(rid)] = ts.isoformat() if hasattr(ts, "isoformat") else str(ts)
+        if not self.watermark or tuple(watermark) > tuple(self.watermark):
+            self.watermark = tuple(watermark)
+        if self.lookback:
+            horizon = _ts(self.watermark[0]) - timedelta(seconds=self.lookback)
+            self.recent = {rid: ts for rid, ts in self.recent.items() if _ts(ts) >= horizon}
+
+    @property
+    def n(self):
+        return sum(agg.n for agg in self.levels.values())
+
+    def result(self, level=None):
+        """Aggregates for one level, or for every response counted so far."""
+        if level is not None:
+            return self.levels.get(level) or Aggregates()
+        total = Aggregates()
+        for agg in self.levels.values():
+            total.merge(agg)
+        return total
@@ -0,0 +1,236 @@
+"""
+we-are-what-we-eat · Benchmarks
+===============================
+Times each stage of analyse.py and generate_report.py on synthetic
+responses (synthetic.py), so a slowdown shows up before a school-wide run
+rather than during one. Nothing here talks to Supabase or sends email.
+
+Stages:
+  fetch        page through a local Arrow snapshot (snapshot.py)
+  frame        rows → pandas DataFrame, as analyse.py loads them
+  scoring      score_profiles() over the whole frame
+  aggregation  multi-select encoding + Aggregates (console / summary.json)
+  startup      cold start of the quick commands (--help, analyse.py --cached /
+               --counts), which must not import pandas, matplotlib, reportlab
+               or supabase; each should start within STARTUP_TARGET
+  chart        make_bar_chart() (or draw_bar_chart()) for distinct profiles, uncached
+  pdf          generate_pdf() for a sample of respondents
+  email        build_message() + serialisation for the same sample
+
+Usage:
+  pip install pyarrow pandas numpy reportlab matplotlib
+  python bench.py                              # 10,000 rows
+  python bench.py --rows 1000000 --pdfs 0      # data stages only
+  python bench.py --save bench.json            # keep results …
+  python bench.py --baseline bench.json        # … and compare a later run
+  python bench.py --chart-renderer vector      # reportlab charts instead of matplotlib
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime
+
+try:
+    import pandas as pd
+except ImportError:
+    print("Run: pip install pandas numpy")
+    sys.exit(1)
+
+import synthetic
+from aggregate import Aggregates
+from multiselect import encode
+from scoring import score_flavour_profile, score_profiles
+
+STAGES = ["fetch", "frame", "scoring", "aggregation", "startup", "chart", "pdf", "email"]
+STARTUP_TARGET = 0.25   # seconds per quick command, interpreter start included
+HEAVY_MODULES = {"pandas", "matplotlib", "reportlab", "supabase"}
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def timed(fn, repeat=1):
+    """Best wall-clock time of `repeat` calls; returns (seconds, last result)."""
+    best, result = None, None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+# ── STAGES ─────────────────────────────────────────────────────────────────────
+
+def run(args, workdir):
+    """Run every stage; returns {stage: {"items": n, "seconds": s}}."""
+    results = {}
+
+    def record(stage, items, seconds):
+        results[stage] = {"items": items, "seconds": seconds}
+        rate = f"{items / seconds:,.0f}/s" if seconds else "—"
+        print(f"  {stage:<12} {items:>10,}  {seconds:>9.3f}s  {rate:>12}")
+
+    print(f"\n  {'stage':<12} {'items':>10}  {'time':>10}  {'rate':>12}")
+
+    snap_path = os.path.join(workdir, "synthetic.arrow")
+    try:
+        import snapshot
+        synthetic.write_rows(snap_path, args.rows, seed=args.seed)
+        secs, rows = timed(lambda: [r for page in snapshot.iter_pages(snap_path) for r in page], args.repeat)
+        record("fetch", len(rows), secs)
+    except SystemExit:   # snapshot.py exits when pyarrow is missing
+        print(f"  {'fetch':<12} skipped (pip install pyarrow)")
+        rows = synthetic.generate(args.rows, seed=args.seed)
+
+    def frame():
+        df = pd.DataFrame(rows)
+        df["submitted_at"] = pd.to_datetime(df["submitted_at"], format="ISO8601")
+        return df
+    secs, df = timed(frame, args.repeat)
+    record("frame", len(df), secs)
+
+    secs, scores = timed(lambda: score_profiles(df), args.repeat)
+    record("scoring", len(df), secs)
+
+    secs, agg = timed(lambda: Aggregates.from_frame(df, scores, encode(df)), args.repeat)
+    record("aggregation", len(df), secs)
+
+    if args.startup:
+        with open(os.path.join(workdir, "summary.json"), "w") as f:
+            json.dump(agg.to_summary(), f, default=str)
+        commands = [["analyse.py", "--help"], ["generate_report.py", "--help"],
+                    ["analyse.py", "--cached", "--output-dir", workdir]]
+        if os.path.exists(snap_path):
+            commands.append(["analyse.py", "--counts", "--snapshot", snap_path])
+        secs = sum(startup(cmd, max(3, args.repeat)) for cmd in commands)
+        record("startup", len(commands), secs)
+
+    if not (args.charts or args.pdfs):
+        return results
+    try:
+        import generate_report as gr
+        gr.load_renderer(args.chart_renderer)
+    except SystemExit:   # load_renderer() exits when reportlab / matplotlib are missing
+        print(f"  {'chart/pdf':<12} skipped (pip install reportlab matplotlib)")
+        return results
+
+    if args.charts:
+        profiles = scores.drop_duplicates(subset=[d.lower() for d in gr.DIMS]).head(args.charts)
+        profiles = [p for _, p in profiles.iterrows()]
+        if args.chart_renderer == "vector":
+            def charts():
+                import io
+                from reportlab.pdfgen import canvas as rl_canvas
+                c = rl_canvas.Canvas(io.BytesIO())
+                for p in profiles:
+                    gr.draw_bar_chart(c, p, 36, 400, gr.CHART_HEIGHT_PT * gr.CHART_ASPECT, gr.CHART_HEIGHT_PT)
+                    c.showPage()
+                c.save()
+        else:
+            def charts():
+                return [gr.make_bar_chart(p, p["dominant"]) for p in profiles]
+        secs, _ = timed(charts, args.repeat)
+        record("chart", len(profiles), secs)
+
+    if args.pdfs:
+        sample = rows[:args.pdfs]
+        profiles = [score_flavour_profile(r) for r in sample]
+        pdf_dir = os.path.join(workdir, "reports")
+        os.makedirs(pdf_dir, exist_ok=True)
+
+        def pdfs():
+            gr.configure_chart_cache(renderer=args.chart_renderer)   # start cold, as a fresh run does
+            return [gr.generate_pdf(r, pdf_dir, p) for r, p in zip(sample, profiles)]
+        secs, paths = timed(pdfs, args.repeat)
+        record("pdf", len(paths), secs)
+        size = sum(os.path.getsize(p) for p in paths) / len(paths)
+        print(f"  {'':<12} {'':>10}  avg PDF size {size / 1024:,.0f} KB")
+
+        def emails():
+            return [gr.build_message(r["email"] or "parent@example.com", path, r, p).as_string()
+                    for r, p, path in zip(sample, profiles, paths)]
+        secs, _ = timed(emails, args.repeat)
+        record("email", len(sample), secs)
+
+    return results
+
+
+def startup(cmd, repeat):
+    """Best cold-start time of one script invocation; warns about slow or heavy starts."""
+    argv = [sys.executable, os.path.join(HERE, cmd[0])] + cmd[1:]
+    secs, _ = timed(lambda: subprocess.run(argv, capture_output=True, check=True), repeat)
+    # -X importtime lists every module imported, one per stderr line
+    trace = subprocess.run(argv[:1] + ["-X", "importtime"] + argv[1:], capture_output=True, text=True).stderr
+    loaded = {line.rsplit("|", 1)[-1].strip().split(".")[0]
+              for line in trace.splitlines() if line.startswith("import time:")}
+    heavy = sorted(loaded & HEAVY_MODULES)
+    flags = (f"  ⚠️  over {STARTUP_TARGET:g}s" if secs > STARTUP_TARGET else "") \
+        + (f"  ⚠️  imports {', '.join(heavy)}" if heavy else "")
+    print(f"  {'':<12} {'':>10}  {secs:>9.3f}s  {' '.join(cmd[:2])}{flags}")
+    return secs
+
+
+# ── COMPARISON ─────────────────────────────────────────────────────────────────
+
+def compare(record, baseline, tolerance):
+    """Print per-item slowdowns against a saved run; returns the regressed stages."""
+    regressed = []
+    if baseline.get("rows") != record["rows"]:
+        print("\n  ⚠️  Baseline used a different --rows; fixed costs skew per-item times.")
+    print(f"\n  vs baseline ({baseline.get('run_at', '?')}, {baseline.get('rows', '?'):,} rows):")
+    for stage in STAGES:
+        new, old = record["stages"].get(stage), baseline["stages"].get(stage)
+        if not new or not old or not new["items"] or not old["items"] or not old["seconds"]:
+            continue
+        ratio = (new["seconds"] / new["items"]) / (old["seconds"] / old["items"])
+        flag = "  ⚠️  slower" if ratio > 1 + tolerance else ""
+        print(f"    {stage:<12} {ratio:>6.2f}×{flag}")
+        if flag:
+            regressed.append(stage)
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the analysis and report pipeline on synthetic data")
+    parser.add_argument("--rows",   type=int, default=10_000, help="Synthetic responses (default: 10000)")
+    parser.add_argument("--seed",   type=int, default=0,      help="Random seed (default: 0)")
+    parser.add_argument("--charts", type=int, default=50,     help="Distinct charts to render (default: 50, 0 = skip)")
+    parser.add_argument("--pdfs",   type=int, default=20,     help="PDFs / emails to build (default: 20, 0 = skip)")
+    parser.add_argument("--chart-renderer", choices=["matplotlib", "vector"], default="matplotlib",
+                        help="Chart renderer for the chart / pdf stages (see generate_report.py)")
+    parser.add_argument("--no-startup", dest="startup", action="store_false",
+                        help="Skip timing the quick commands' cold start")
+    parser.add_argument("--repeat", type=int, default=1,      help="Run each stage N times, keep the best (default: 1)")
+    parser.add_argument("--save",     help="Write results to this JSON file")
+    parser.add_argument("--baseline", help="Compare against a JSON file written by --save")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Per-item slowdown vs --baseline that counts as a regression (default: 0.25)")
+    args = parser.parse_args()
+
+    print(f"⏱️  Benchmarking on {args.rows:,} synthetic responses (seed {args.seed})")
+    with tempfile.TemporaryDirectory(prefix="wawwe-bench-") as workdir:
+        results = run(args, workdir)
+
+    record = {"run_at": datetime.now().isoformat(timespec="seconds"), "rows": args.rows,
+              "seed": args.seed, "stages": results}
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(record, f, indent=2)
+        print(f"\n✅ Results saved → {args.save}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressed = compare(record, baseline, args.tolerance)
+        if regressed:
+            print(f"\n❌ Regression in: {', '.join(regressed)}")
+            sys.exit(1)
+        print("\n✅ No regressions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,400 @@
+"""
+we-are-what-we-eat · Bulk Loader
+================================
+Loads survey responses collected on paper or on offline tablets — CSV or
+JSONL dumps of hundreds to thousands of rows — into survey_responses, rather
+than one .insert([payload]) per response as index.html does.
+
+  • every row is checked against the form's submit payload: the same
+    columns, the text[] answers (q18_cuisine, q19_adv, q24_healthy) as
+    lists, and only answers the form or scoring.py knows. Bad rows are
+    reported by line, written to <file>.rejects.jsonl and left out
+  • rows are written in large batches, one transaction each: COPY into a
+    staging table on Postgres, executemany on SQLite, one bulk insert
+    request on Supabase
+  • a row without an id gets one derived from the file name, its line, its
+    contents and its timestamp (when one was given), so loading the same
+    file twice adds nothing the second time, while identical forms in two
+    files or loaded with different --submitted-at dates stay apart
+  • progress is reported in rows per second
+
+Rows dated before the load (their own submitted_at or --submitted-at) land
+behind the watermarks of analyse.py --state, generate_report.py and
+worker.py, which only look a few minutes back, and of snapshot.py, which
+doesn't look back at all. Their ids are written to <file>.backdated.txt for
+generate_report.py --ids-file, and the summary says to rebuild the running
+totals and the snapshot.
+
+In CSV files a text[] cell may hold a JSON array, a Postgres array literal
+({a,b}) or options separated by "|" or ";".
+
+Usage:
+  python bulkload.py school_a.csv --check                 # validate only
+  python bulkload.py school_a.csv school_b.jsonl --to survey.db
+  python bulkload.py tablets.jsonl --to postgres://localhost/survey
+  python bulkload.py school_a.csv --submitted-at 2026-05-12   # live Supabase table
+"""
+
+import os
+import ast
+import csv
+import sys
+import json
+import time
+import uuid
+import argparse
+from datetime import datetime, timedelta, timezone
+
+from aggregate import SINGLE_CHOICE, STATE_LOOKBACK
+from multiselect import MULTI_SELECT
+from scoring import ADV_FOODS_NONE, FLAVOUR_MAP, NEOPHOBIA_WEIGHTS
+from sources import SQLITE_COLUMNS, SQLITE_SCHEMA, TABLE, _iso, sqlite_values
+from synthetic import form_options
+
+BATCH_SIZE = 5000
+PAYLOAD_COLUMNS = [c for c in SQLITE_COLUMNS if c not in ("id", "submitted_at")]
+# Namespace for ids derived from row contents (uuid5)
+ID_NAMESPACE = uuid.UUID("6f1d7c1e-2b4a-4d8e-9a57-3c0f4b1e8d21")
+
+
+# ── VALIDATION ─────────────────────────────────────────────────────────────────
+
+def vocabulary():
+    """Accepted answers per question: the form's options plus scoring.py's keys."""
+    vocab = {col: set(opts) for col, opts in form_options().items()}
+    for col, mapping in {**FLAVOUR_MAP, **NEOPHOBIA_WEIGHTS}.items():
+        vocab.setdefault(col, set()).update(mapping)
+    vocab.setdefault("q19_adv", set()).add(ADV_FOODS_NONE)
+    return vocab
+
+
+def _parse_list(value):
+    """A text[] cell as a list of strings."""
+    if value is None:
+        return []
+    if isinstance(value, list):
+        return value
+    text = str(value).strip()
+    if not text:
+        return []
+    if text.startswith("["):
+        try:
+            return json.loads(text)
+        except ValueError:
+            return ast.literal_eval(text)   # Python list repr, as in responses.csv
+    if text.startswith("{") and text.endswith("}"):
+        inner = text[1:-1]
+        return next(csv.reader([inner], skipinitialspace=True)) if inner else []
+    sep = "|" if "|" in text else ";"
+    return [part.strip() for part in text.split(sep) if part.strip()]
+
+
+def validate(raw, line, vocab, submitted_at=None, name="", default_ts=None):
+    """Check one input row against the submit payload.
+
+    `submitted_at` is the operator's --submitted-at, `default_ts` the load's
+    start time used when neither it nor the row has one, and `name` the
+    file's base name. Returns (row, None) with every payload column present,
+    or (None, reason).
+    """
+    unknown = sorted(set(raw) - set(SQLITE_COLUMNS))
+    if unknown:
+        return None, f"unknown column(s): {', '.join(unknown)}"
+    row = {}
+    for col in SINGLE_CHOICE:
+        v = raw.get(col)
+        if v is None or v == "":
+            row[col] = None
+        elif not isinstance(v, str):
+            return None, f"{col}: expected text, got {v!r}"
+        elif v not in vocab.get(col, ()):
+            return None, f"{col}: unknown answer {v!r}"
+        else:
+            row[col] = v
+    for col in MULTI_SELECT:
+        try:
+            values = _parse_list(raw.get(col))
+        except (ValueError, SyntaxError):
+            return None, f"{col}: can't read {raw.get(col)!r} as a list"
+        if not isinstance(values, list) or not all(isinstance(v, str) for v in values):
+            return None, f"{col}: expected a list of text"
+        bad = [v for v in values if v not in vocab.get(col, ())]
+        if bad:
+            return None, f"{col}: unknown option(s) {', '.join(map(repr, bad))}"
+        row[col] = list(dict.fromkeys(values))   # a box is ticked once
+    email = (raw.get("email") or "").strip()
+    if email and ("@" not in email or " " in email):
+        return None, f"email: {email!r} is not an address"
+    row["email"] = email or None
+
+    ts = raw.get("submitted_at") or submitted_at or default_ts or datetime.now(timezone.utc)
+    try:
+        row["submitted_at"] = _iso(ts)
+    except (TypeError, ValueError):
+        return None, f"submitted_at: can't read {ts!r}"
+    if raw.get("id"):
+        try:
+            row["id"] = str(uuid.UUID(str(raw["id"])))
+        except ValueError:
+            return None, f"id: {raw['id']!r} is not a UUID"
+    else:
+        # Same file, line and contents → same id, so a reload is a no-op.
+        # A defaulted timestamp changes every run, so it is left out.
+        content = {c: row[c] for c in PAYLOAD_COLUMNS}
+        if raw.get("submitted_at") or submitted_at:
+            content["submitted_at"] = row["submitted_at"]
+        seed = json.dumps([name, line, content], sort_keys=True)
+        row["id"] = str(uuid.uuid5(ID_NAMESPACE, seed))
+    return row, None
+
+
+def read_rows(path):
+    """Yield (line number, raw row dict) from a .csv or .jsonl file."""
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        if path.lower().endswith(".csv"):
+            reader = csv.DictReader(f)
+            for raw in reader:
+                yield reader.line_num, {k: (v if v != "" else None) for k, v in raw.items() if k}
+        else:
+            for n, line in enumerate(f, 1):
+                if line.strip():
+                    try:
+                        raw = json.loads(line)
+                    except ValueError as e:
+                        raw = {"__error__": f"not JSON ({e})"}
+                    yield n, raw if isinstance(raw, dict) else {"__error__": "not a JSON object"}
+
+
+# ── DESTINATIONS ───────────────────────────────────────────────────────────────
+# write(rows) stores one batch in one transaction and returns how many rows
+# were new (None when the backend can't tell); existing ids are left alone.
+
+class SQLiteDestination:
+    def __init__(self, path):
+        import sqlite3
+        self.label = f"SQLite {path}"
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(SQLITE_SCHEMA)
+        self.sql = (f"INSERT OR IGNORE INTO {TABLE} ({', '.join(SQLITE_COLUMNS)}) "
+                    f"VALUES ({', '.join('?' * len(SQLITE_COLUMNS))})")
+
+    def write(self, rows):
+        before = self.conn.total_changes
+        with self.conn:
+            self.conn.executemany(self.sql, [sqlite_values(r) for r in rows])
+        return self.conn.total_changes - before
+
+    def close(self):
+        self.conn.close()
+
+
+class PostgresDestination:
+    """COPY into a staging table, then INSERT … ON CONFLICT DO NOTHING."""
+
+    def __init__(self, dsn):
+        try:
+            import psycopg as driver
+        except ImportError:
+            try:
+                import psycopg2 as driver
+            except ImportError:
+                print("Run: pip install psycopg")
+                sys.exit(1)
+        self.label = "Postgres"
+        self.copy = driver.__name__ == "psycopg"   # psycopg2 has no row-wise COPY
+        self.conn = driver.connect(dsn)
+        self.cols = ", ".join(SQLITE_COLUMNS)
+
+    def _values(self, row):
+        return [row.get(col) for col in SQLITE_COLUMNS]
+
+    def write(self, rows):
+        insert = f"INSERT INTO {TABLE} ({self.cols}) "
+        with self.conn.cursor() as cur:
+            if self.copy:
+                cur.execute(f"CREATE TEMP TABLE IF NOT EXISTS _bulkload "
+                            f"(LIKE {TABLE} INCLUDING DEFAULTS) ON COMMIT DELETE ROWS")
+                with cur.copy(f"COPY _bulkload ({self.cols}) FROM STDIN") as copy:
+                    for r in rows:
+                        copy.write_row(self._values(r))
+                cur.execute(insert + f"SELECT {self.cols} FROM _bulkload ON CONFLICT (id) DO NOTHING")
+            else:
+                from psycopg2.extras import execute_values
+                casts = {"id": "::uuid", "submitted_at": "::timestamptz",
+                         **{col: "::text[]" for col in MULTI_SELECT}}   # typed, even when empty
+                template = "(" + ", ".join(f"%s{casts.get(col, '')}" for col in SQLITE_COLUMNS) + ")"
+                execute_values(cur, insert + "VALUES %s ON CONFLICT (id) DO NOTHING",
+                               [self._values(r) for r in rows], template=template, page_size=len(rows))
+            new = cur.rowcount
+        self.conn.commit()
+        return new
+
+    def close(self):
+        self.conn.close()
+
+
+class SupabaseDestination:
+    """One bulk insert request per batch (PostgREST runs it as one transaction)."""
+
+    def __init__(self, url, key):
+        try:
+            from supabase import create_client
+        except ImportError:
+            print("Run: pip install supabase")
+            sys.exit(1)
+        self.label = "Supabase"
+        self.client = create_client(url, key)
+
+    def write(self, rows):
+        # The public key may insert but not read, so ask for no rows back
+        self.client.table(TABLE).upsert(rows, ignore_duplicates=True, returning="minimal").execute()
+        return None
+
+    def close(self):
+        pass
+
+
+def open_destination(spec=None, supabase_url=None, supabase_key=None):
+    """Destination for a --to value (None / "supabase" = the live table)."""
+    if spec in (None, "", "supabase"):
+        return SupabaseDestination(supabase_url, supabase_key)
+    if spec.startswith(("postgres://", "postgresql://")):
+        return PostgresDestination(spec)
+    if spec.startswith("sqlite:///"):
+        return SQLiteDestination(spec[len("sqlite:///"):])
+    if os.path.splitext(spec)[1].lower() in (".db", ".sqlite", ".sqlite3"):
+        return SQLiteDestination(spec)
+    raise ValueError(f"unknown destination: {spec!r} (expected supabase, postgres://…, sqlite:///… or *.db)")
+
+
+# ── LOADING ────────────────────────────────────────────────────────────────────
+
+def load(paths, dest=None, batch_size=BATCH_SIZE, submitted_at=None):
+    """Validate every file and write the good rows in batches.
+
+    `dest` None only validates; `submitted_at` None dates undated rows now.
+    Returns stats: valid, rejected, written, new (None if unknown), seconds
+    spent writing, backdated rows and the files their ids went to.
+    """
+    vocab = vocabulary()
+    started = datetime.now(timezone.utc)
+    now = started.isoformat()
+    horizon = started - timedelta(seconds=STATE_LOOKBACK)
+    stats = {"valid": 0, "rejected": 0, "written": 0, "new": 0, "seconds": 0.0,
+             "backdated": 0, "backdated_files": []}
+    batch = []
+
+    def flush():
+        t0 = time.perf_counter()
+        new = dest.write(batch)
+        secs = time.perf_counter() - t0
+        stats["written"] += len(batch)
+        stats["seconds"] += secs
+        stats["new"] = None if new is None or stats["new"] is None else stats["new"] + new
+        rate = len(batch) / secs if secs else float("inf")
+        print(f"  ⬆️  {stats['written']:>8,} rows written  ·  batch of {len(batch):,} in {secs:.2f}s"
+              f"  ({rate:,.0f} rows/s)" + (f"  ·  {new:,} new" if new is not None else ""))
+        batch.clear()
+
+    for path in paths:
+        rejects_path = path + ".rejects.jsonl"
+        name = os.path.basename(path)
+        rejects = None
+        backdated = []   # ids dated before the load's lookback horizon
+        valid = rejected = 0
+        for line, raw in read_rows(path):
+            if "__error__" in raw:
+                row, err = None, raw["__error__"]
+            else:
+                row, err = validate(raw, line, vocab, submitted_at, name, now)
+            if err:
+                rejected += 1
+                if rejected <= 10:
+                    print(f"  ⚠️  {name}:{line}  {err}")
+                if rejects is None:
+                    rejects = open(rejects_path, "w", encoding="utf-8")
+                rejects.write(json.dumps({"line": line, "error": err, "row": raw}, default=str) + "\n")
+                continue
+            valid += 1
+            if dest:
+                if datetime.fromisoformat(row["submitted_at"]) < horizon:
+                    backdated.append(row["id"])
+                batch.append(row)
+                if len(batch) >= batch_size:
+                    flush()
+        if rejects:
+            rejects.close()
+        if backdated:
+            with open(path + ".backdated.txt", "w", encoding="utf-8") as f:
+                f.write("\n".join(backdated) + "\n")
+            stats["backdated"] += len(backdated)
+            stats["backdated_files"].append(path + ".backdated.txt")
+        print(f"  📄 {path}: {valid:,} valid" + (f", {rejected:,} rejected → {rejects_path}" if rejected else ""))
+        stats["valid"] += valid
+        stats["rejected"] += rejected
+    if dest and batch:
+        flush()
+    return stats
+
+
+# ── CLI ────────────────────────────────────────────────────────────────────────
+
+def main():
+    from analyse import SUPABASE_URL, SUPABASE_KEY
+
+    parser = argparse.ArgumentParser(description="Bulk-load CSV / JSONL survey batches into survey_responses")
+    parser.add_argument("files", nargs="+", help="CSV or JSONL files of responses")
+    parser.add_argument("--to",         default=None, help="supabase (default), postgres://…, sqlite:///… or *.db")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help=f"Rows per transaction (default: {BATCH_SIZE})")
+    parser.add_argument("--submitted-at", default=None,
+                        help="Timestamp for rows without submitted_at, e.g. the day the paper forms were filled in "
+                             "(default: now)")
+    parser.add_argument("--check",      action="store_true", help="Validate only; write nothing")
+    args = parser.parse_args()
+
+    missing = [p for p in args.files if not os.path.exists(p)]
+    if missing:
+        print(f"❌ no such file: {', '.join(missing)}")
+        sys.exit(1)
+    if args.batch_size < 1:
+        parser.error("--batch-size must be at least 1")
+
+    dest = None
+    if not args.check:
+        try:
+            dest = open_destination(args.to, SUPABASE_URL, SUPABASE_KEY)
+        except ValueError as e:
+            print(f"❌ {e}")
+            sys.exit(1)
+        print(f"📥 Loading {len(args.files)} file(s) → {dest.label}, {args.batch_size:,} rows per transaction")
+    else:
+        print(f"🔎 Checking {len(args.files)} file(s)")
+
+    t0 = time.perf_counter()
+    try:
+        stats = load(args.files, dest, args.batch_size, args.submitted_at)
+    finally:
+        if dest:
+            dest.close()
+    elapsed = time.perf_counter() - t0
+
+    if args.check:
+        print(f"\n✅ {stats['valid']:,} valid  |  Rejected: {stats['rejected']:,}")
+        return
+    rate = stats["written"] / elapsed if elapsed else 0
+    print(f"\n✅ {stats['written']:,} row(s) written in {elapsed:.1f}s ({rate:,.0f} rows/s)"
+          + (f"  |  New: {stats['new']:,}  |  Already there: {stats['written'] - stats['new']:,}"
+             if stats["new"] is not None else "")
+          + (f"  |  Rejected: {stats['rejected']:,}" if stats["rejected"] else ""))
+    if stats["backdated"]:
+        print(f"\n⚠️  {stats['backdated']:,} row(s) are dated before this load, behind the point that\n"
+              f"   analyse.py --state, generate_report.py, worker.py and snapshot.py have already\n"
+              f"   read to. They won't be picked up incrementally. Catch them up with:\n"
+              f"     python analyse.py --state <state file> --rebuild\n"
+              f"     python snapshot.py --full             # if you read from a snapshot")
+        for ids_path in stats["backdated_files"]:
+            print(f"     python generate_report.py --ids-file {ids_path}")
+
+
+if __name__ == "__main__":
+    main()
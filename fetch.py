@@ -0,0 +1,170 @@
+"""
+we-are-what-we-eat · Survey Response Fetching
+=============================================
+Shared by analyse.py and generate_report.py.
+
+Pages through the survey_responses table with keyset pagination on
+(submitted_at, id) instead of one big select("*"), so cohorts larger than
+PostgREST's max-rows limit are never silently cut off. The next page is
+downloaded on a background thread while the caller works on the current one.
+
+  iter_pages(client, ...)      — yields lists of rows, one per page
+  iter_responses(client, ...)  — yields rows one at a time
+  count_responses(client, ...) — exact row count for the same filters
+
+Pass `after=(submitted_at, id)` to resume strictly after a known row, e.g.
+the high-water mark of a previous run. An id of None, as lookback_cursor()
+returns, means every row from submitted_at on: readers that re-read a few
+minutes behind their mark use it, and it never compares ids. A long `ids` list is split into
+in_() filters of ID_BATCH ids, so the request URL stays within server limits
+however many respondents are asked for.
+"""
+
+import queue
+import threading
+from datetime import datetime, timedelta
+
+TABLE = "survey_responses"
+PAGE_SIZE = 1000   # PostgREST's default max-rows on Supabase
+ID_BATCH  = 150    # ids per in_() filter: ~5.5 KB of URL, under common 8 KB limits
+
+
+def _filtered(query, level=None, since=None, ids=None):
+    """Apply the --level / --since / --id filters to a query."""
+    if level:
+        query = query.eq("q2_level", level)
+    if since:
+        query = query.gte("submitted_at", since)
+    if ids is not None:
+        query = query.in_("id", list(ids))
+    return query
+
+
+def lookback_cursor(cursor, seconds):
+    """An `after` cursor `seconds` before `cursor`: (submitted_at, None)."""
+    if not cursor or not seconds:
+        return cursor
+    ts = datetime.fromisoformat(str(cursor[0]).replace("Z", "+00:00"))
+    return ((ts - timedelta(seconds=seconds)).isoformat(), None)
+
+
+def _after(query, cursor):
+    """Keyset condition: rows strictly after (submitted_at, id) = cursor, or
+    from submitted_at on when the id is None."""
+    ts, row_id = cursor
+    if row_id is None:
+        return query.gte("submitted_at", ts)
+    return query.or_(f'submitted_at.gt."{ts}",and(submitted_at.eq."{ts}",id.gt.{row_id})')
+
+
+def _fetch_pages(client, level, since, ids, limit, page_size, after):
+    cursor = after
+    remaining = limit
+    while remaining is None or remaining > 0:
+        size = page_size if remaining is None else min(page_size, remaining)
+        query = _filtered(client.table(TABLE).select("*"), level, since, ids)
+        if cursor:
+            query = _after(query, cursor)
+        rows = query.order("submitted_at").order("id").limit(size).execute().data
+        # Only an empty page means we're done: the server may cap a page
+        # below `size`, so a short page is not proof of the end.
+        if not rows:
+            return
+        yield rows
+        cursor = (rows[-1]["submitted_at"], rows[-1]["id"])
+        if remaining is not None:
+            remaining -= len(rows)
+
+
+def _by_id_batch(fetch, ids, limit=None, batch=ID_BATCH):
+    """Pages from `fetch(id_batch)` for each batch of (distinct) `ids`, capped at `limit` rows.
+
+    Each batch comes back oldest first; batches follow each other in the
+    order the ids were given.
+    """
+    ids = list(dict.fromkeys(map(str, ids)))
+    remaining = limit
+    for i in range(0, len(ids), batch):
+        for rows in fetch(ids[i:i + batch]):
+            if remaining is not None:
+                rows = rows[:remaining]
+                remaining -= len(rows)
+            if rows:
+                yield rows
+            if remaining == 0:
+                return
+
+
+def _prefetch(pages, depth=1):
+    """Run the `pages` generator on a background thread, `depth` pages ahead."""
+    buf = queue.Queue(maxsize=depth)
+    done = object()
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                buf.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def producer():
+        try:
+            for page in pages:
+                if not put(page):
+                    return
+            put(done)
+        except BaseException as e:   # re-raised in the consuming thread
+            put(e)
+
+    thread = threading.Thread(target=producer, name="fetch-prefetch", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = buf.get()
+            if item is done:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+
+
+def iter_pages(client, level=None, since=None, ids=None, limit=None,
+               page_size=PAGE_SIZE, prefetch=True, after=None):
+    """Yield survey responses page by page, oldest first.
+
+    `limit` caps the total number of rows. With `prefetch` the following
+    page is already downloading while the caller processes the current one.
+    """
+    if ids is not None and not ids:
+        return iter(())
+    if ids is not None and len(ids) > ID_BATCH:
+        pages = _by_id_batch(lambda batch: _fetch_pages(client, level, since, batch, None, page_size, after),
+                             ids, limit)
+    else:
+        pages = _fetch_pages(client, level, since, ids, limit, page_size, after)
+    return _prefetch(pages) if prefetch else pages
+
+
+def iter_responses(client, **kwargs):
+    """Yield survey responses one row at a time (see iter_pages)."""
+    for page in iter_pages(client, **kwargs):
+        yield from page
+
+
+def count_responses(client, level=None, since=None, ids=None, after=None):
+    """Exact number of rows matching the filters, without downloading them."""
+    if ids is not None and not ids:
+        return 0
+    if ids is not None and len(ids) > ID_BATCH:
+        ids = list(dict.fromkeys(map(str, ids)))
+        return sum(count_responses(client, level, since, ids[i:i + ID_BATCH], after)
+                   for i in range(0, len(ids), ID_BATCH))
+    query = _filtered(client.table(TABLE).select("id", count="exact"), level, since, ids)
+    if after:
+        query = _after(query, after)
+    return query.limit(1).execute().count or 0
@@ -5,27 +5,43 @@ Pulls every response from Supabase, scores the 6 Flavour Dimensions,
 and renders a branded 2-page A4 PDF for each respondent.
 
 Usage:
-  pip3 install reportlab matplotlib supabase
+  pip3 install reportlab matplotlib supabase pandas
   python3 generate_report.py                   # generate all PDFs
   python3 generate_report.py --limit 5         # first 5 only (preview)
   python3 generate_report.py --id <uuid>       # single respondent
+  python3 generate_report.py --ids-file bounced.txt  # just these respondents (one UUID per line)
   python3 generate_report.py --output reports  # custom output folder
   python3 generate_report.py --send-emails     # generate + email PDFs
   python3 generate_report.py --send-emails --limit 1  # test with 1 email
-
-Output: reports/<id>.pdf  (one file per respondent)
+  python3 generate_report.py --workers 4       # render on 4 processes
+  python3 generate_report.py --incremental     # only new / changed responses
+  python3 generate_report.py --chart-cache .chart_cache  # keep charts between runs
+  python3 generate_report.py --chart-renderer vector     # reportlab charts, no matplotlib
+  python3 generate_report.py --combine level   # one printable pack per school level
+  python3 generate_report.py --combine 200     # one PDF per 200 respondents
+  python3 generate_report.py --snapshot survey_responses.arrow  # offline, from snapshot.py
+  python3 generate_report.py --source survey.db  # any sources.py backend
+  python3 generate_report.py --profile --limit 50  # where the time goes, per stage
+
+Rows flow through fetch → score → render → write → email stages joined by
+bounded queues (pipeline.py), so downloads, rendering, disk and SMTP overlap;
+each run ends with the stages' throughput.
+
+Output: reports/<level>_<id>.pdf  (one file per respondent), or with --combine
+        reports/<level>_reports.pdf / reports_<k>.pdf + page_index.json
 """
 
 import os
 import sys
 import argparse
 import io
-import smtplib
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
-from email.mime.base import MIMEBase
-from email import encoders
+import json
+import hashlib
+import time
 import textwrap
+import itertools
+import functools
+from collections import OrderedDict, deque
 from datetime import datetime
 
 # ── CONFIGURATION ──────────────────────────────────────────────────────────────
@@ -42,6 +58,7 @@ EMAIL_ADDRESS  = "isaacfoodlab@gmail.com"
 EMAIL_PASSWORD = "hpar qrxb prvr jnri"   # Gmail App Password
 SMTP_HOST      = "smtp.gmail.com"
 SMTP_PORT      = 587
+EMAIL_LOG_NAME = "email_log.jsonl"   # per-recipient outcomes, lets reruns resume
 
 # ── BRAND PALETTE ──────────────────────────────────────────────────────────────
 C = {
@@ -78,67 +95,9 @@ DIM_COLOR = {
 
 DIMS = ["Sweet", "Salty", "Sour", "Umami", "Crunchy", "Adventurous"]
 
-# ── FLAVOUR SCORING (same as analyse.py) ───────────────────────────────────────
-FLAVOUR_MAP = {
-    "q5_flavour": {
-        "Sweet":           {"sweet": 4},
-        "Salty":           {"salty": 4},
-        "Sour & Tangy":    {"sour": 4},
-        "Savoury / Umami": {"umami": 4},
-        "Slightly Bitter": {"umami": 2},
-    },
-    "q4_texture": {
-        "Crunchy & Crispy": {"crunchy": 4},
-        "Chewy":            {"crunchy": 1},
-        "Soft & Creamy":    {"sweet": 1},
-        "Fluffy & Airy":    {"sweet": 1},
-        "Juicy & Wet":      {"sour": 1},
-    },
-    "q6_snack": {
-        "Chips / Crisps":     {"salty": 2, "crunchy": 2},
-        "Chocolate":          {"sweet": 2},
-        "Biscuits / Cookies": {"sweet": 1, "crunchy": 1},
-        "Fresh Fruit":        {"sour": 1, "adventurous": 1},
-        "Seaweed Snack":      {"salty": 1, "crunchy": 2, "adventurous": 2},
-        "Ice Cream":          {"sweet": 2},
-        "Nuts or Seeds":      {"salty": 1, "crunchy": 2, "adventurous": 1},
-    },
-    "q9_new": {
-        "Yes, definitely!":    {"adventurous": 3},
-        "Maybe once or twice": {"adventurous": 2},
-        "Not really":          {"adventurous": 0},
-        "No":                  {"adventurous": 0},
-    },
-    "q10_new_food": {
-        "Try it straight away!": {"adventurous": 3},
-        "Ask what it is first":  {"adventurous": 2},
-        "Depends how it looks":  {"adventurous": 1},
-        "I usually avoid it":    {"adventurous": 0},
-    },
-    "q20_substitute": {
-        "Definitely yes!":             {"adventurous": 2},
-        "Maybe, if it tastes similar": {"adventurous": 1},
-        "Not sure":                    {"adventurous": 0},
-        "Probably not":                {"adventurous": 0},
-    },
-}
-
-AVATAR_NAMES = {
-    "sweet":       ("🍭 Sweet Seeker",   "You love sweet flavours and creamy textures!"),
-    "salty":       ("🧂 Salt Captain",   "Bold salty and savoury tastes are your zone!"),
-    "sour":        ("🍋 Sour Sparks",    "Tangy, sharp, and zingy — you love the tingle!"),
-    "umami":       ("🍜 Umami Master",   "Deep savoury flavours are your happy place!"),
-    "crunchy":     ("🥨 Crunch Hero",    "Texture is everything — you live for the crunch!"),
-    "adventurous": ("🌍 Food Explorer",  "You're a natural adventurer who loves trying new things!"),
-}
-
-NEOPHOBIA_WEIGHTS = {
-    "q9_new":       {"Yes, definitely!": 3, "Maybe once or twice": 2, "Not really": 1, "No": 0},
-    "q10_new_food": {"Try it straight away!": 3, "Ask what it is first": 2,
-                     "Depends how it looks": 1, "I usually avoid it": 0},
-    "q20_substitute": {"Definitely yes!": 2, "Maybe, if it tastes similar": 1,
-                       "Not sure": 0, "Probably not": 0},
-}
+# ── FLAVOUR SCORING (shared with analyse.py, see scoring.py) ──────────────────
+from scoring import DIM_CAP, DIMENSIONS, FLAVOUR_MAP, score_flavour_profile, score_profiles
+import profiling
 
 # ── SUBSTITUTION SUGGESTIONS ───────────────────────────────────────────────────
 # Personalised by dominant flavour + texture combo
@@ -175,43 +134,96 @@ SUBSTITUTIONS = {
     ("adventurous", "Fluffy & Airy"):    ["Pandan chiffon cake (naturally green!) 🌿", "Blue pea flower steamed buns 💙", "Matcha soft-serve with black sesame 🍵"],
 }
 
-def get_substitutions(dominant, texture):
-    """Get 3 personalised substitution suggestions."""
-    key = (dominant, texture)
-    if key in SUBSTITUTIONS:
-        return SUBSTITUTIONS[key]
-    # Fallback: use dominant only, pick any texture
-    for k, v in SUBSTITUTIONS.items():
-        if k[0] == dominant:
-            return v
-    return [
-        "More colourful fruits and vegetables 🌈",
-        "Wholegrain versions of your favourite foods 🌾",
-        "Water or low-sugar drinks instead of sodas 💧",
-    ]
+GENERIC_SUBSTITUTIONS = [
+    "More colourful fruits and vegetables 🌈",
+    "Wholegrain versions of your favourite foods 🌾",
+    "Water or low-sugar drinks instead of sodas 💧",
+]
+
+# Each swap list gets a Flavour DNA "prototype": its dimension at full
+# strength plus the points its texture scores in FLAVOUR_MAP. A respondent's
+# swaps are ranked by cosine similarity between their whole 6-dimension
+# profile and each prototype, with a bonus for their own texture; later items
+# of a list rank a little lower, so a close second flavour gets a look-in.
+SUBSTITUTION_TEXTURE_BONUS = 1.0
+SUBSTITUTION_POSITION_STEP = 0.1
+
+
+def _prototype(dominant, texture):
+    vec = {d: 0 for d in DIMENSIONS}
+    vec[dominant] = DIM_CAP
+    for dim, pts in FLAVOUR_MAP["q4_texture"].get(texture, {}).items():
+        vec[dim] += pts
+    norm = sum(v * v for v in vec.values()) ** 0.5
+    return [vec[d] / norm for d in DIMENSIONS]
+
+
+# (prototype, texture, position, suggestion) for every suggestion, in
+# SUBSTITUTIONS order, so equal scores keep the hand-picked order
+_SUBSTITUTION_ITEMS = [
+    (proto, texture, pos, sub)
+    for (dominant, texture), subs in SUBSTITUTIONS.items()
+    for proto in [_prototype(dominant, texture)]
+    for pos, sub in enumerate(subs)
+]
+
+
+def rank_substitutions(profile, texture, n=3):
+    """The `n` swaps whose prototypes are closest to the full flavour profile."""
+    vec = tuple(profile[d] for d in DIMENSIONS)
+    return list(_rank_substitutions(vec, profile.get("dominant"), texture, n))
+
+
+# Scores are small integers, so a run repeats the same few hundred profiles:
+# rank each distinct (scores, texture) once
+@functools.lru_cache(maxsize=4096)
+def _rank_substitutions(vec, dominant, texture, n):
+    norm = sum(v * v for v in vec) ** 0.5
+    if not norm:
+        return tuple(get_substitutions(dominant, texture)[:n])
+    scored = []
+    for proto, tex, pos, sub in _SUBSTITUTION_ITEMS:
+        score = sum(p * v for p, v in zip(proto, vec)) / norm - pos * SUBSTITUTION_POSITION_STEP
+        if tex == texture:
+            score += SUBSTITUTION_TEXTURE_BONUS
+        scored.append((score, sub))
+    ranked = sorted(scored, key=lambda item: -item[0])   # stable
+    return tuple(sub for _, sub in ranked[:n])
+
+
+# Every dominant × texture answer (None: skipped or unknown) resolved up front,
+# fallbacks included: the ranking above for a single-flavour profile.
+SUBSTITUTION_TABLE = {
+    (dominant, texture): rank_substitutions({**{d: 0 for d in DIMENSIONS}, dominant: DIM_CAP}, texture)
+    for dominant in DIMENSIONS
+    for texture in list(FLAVOUR_MAP["q4_texture"]) + [None]
+}
 
 
-def score_flavour_profile(row):
-    """Score a single respondent across 6 flavour dimensions."""
-    dims = {d.lower(): 0 for d in DIMS}
-    for col, mapping in FLAVOUR_MAP.items():
-        val = row.get(col)
-        if val and val in mapping:
-            for dim, pts in mapping[val].items():
-                dims[dim] += pts
-    cuisines = row.get("q18_cuisine") or []
-    dims["adventurous"] += min(len(cuisines), 4)
-    adv_foods = row.get("q19_adv") or []
-    dims["adventurous"] += min(len([f for f in adv_foods if f != "None of these yet!"]), 4)
-    dims = {k: min(v, 10) for k, v in dims.items()}
-    dominant = max(dims, key=dims.get)
-    name, desc = AVATAR_NAMES.get(dominant, ("🌱 Food Friend", "You have a balanced palate!"))
-    neo_score = sum(NEOPHOBIA_WEIGHTS[q].get(row.get(q, ""), 0) for q in NEOPHOBIA_WEIGHTS)
-    return {**dims, "dominant": dominant, "avatar_name": name, "avatar_desc": desc,
-            "neo_score": neo_score}
+def get_substitutions(dominant, texture):
+    """Get 3 personalised substitution suggestions."""
+    subs = SUBSTITUTION_TABLE.get((dominant, texture))
+    if subs is None:
+        subs = SUBSTITUTION_TABLE.get((dominant, None), GENERIC_SUBSTITUTIONS)
+    return subs
 
 
 # ── CHART GENERATION ───────────────────────────────────────────────────────────
+# make_bar_chart() draws a CHART_FIGSIZE figure at CHART_DPI; the tight bounding
+# box then crops it to CHART_PNG_PX. Page 1 shows the chart CHART_HEIGHT_PT
+# tall, so one matplotlib point ends up as CHART_PT_SCALE (≈ 0.88) points on
+# the page. draw_bar_chart() scales matplotlib's font sizes and line widths by
+# that factor so both renderers look the same.
+
+CHART_FIGSIZE   = (6.2, 2.8)    # inches
+CHART_DPI       = 130
+CHART_PNG_PX    = (798, 359)    # width, height of the PNG after the tight crop (measured)
+CHART_ASPECT    = CHART_PNG_PX[0] / CHART_PNG_PX[1]
+CHART_HEIGHT_PT = 175           # chart height on page 1
+CHART_PT_SCALE  = CHART_HEIGHT_PT / (CHART_PNG_PX[1] / CHART_DPI * 72)
+# The axes box inside the PNG, as fractions of its width / height (measured)
+CHART_PLOT_BOX  = {"left": 0.172, "right": 0.971, "bottom": 0.175, "top": 0.866}
+
 
 def make_bar_chart(profile, dominant):
     """Render a horizontal bar chart; return PNG bytes."""
@@ -224,7 +236,7 @@ def make_bar_chart(profile, dominant):
     values = [profile[d.lower()] for d in DIMS]
     colors = [DIM_COLOR[d] for d in DIMS]
 
-    fig, ax = plt.subplots(figsize=(6.2, 2.8))
+    fig, ax = plt.subplots(figsize=CHART_FIGSIZE)
     fig.patch.set_facecolor("#FFF8F0")
     ax.set_facecolor("#FFF8F0")
 
@@ -253,13 +265,187 @@ def make_bar_chart(profile, dominant):
 
     plt.tight_layout(pad=0.8)
     buf = io.BytesIO()
-    plt.savefig(buf, format="png", dpi=130, bbox_inches="tight",
+    plt.savefig(buf, format="png", dpi=CHART_DPI, bbox_inches="tight",
                 facecolor="#FFF8F0")
     plt.close(fig)
     buf.seek(0)
     return buf.read()
 
 
+def draw_bar_chart(c, profile, x, y, width, height):
+    """Draw the Flavour DNA bar chart straight onto the canvas as vectors.
+
+    Same layout as make_bar_chart() but no matplotlib and no PNG: a few dozen
+    path operators instead of an embedded image. (x, y) is the bottom-left
+    corner; sizes scale with `height` (CHART_HEIGHT_PT on page 1).
+    """
+    from reportlab.lib.colors import Color
+
+    k = height / CHART_HEIGHT_PT            # 1.0 on page 1; offsets below are page-1 points
+    mpl = k * CHART_PT_SCALE                # matplotlib points → page points
+    midnight = hex_to_rl(C["midnight"])
+    c.saveState()
+    c.setFillColor(hex_to_rl(C["cloud"]))
+    c.rect(x, y, width, height, fill=1, stroke=0)
+
+    left   = x + width * CHART_PLOT_BOX["left"]
+    right  = x + width * CHART_PLOT_BOX["right"]
+    bottom = y + height * CHART_PLOT_BOX["bottom"]
+    top    = y + height * CHART_PLOT_BOX["top"]
+    x_max  = 12
+    sx = (right - left) / x_max
+
+    c.setFillColor(midnight)
+    c.setFont("Helvetica-Bold", 12 * mpl)
+    c.drawCentredString((left + right) / 2, y + height - 16 * k, "Your Flavour DNA Profile")
+
+    # Dashed vertical grid, behind the bars
+    c.setStrokeColor(Color(0.933, 0.933, 0.933))
+    c.setLineWidth(0.8 * mpl)
+    c.setDash(3.7 * 0.8 * mpl, 1.6 * 0.8 * mpl)   # matplotlib's "--", scaled by its line width
+    for tick in range(0, x_max + 1, 2):
+        c.line(left + tick * sx, bottom, left + tick * sx, top)
+    c.setDash()
+
+    # Axes: left and bottom spines only
+    c.setStrokeColor(Color(0.867, 0.867, 0.867))
+    c.setLineWidth(0.8 * mpl)
+    c.line(left, bottom, left, top)
+    c.line(left, bottom, right, bottom)
+
+    c.setStrokeColor(Color(0.533, 0.533, 0.533))
+    c.setFillColor(Color(0.533, 0.533, 0.533))
+    c.setFont("Helvetica", 8 * mpl)
+    for tick in range(0, x_max + 1, 2):
+        c.line(left + tick * sx, bottom, left + tick * sx, bottom - 3.5 * mpl)   # major tick length
+        c.drawCentredString(left + tick * sx, bottom - 10 * k, str(tick))
+    c.setFillColor(Color(0.333, 0.333, 0.333))
+    c.setFont("Helvetica", 9 * mpl)
+    c.drawCentredString((left + right) / 2, y + 5 * k, "Score (out of 10)")
+
+    # Bars, Sweet at the top
+    slot = (top - bottom) / len(DIMS)
+    bar_h = slot * 0.62
+    c.setStrokeColor(hex_to_rl(C["white"]))
+    c.setLineWidth(1.5 * mpl)
+    for i, dim in enumerate(DIMS):
+        value = int(profile[dim.lower()])
+        mid = top - slot * (i + 0.5)
+        if value:
+            c.setFillColor(hex_to_rl(DIM_COLOR[dim]))
+            c.rect(left, mid - bar_h / 2, value * sx, bar_h, fill=1, stroke=1)
+        c.setStrokeColor(midnight)
+        c.line(left - 3.5 * mpl, mid, left, mid)
+        c.setStrokeColor(hex_to_rl(C["white"]))
+        c.setFillColor(midnight)
+        c.setFont("Helvetica", 10 * mpl)
+        c.drawRightString(left - 4 * k, mid - 3 * k, dim)
+        c.setFont("Helvetica-Bold", 10 * mpl)
+        c.drawString(left + (value + 0.15) * sx, mid - 3 * k, f"{value}/10")
+    c.restoreState()
+
+
+class ChartCache:
+    """Memoises make_bar_chart() PNGs by the 6-dimension score tuple.
+
+    The chart depends only on the six 0–10 values, so a cohort shares a small
+    number of distinct charts. Entries live in an in-memory LRU and, when a
+    directory is given, are also kept on disk between runs.
+    """
+
+    def __init__(self, maxsize=512, disk_dir=None):
+        self.maxsize   = maxsize
+        self.disk_dir  = disk_dir
+        self.mem       = OrderedDict()
+        self.hits      = 0
+        self.disk_hits = 0
+        self.misses    = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    @staticmethod
+    def key(profile):
+        return tuple(int(profile[d.lower()]) for d in DIMS)
+
+    def _disk_path(self, key):
+        # REPORT_VERSION in the name invalidates charts when the layout changes
+        return os.path.join(self.disk_dir, f"v{REPORT_VERSION}_" + "-".join(map(str, key)) + ".png")
+
+    def get(self, profile):
+        """PNG bytes for this profile's chart, rendering it only on a miss."""
+        key = self.key(profile)
+        png = self.mem.get(key)
+        if png is not None:
+            self.mem.move_to_end(key)
+            self.hits += 1
+            return png
+
+        path = self._disk_path(key) if self.disk_dir else None
+        if path and os.path.exists(path):
+            with open(path, "rb") as f:
+                png = f.read()
+            self.disk_hits += 1
+        else:
+            png = make_bar_chart(profile, profile["dominant"])
+            self.misses += 1
+            if path:
+                tmp = f"{path}.{os.getpid()}.tmp"   # other workers may race us
+                with open(tmp, "wb") as f:
+                    f.write(png)
+                os.replace(tmp, path)
+
+        self.mem[key] = png
+        if len(self.mem) > self.maxsize:
+            self.mem.popitem(last=False)
+        return png
+
+    def stats(self):
+        return {"hits": self.hits, "disk_hits": self.disk_hits, "misses": self.misses}
+
+
+CHART_CACHE = ChartCache()
+CHART_RENDERERS = ("matplotlib", "vector")
+CHART_RENDERER = "matplotlib"
+
+
+def configure_chart_cache(disk_dir=None, maxsize=512, renderer="matplotlib"):
+    """(Re)create the process-wide chart cache and pick the chart renderer.
+
+    Also used as the process-pool initializer. "vector" draws charts with
+    draw_bar_chart() and never touches matplotlib or the cache.
+    """
+    global CHART_CACHE, CHART_RENDERER
+    CHART_CACHE = ChartCache(maxsize=maxsize, disk_dir=disk_dir)
+    CHART_RENDERER = renderer
+    load_renderer(renderer)
+
+
+def load_renderer(renderer="matplotlib"):
+    """Import reportlab (and matplotlib, for PNG charts) once, up front.
+
+    The drawing functions import what they use where they use it, so --help
+    and the data-only paths never load these libraries; a run calls this
+    before its first report instead of charging the import to that report.
+    """
+    with profiling.span("imports"):
+        try:
+            import reportlab.pdfgen.canvas   # noqa: F401
+            import reportlab.lib.utils       # noqa: F401
+            if renderer == "matplotlib":
+                import matplotlib
+                matplotlib.use("Agg")
+                import matplotlib.pyplot     # noqa: F401
+        except ImportError:
+            print("Run: pip install reportlab" + (" matplotlib" if renderer == "matplotlib" else ""))
+            sys.exit(1)
+
+
+def _init_render_process(disk_dir, maxsize, renderer, profile_spool=None):
+    """Process-pool initializer: chart cache, plus span spooling under --profile."""
+    profiling.enable_worker(profile_spool)
+    configure_chart_cache(disk_dir, maxsize, renderer)
+
+
 # ── PDF RENDERING ──────────────────────────────────────────────────────────────
 
 def hex_to_rl(color_tuple):
@@ -268,8 +454,135 @@ def hex_to_rl(color_tuple):
     return Color(*color_tuple)
 
 
+# ── STATIC PAGE LAYERS ──────────────────────────────────────────────────────────
+# Everything that looks the same on every report is drawn once per PDF
+# document as a form XObject and stamped onto each page with doForm(). A
+# single-report PDF still defines each layer once; a document holding many
+# reports (one canvas, many pages) shares one copy of each layer.
+
+# Geometry shared by the static layers and draw_page1() / draw_page2(), in
+# points. The layer is drawn once and cached, so a number kept in only one
+# of the two places would quietly shift the per-report content off it.
+PAGE_MARGIN    = 36
+PAGE1_BANNER_H = 110
+PAGE2_BANNER_H = 62
+CARD_GAP       = 14     # banner → avatar card
+CARD_H         = 110
+HEADING_GAP    = 20     # avatar card → chart heading
+CHART_GAP      = 16     # chart heading → chart
+METER_GAP      = 14     # chart → meter heading
+METER_DROP     = 22     # meter heading → meter bar
+METER_H        = 14
+METER_LABEL_W  = 120    # room right of the meter bar for its score label
+
+
+def _page1_layout(page_w, page_h):
+    """Page 1 positions used by both its static layer and draw_page1()."""
+    card_top = page_h - PAGE1_BANNER_H - CARD_GAP
+    chart_y = card_top - CARD_H - HEADING_GAP             # the chart heading sits at chart_y - 4
+    meter_y = chart_y - CHART_GAP - CHART_HEIGHT_PT - METER_GAP
+    return {"card_top": card_top, "chart_y": chart_y, "meter_y": meter_y,
+            "meter_bar_y": meter_y - METER_DROP,
+            "meter_bar_w": page_w - 2 * PAGE_MARGIN - METER_LABEL_W}
+
+
+def _static_layer(c, name, draw, page_w, page_h):
+    """Stamp a static layer, defining it on this canvas the first time."""
+    name = f"static_{name}_v{REPORT_VERSION}"
+    if not c.hasForm(name):
+        c.beginForm(name)
+        draw(c, page_w, page_h)
+        c.endForm()
+    c.doForm(name)
+
+
+# Form XObjects can't carry transparency (reportlab leaves the alpha states
+# out of a form's resources), so translucent layers are pre-blended with the
+# opaque colour underneath them.
+
+def _shade(color_tuple, alpha):
+    """Colour seen through a black overlay of the given opacity."""
+    return tuple(v * (1 - alpha) for v in color_tuple)
+
+
+def _draw_banner(c, page_w, page_h, banner_h):
+    """Rainbow header: 6 vertical colour strips, darkened for text legibility."""
+    strip_w = page_w / 6
+    strip_colors = [C["tangerine"], C["sunshine"], C["leaf"], C["ocean"], C["berry"], C["blossom"]]
+    for i, sc in enumerate(strip_colors):
+        # 28% black overlay
+        c.setFillColor(hex_to_rl(_shade(sc, 0.28)))
+        c.rect(i * strip_w, page_h - banner_h, strip_w + 1, banner_h, fill=1, stroke=0)
+
+
+def _draw_page1_static(c, page_w, page_h):
+    layout = _page1_layout(page_w, page_h)
+    margin = PAGE_MARGIN
+
+    # ── HEADER BANNER ──────────────────────────────────────────────────────────
+    _draw_banner(c, page_w, page_h, PAGE1_BANNER_H)
+
+    c.setFillColor(hex_to_rl(C["white"]))
+    c.setFont("Helvetica-Bold", 20)
+    c.drawCentredString(page_w / 2, page_h - 42, "We Are What We Eat")
+    c.setFont("Helvetica", 11)
+    c.drawCentredString(page_w / 2, page_h - 62, "Isaac's Food Science Project  ·  Singapore 2026")
+    c.setFont("Helvetica-Oblique", 9)
+    c.drawCentredString(page_w / 2, page_h - 80, "Your Personalised Food Avatar Report")
+
+    # ── AVATAR CARD ────────────────────────────────────────────────────────────
+    card_top = layout["card_top"]
+    card_h = CARD_H
+    card_w = page_w - 2 * margin
+
+    # Card shadow (8% black on the white page)
+    c.setFillColor(hex_to_rl(_shade(C["white"], 0.08)))
+    c.roundRect(margin + 3, card_top - card_h - 3, card_w, card_h, 12, fill=1, stroke=0)
+    # Card background
+    c.setFillColor(hex_to_rl(C["white"]))
+    c.roundRect(margin, card_top - card_h, card_w, card_h, 12, fill=1, stroke=0)
+
+    # ── BAR CHART heading ──────────────────────────────────────────────────────
+    c.setFillColor(hex_to_rl(C["midnight"]))
+    c.setFont("Helvetica-Bold", 11)
+    c.drawString(margin, layout["chart_y"] - 4, "Flavour DNA Chart")
+
+    # ── NEOPHOBIA METER track ──────────────────────────────────────────────────
+    c.setFillColor(hex_to_rl(C["midnight"]))
+    c.setFont("Helvetica-Bold", 10)
+    c.drawString(margin, layout["meter_y"], "Food Adventurousness Score")
+
+    bar_total_w = layout["meter_bar_w"]
+    bar_y = layout["meter_bar_y"]
+    c.setFillColor(hex_to_rl(C["lightgrey"]))
+    c.roundRect(margin, bar_y, bar_total_w, METER_H, 6, fill=1, stroke=0)
+
+    # Scale labels
+    c.setFont("Helvetica", 7)
+    c.setFillColor(hex_to_rl(C["midgrey"]))
+    c.drawString(margin, bar_y - 10, "Cautious")
+    c.drawRightString(margin + bar_total_w, bar_y - 10, "Adventurous")
+
+    # ── FOOTER ─────────────────────────────────────────────────────────────────
+    _draw_footer(c, page_w, "Page 1 of 2")
+
+
+def _draw_page2_static(c, page_w, page_h):
+    # ── HEADER (slimmer) ──────────────────────────────────────────────────────
+    _draw_banner(c, page_w, page_h, PAGE2_BANNER_H)
+
+    c.setFillColor(hex_to_rl(C["white"]))
+    c.setFont("Helvetica-Bold", 16)
+    c.drawCentredString(page_w / 2, page_h - 30, "Your Personalised Food Insights")
+    c.setFont("Helvetica", 9)
+    c.drawCentredString(page_w / 2, page_h - 48, "We Are What We Eat  ·  Isaac's Food Science Project  ·  Singapore 2026")
+
+    # ── FOOTER ─────────────────────────────────────────────────────────────────
+    _draw_footer(c, page_w, "Page 2 of 2")
+
+
 def draw_page1(c, row, profile, chart_png_bytes, page_w, page_h):
-    """Draw the Avatar & Flavour DNA page."""
+    """Draw the Avatar & Flavour DNA page (chart_png_bytes=None: vector chart)."""
     from reportlab.lib.colors import Color
     from reportlab.lib.utils import ImageReader
 
@@ -288,41 +601,16 @@ def draw_page1(c, row, profile, chart_png_bytes, page_w, page_h):
     }
     avatar_label = emoji_map.get(dominant, "Food Friend")
 
-    # ── HEADER BANNER ──────────────────────────────────────────────────────────
-    banner_h = 110
-    # Rainbow gradient: draw 6 vertical strips
-    strip_w = page_w / 6
-    strip_colors = [C["tangerine"], C["sunshine"], C["leaf"], C["ocean"], C["berry"], C["blossom"]]
-    for i, sc in enumerate(strip_colors):
-        c.setFillColor(hex_to_rl(sc))
-        c.rect(i * strip_w, page_h - banner_h, strip_w + 1, banner_h, fill=1, stroke=0)
-
-    # Semi-transparent overlay for text legibility
-    c.setFillColor(Color(0, 0, 0, alpha=0.28))
-    c.rect(0, page_h - banner_h, page_w, banner_h, fill=1, stroke=0)
-
-    c.setFillColor(hex_to_rl(C["white"]))
-    c.setFont("Helvetica-Bold", 20)
-    c.drawCentredString(page_w / 2, page_h - 42, "We Are What We Eat")
-    c.setFont("Helvetica", 11)
-    c.drawCentredString(page_w / 2, page_h - 62, "Isaac's Food Science Project  ·  Singapore 2026")
-    c.setFont("Helvetica-Oblique", 9)
-    c.drawCentredString(page_w / 2, page_h - 80, "Your Personalised Food Avatar Report")
+    # Banner, card, headings, meter track and footer: the same on every report
+    _static_layer(c, "page1", _draw_page1_static, page_w, page_h)
 
-    y = page_h - banner_h
+    layout = _page1_layout(page_w, page_h)
+    margin = PAGE_MARGIN
 
     # ── AVATAR CARD ────────────────────────────────────────────────────────────
-    card_top = y - 14
-    card_h = 110
-    margin = 36
-    card_w = page_w - 2 * margin
+    card_top = layout["card_top"]
+    card_h = CARD_H
 
-    # Card shadow
-    c.setFillColor(Color(0, 0, 0, alpha=0.08))
-    c.roundRect(margin + 3, card_top - card_h - 3, card_w, card_h, 12, fill=1, stroke=0)
-    # Card background
-    c.setFillColor(hex_to_rl(C["white"]))
-    c.roundRect(margin, card_top - card_h, card_w, card_h, 12, fill=1, stroke=0)
     # Left color accent
     c.setFillColor(avatar_color)
     c.roundRect(margin, card_top - card_h, 8, card_h, 4, fill=1, stroke=0)
@@ -369,44 +657,38 @@ def draw_page1(c, row, profile, chart_png_bytes, page_w, page_h):
         c.setFont("Helvetica", 8)
         c.drawString(text_x + 8, card_top - 87, badge_text)
 
-    y = card_top - card_h - 20
+    y = layout["chart_y"]
 
     # ── BAR CHART ─────────────────────────────────────────────────────────────
     chart_label_y = y - 4
-    c.setFillColor(hex_to_rl(C["midnight"]))
-    c.setFont("Helvetica-Bold", 11)
-    c.drawString(margin, chart_label_y, "Flavour DNA Chart")
 
     # Thin accent line under label
     c.setStrokeColor(avatar_color)
     c.setLineWidth(2)
     c.line(margin, chart_label_y - 4, margin + 120, chart_label_y - 4)
 
-    chart_img = ImageReader(io.BytesIO(chart_png_bytes))
-    chart_h_pt = 175
+    chart_h_pt = CHART_HEIGHT_PT
     chart_w_pt = page_w - 2 * margin
-    c.drawImage(chart_img, margin, y - 16 - chart_h_pt, width=chart_w_pt, height=chart_h_pt,
-                preserveAspectRatio=True, mask="auto")
-
-    y = y - 16 - chart_h_pt - 14
+    if chart_png_bytes is None:
+        # Vector renderer: same footprint the centred PNG occupies
+        vec_w = min(chart_w_pt, chart_h_pt * CHART_ASPECT)
+        draw_bar_chart(c, profile, margin + (chart_w_pt - vec_w) / 2, y - CHART_GAP - chart_h_pt,
+                       vec_w, chart_h_pt)
+    else:
+        chart_img = ImageReader(io.BytesIO(chart_png_bytes))
+        c.drawImage(chart_img, margin, y - CHART_GAP - chart_h_pt, width=chart_w_pt, height=chart_h_pt,
+                    preserveAspectRatio=True, mask="auto")
 
     # ── NEOPHOBIA METER ────────────────────────────────────────────────────────
     neo = profile["neo_score"]
     neo_label = "Neophobic" if neo <= 2 else ("Moderate" if neo <= 5 else "Adventurous!")
     neo_color = C["blossom"] if neo <= 2 else (C["sunshine"] if neo <= 5 else C["leaf"])
 
-    c.setFillColor(hex_to_rl(C["midnight"]))
-    c.setFont("Helvetica-Bold", 10)
-    c.drawString(margin, y, "Food Adventurousness Score")
-
-    bar_total_w = page_w - 2 * margin - 120
-    bar_h2 = 14
+    bar_total_w = layout["meter_bar_w"]
+    bar_h2 = METER_H
     bar_x = margin
-    bar_y = y - 22
+    bar_y = layout["meter_bar_y"]
 
-    # Background bar
-    c.setFillColor(hex_to_rl(C["lightgrey"]))
-    c.roundRect(bar_x, bar_y, bar_total_w, bar_h2, 6, fill=1, stroke=0)
     # Filled portion
     fill_w = max(18, int(neo / 8 * bar_total_w))
     c.setFillColor(hex_to_rl(neo_color))
@@ -416,17 +698,6 @@ def draw_page1(c, row, profile, chart_png_bytes, page_w, page_h):
     c.setFont("Helvetica-Bold", 9)
     c.drawString(bar_x + bar_total_w + 10, bar_y + 3, f"{neo}/8  {neo_label}")
 
-    # Scale labels
-    c.setFont("Helvetica", 7)
-    c.setFillColor(hex_to_rl(C["midgrey"]))
-    c.drawString(bar_x, bar_y - 10, "Cautious")
-    c.drawRightString(bar_x + bar_total_w, bar_y - 10, "Adventurous")
-
-    y = bar_y - 24
-
-    # ── FOOTER ─────────────────────────────────────────────────────────────────
-    _draw_footer(c, page_w, "Page 1 of 2")
-
 
 def draw_page2(c, row, profile, page_w, page_h):
     """Draw the Personalised Insights & Substitutions page."""
@@ -436,26 +707,13 @@ def draw_page2(c, row, profile, page_w, page_h):
     dominant = profile["dominant"]
     avatar_color = hex_to_rl(AVATAR_COLOR.get(dominant, C["leaf"]))
     texture = row.get("q4_texture", "")
-    subs = get_substitutions(dominant, texture)
+    subs = rank_substitutions(profile, texture)
 
-    # ── HEADER (slimmer) ──────────────────────────────────────────────────────
-    banner_h = 62
-    strip_w = page_w / 6
-    strip_colors = [C["tangerine"], C["sunshine"], C["leaf"], C["ocean"], C["berry"], C["blossom"]]
-    for i, sc in enumerate(strip_colors):
-        c.setFillColor(hex_to_rl(sc))
-        c.rect(i * strip_w, page_h - banner_h, strip_w + 1, banner_h, fill=1, stroke=0)
-    c.setFillColor(Color(0, 0, 0, alpha=0.28))
-    c.rect(0, page_h - banner_h, page_w, banner_h, fill=1, stroke=0)
-
-    c.setFillColor(hex_to_rl(C["white"]))
-    c.setFont("Helvetica-Bold", 16)
-    c.drawCentredString(page_w / 2, page_h - 30, "Your Personalised Food Insights")
-    c.setFont("Helvetica", 9)
-    c.drawCentredString(page_w / 2, page_h - 48, "We Are What We Eat  ·  Isaac's Food Science Project  ·  Singapore 2026")
+    # Banner and footer: the same on every report
+    _static_layer(c, "page2", _draw_page2_static, page_w, page_h)
 
-    y = page_h - banner_h - 22
-    margin = 36
+    y = page_h - PAGE2_BANNER_H - 22
+    margin = PAGE_MARGIN
     col_w = page_w - 2 * margin
 
     # ── SECTION: HEALTHY SWAPS ────────────────────────────────────────────────
@@ -562,9 +820,6 @@ def draw_page2(c, row, profile, page_w, page_h):
     fact = fun_facts.get(dominant, "Every person's taste is unique — no two Flavour DNA profiles are exactly the same!")
     y = _wrapped_text(c, fact, margin, y, col_w, 9.5, C["midnight"], italic=True)
 
-    # ── FOOTER ─────────────────────────────────────────────────────────────────
-    _draw_footer(c, page_w, "Page 2 of 2")
-
 
 def _section_header(c, title, y, margin, col_w, accent_color):
     """Draw a section heading with accent underline. Returns new y."""
@@ -717,8 +972,13 @@ Your data is stored securely and used only for Isaac's research project.
     return subject, plain.strip(), html.strip()
 
 
-def send_email(to_address, pdf_path, row, profile):
-    """Send the PDF report by email. Returns True on success."""
+def build_message(to_address, pdf_path, row, profile):
+    """Build the MIME email (plain + HTML body, PDF attached) for one report."""
+    from email import encoders
+    from email.mime.base import MIMEBase
+    from email.mime.multipart import MIMEMultipart
+    from email.mime.text import MIMEText
+
     subject, plain_body, html_body = build_email_body(row, profile)
 
     msg = MIMEMultipart("alternative")
@@ -737,7 +997,18 @@ def send_email(to_address, pdf_path, row, profile):
     pdf_filename = os.path.basename(pdf_path)
     part.add_header("Content-Disposition", f'attachment; filename="{pdf_filename}"')
     msg.attach(part)
+    return msg
+
+
+def send_email(to_address, pdf_path, row, profile):
+    """Send one PDF report over its own connection. Returns True on success.
+
+    Batch runs go through mailer.MailDispatcher instead, which reuses
+    connections, retries and logs outcomes.
+    """
+    import smtplib
 
+    msg = build_message(to_address, pdf_path, row, profile)
     with smtplib.SMTP(SMTP_HOST, SMTP_PORT) as server:
         server.ehlo()
         server.starttls()
@@ -747,103 +1018,597 @@ def send_email(to_address, pdf_path, row, profile):
     return True
 
 
+def open_mailer(out_dir, workers=2):
+    """Mail dispatcher whose outcome log lives next to the PDFs."""
+    from mailer import MailDispatcher
+    return MailDispatcher(SMTP_HOST, SMTP_PORT, EMAIL_ADDRESS, EMAIL_PASSWORD, workers=workers,
+                          log_path=os.path.join(out_dir, EMAIL_LOG_NAME))
+
+
 # ── MAIN ────────────────────────────────────────────────────────────────────────
 
-def generate_pdf(row, out_dir):
-    """Generate a 2-page PDF for a single respondent. Returns output path."""
-    from reportlab.pdfgen import canvas as rl_canvas
+def draw_report(c, row, profile):
+    """Draw one respondent's two pages onto canvas `c`, finishing each page."""
     from reportlab.lib.pagesizes import A4
 
-    profile = score_flavour_profile(row)
-    chart_png = make_bar_chart(profile, profile["dominant"])
+    rid = str(row.get("id"))
+    with profiling.span("chart", id=rid):
+        chart_png = CHART_CACHE.get(profile) if CHART_RENDERER == "matplotlib" else None
+    page_w, page_h = A4   # 595.27 x 841.89 pts
+
+    # Page 1
+    with profiling.span("page1", id=rid):
+        draw_page1(c, row, profile, chart_png, page_w, page_h)
+        c.showPage()
+
+    # Page 2
+    with profiling.span("page2", id=rid):
+        draw_page2(c, row, profile, page_w, page_h)
+        c.showPage()
 
+
+def report_path(row, out_dir):
+    """Where a respondent's PDF goes: <out_dir>/<level>_<id prefix>.pdf"""
     row_id = str(row.get("id", "unknown"))[:8]
     level = row.get("q2_level", "XX")
-    fname = f"{out_dir}/{level}_{row_id}.pdf"
+    return f"{out_dir}/{level}_{row_id}.pdf"
 
-    page_w, page_h = A4   # 595.27 x 841.89 pts
-    c = rl_canvas.Canvas(fname, pagesize=A4)
+
+def render_pdf(row, profile=None):
+    """Render a respondent's 2-page report; returns the PDF as bytes."""
+    from reportlab.pdfgen import canvas as rl_canvas
+    from reportlab.lib.pagesizes import A4
+
+    if profile is None:
+        profile = score_flavour_profile(row)
+
+    buf = io.BytesIO()
+    c = rl_canvas.Canvas(buf, pagesize=A4)
     c.setTitle("We Are What We Eat — Your Food Avatar Report")
     c.setAuthor("Isaac's Project 2026")
+    draw_report(c, row, profile)
+    with profiling.span("save", id=str(row.get("id"))):
+        c.save()
+    return buf.getvalue()
 
-    # Page 1
-    draw_page1(c, row, profile, chart_png, page_w, page_h)
-    c.showPage()
 
-    # Page 2
-    draw_page2(c, row, profile, page_w, page_h)
-    c.save()
+def write_pdf(path, data, rid=None):
+    """Write PDF bytes atomically, so an interrupted run never leaves half a file."""
+    with profiling.span("write", id=rid):
+        with open(path + ".tmp", "wb") as f:
+            f.write(data)
+        os.replace(path + ".tmp", path)
 
+
+def generate_pdf(row, out_dir, profile=None):
+    """Generate a 2-page PDF for a single respondent. Returns output path."""
+    fname = report_path(row, out_dir)
+    write_pdf(fname, render_pdf(row, profile), str(row.get("id")))
     return fname
 
 
+# ── COMBINED OUTPUT ─────────────────────────────────────────────────────────────
+# --combine level  → one PDF per school level (printed packs per class)
+# --combine N      → a new PDF every N respondents
+# Every report in a bundle is drawn on the bundle's single canvas, so fonts,
+# the static page layers and identical chart images are stored once per file
+# instead of once per respondent. page_index.json maps each respondent id to
+# its file and page range.
+
+PAGE_INDEX_NAME = "page_index.json"
+
+
+class ReportBundles:
+    """Streams reports into multi-page PDFs, one open canvas per bundle."""
+
+    def __init__(self, out_dir, per):
+        self.out_dir = out_dir
+        self.per     = per          # "level" or reports per file
+        self.open    = {}           # bundle key → (canvas, path)
+        self.filled  = {}           # bundle key → reports drawn
+        self.files   = []
+        self.index   = {}
+        self.n       = 0
+
+    def _bundle(self, row):
+        if self.per == "level":
+            key = row.get("q2_level") or "unknown"
+            name = f"{key}_reports.pdf"
+        else:
+            key = self.n // self.per + 1
+            name = f"reports_{key:03d}.pdf"
+        if key not in self.open:
+            from reportlab.pdfgen import canvas as rl_canvas
+            from reportlab.lib.pagesizes import A4
+            path = os.path.join(self.out_dir, name)
+            c = rl_canvas.Canvas(path, pagesize=A4)
+            c.setTitle("We Are What We Eat — Food Avatar Reports")
+            c.setAuthor("Isaac's Project 2026")
+            self.open[key] = (c, path)
+            self.filled[key] = 0
+            self.files.append(path)
+        return key
+
+    def render(self, job):
+        """Add one report; same contract as _render_job(), minus the process pool."""
+        row, _, profile = job
+        before = CHART_CACHE.stats()
+        key = self._bundle(row)
+        c, path = self.open[key]
+        first = c.getPageNumber()
+        entry = {"file": os.path.basename(path)}
+        # A canvas can't take back half a page, and an exception part-way
+        # through can leave its graphics state unbalanced, so the report is
+        # tried on a scratch canvas first. Drawing is deterministic: one that
+        # draws cleanly there draws cleanly on the bundle.
+        err = _draw_error(row, profile)
+        delta = {k: v - before[k] for k, v in CHART_CACHE.stats().items()}
+        if err is None:
+            draw_report(c, row, profile)
+        else:
+            _draw_failed_page(c, row, err)   # a placeholder, so a printed pack shows the gap
+            entry["error"] = err
+        entry["pages"] = [first, c.getPageNumber() - 1]
+        self.index[str(row.get("id"))] = entry
+
+        self.n += 1
+        self.filled[key] += 1
+        if self.per != "level" and self.filled[key] >= self.per:
+            self._save(key)
+        return (None if err else path), err, delta
+
+    def _save(self, key):
+        c, _ = self.open.pop(key)
+        with profiling.span("save"):
+            c.save()
+
+    def close(self):
+        """Save every open bundle and write the page index; returns the PDF paths."""
+        for key in list(self.open):
+            self._save(key)
+        path = os.path.join(self.out_dir, PAGE_INDEX_NAME)
+        with open(path + ".tmp", "w") as f:
+            json.dump(self.index, f, indent=1)
+        os.replace(path + ".tmp", path)
+        return self.files
+
+
+def _draw_error(row, profile):
+    """Draw a report on a throwaway canvas; returns the error message, or None."""
+    from reportlab.pdfgen import canvas as rl_canvas
+    from reportlab.lib.pagesizes import A4
+
+    try:
+        draw_report(rl_canvas.Canvas(io.BytesIO(), pagesize=A4), row, profile)
+    except Exception as e:
+        return str(e) or e.__class__.__name__
+    return None
+
+
+def _draw_failed_page(c, row, err):
+    from reportlab.lib.pagesizes import A4
+
+    page_w, page_h = A4
+    c.setFillColor(hex_to_rl(C["midnight"]))
+    c.setFont("Helvetica-Bold", 14)
+    c.drawCentredString(page_w / 2, page_h / 2 + 10, "This report could not be generated")
+    c.setFont("Helvetica", 9)
+    c.setFillColor(hex_to_rl(C["midgrey"]))
+    c.drawCentredString(page_w / 2, page_h / 2 - 10,
+                        f"Respondent {str(row.get('id', '?'))[:8]}  ·  {row.get('q2_level', '?')}  ·  {err[:80]}")
+    c.showPage()
+
+
+# ── INCREMENTAL MANIFEST ────────────────────────────────────────────────────────
+# <output>/manifest.json remembers, per response id, a hash of the row it was
+# rendered from and the PDF path, the (submitted_at, id) high-water mark of
+# the last run and the ids that failed to render, which are retried on the
+# next run. Bump REPORT_VERSION whenever the layout or the scoring changes
+# so every report is re-rendered once.
+
+MANIFEST_NAME  = "manifest.json"
+REPORT_VERSION = 3   # 3: repeated / blank multi-select answers no longer add to scores
+
+
+def row_hash(row):
+    """Content hash of a response row (and the report layout version)."""
+    blob = json.dumps([REPORT_VERSION, row], sort_keys=True, default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+def load_manifest(out_dir):
+    path = os.path.join(out_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {"high_water": None, "reports": {}, "failed": []}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_manifest(out_dir, manifest):
+    """Write the manifest atomically so an interrupted run can't corrupt it."""
+    path = os.path.join(out_dir, MANIFEST_NAME)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp, path)
+
+
+def is_up_to_date(manifest, row, digest):
+    """True if this exact row was already rendered and its PDF still exists."""
+    entry = manifest["reports"].get(str(row.get("id")))
+    return bool(entry) and entry["hash"] == digest and os.path.exists(entry["path"])
+
+
+def _render_job(job):
+    """Process-pool entry point: render one report and never raise.
+
+    Returns (path, None, cache stats delta) on success or (None, error
+    message, delta) on failure, so one bad row cannot take down the rest of
+    the batch and the parent can total chart-cache hits across workers.
+    """
+    row, out_dir, profile = job
+    before = CHART_CACHE.stats()
+    try:
+        path, err = generate_pdf(row, out_dir, profile), None
+    except Exception as e:
+        path, err = None, str(e) or e.__class__.__name__
+    delta = {k: v - before[k] for k, v in CHART_CACHE.stats().items()}
+    return path, err, delta
+
+
+def _render_bytes_job(job):
+    """_render_job() for the staged pipeline: the PDF comes back as bytes for
+    the write stage instead of being saved here. Returns (PDF bytes or None,
+    error or None, cache stats delta, CPU seconds spent)."""
+    row, _, profile = job
+    t0 = time.thread_time()   # CPU, so processes sharing a core don't inflate it
+    before = CHART_CACHE.stats()
+    try:
+        data, err = render_pdf(row, profile), None
+    except Exception as e:
+        data, err = None, str(e) or e.__class__.__name__
+    delta = {k: v - before[k] for k, v in CHART_CACHE.stats().items()}
+    return data, err, delta, time.thread_time() - t0
+
+
+MISSING_IDS_NAME = "missing_ids.txt"
+
+
+def read_ids_file(path):
+    """Respondent UUIDs listed in a file, one per line or in the first CSV column.
+
+    Blank lines, a header and '#' comments are skipped. Returns (ids in file
+    order without repeats, [(line number, text)] for lines that aren't UUIDs).
+    """
+    import uuid
+
+    ids, bad = {}, []
+    with open(path, encoding="utf-8-sig") as f:
+        for n, line in enumerate(f, 1):
+            value = line.split("#", 1)[0].split(",", 1)[0].strip().strip('"')
+            if not value or (n == 1 and value.lower() == "id"):
+                continue
+            try:
+                ids[str(uuid.UUID(value))] = None   # canonical lower-case form
+            except ValueError:
+                bad.append((n, value))
+    return list(ids), bad
+
+
+def _report_missing(ids, found, out_dir):
+    """Print the requested ids that no row came back for; keep them in missing_ids.txt."""
+    missing = [rid for rid in ids if rid not in found]
+    path = os.path.join(out_dir, MISSING_IDS_NAME)
+    if not missing:
+        if os.path.exists(path):
+            os.remove(path)   # left over from an earlier run
+        return
+    with open(path, "w") as f:
+        f.write("\n".join(missing) + "\n")
+    print(f"   ❓ Not found: {len(missing)} of {len(ids)} id(s) → {path}")
+    for rid in missing[:10]:
+        print(f"      {rid}")
+    if len(missing) > 10:
+        print(f"      … and {len(missing) - 10} more")
+
+
 def main():
     parser = argparse.ArgumentParser(description="Generate personalised Food Avatar PDF reports")
     parser.add_argument("--limit",       type=int,  default=None,  help="Max number of reports to generate")
     parser.add_argument("--id",          type=str,  default=None,  help="Generate report for a single respondent UUID")
+    parser.add_argument("--ids-file",    type=str,  default=None,  help="Generate reports for the UUIDs listed in this file "
+                                                                        "(one per line), fetched in batches")
     parser.add_argument("--output",      type=str,  default="reports", help="Output folder (default: reports/)")
     parser.add_argument("--send-emails", action="store_true",      help="Email the PDF to respondents who left an email address")
+    parser.add_argument("--workers",     type=int,  default=1,     help="Render PDFs on N processes (default: 1, 0 = all cores)")
+    parser.add_argument("--incremental", action="store_true",      help="Only render responses that are new or changed since the last run")
+    parser.add_argument("--chart-cache", type=str,  default=None,  help="Folder to keep rendered charts in between runs")
+    parser.add_argument("--chart-renderer", choices=CHART_RENDERERS, default="matplotlib",
+                        help="matplotlib PNG charts, or vector charts drawn by reportlab (smaller, faster)")
+    parser.add_argument("--mail-workers", type=int, default=2,     help="Parallel SMTP connections for --send-emails (default: 2)")
+    parser.add_argument("--source",      type=str,  default=None,  help="Read from a local replica instead of Supabase (see sources.py)")
+    parser.add_argument("--combine",     type=str,  default=None,  metavar="level|N",
+                        help="Write one PDF per school level, or one per N respondents, plus page_index.json")
+    parser.add_argument("--snapshot",    type=str,  default=None,  help="Read a local snapshot (see snapshot.py); same as --source FILE.arrow")
+    parser.add_argument("--profile",     action="store_true",      help="Time every stage and respondent; print a table and write "
+                                                                        "<output>/profile_trace.json (see profiling.py)")
+    parser.add_argument("--cprofile",    action="store_true",      help="With --profile: also dump cProfile stats of the hottest stage")
     args = parser.parse_args()
 
+    per_bundle = None
+    if args.combine:
+        if args.combine != "level" and not (args.combine.isdigit() and int(args.combine) > 0):
+            parser.error("--combine takes 'level' or a number of respondents per PDF")
+        if args.incremental or args.send_emails:
+            parser.error("--combine writes shared PDFs; it can't be used with --incremental or --send-emails")
+        per_bundle = "level" if args.combine == "level" else int(args.combine)
+    if args.cprofile and not args.profile:
+        parser.error("--cprofile needs --profile")
+    if args.id and args.ids_file:
+        parser.error("use either --id or --ids-file")
+
+    profiler = profiling.enable(spool=True, cprofile=args.cprofile) if args.profile else None
     try:
-        from supabase import create_client
-    except ImportError:
-        print("Run: pip3 install supabase")
-        sys.exit(1)
-
-    os.makedirs(args.output, exist_ok=True)
-    print("🔌 Connecting to Supabase…")
-    client = create_client(SUPABASE_URL, SUPABASE_KEY)
+        generate_reports(args, per_bundle)
+    finally:
+        if profiler:
+            profiler.finish(args.output)
 
-    if args.id:
-        resp = client.table("survey_responses").select("*").eq("id", args.id).execute()
-    else:
-        resp = client.table("survey_responses").select("*").order("submitted_at").execute()
 
-    rows = resp.data
-    if not rows:
-        print("⚠️  No responses found.")
-        return
+def generate_reports(args, per_bundle=None):
+    """Fetch, render (and email) the reports main() was asked for."""
+    os.makedirs(args.output, exist_ok=True)
+    from sources import describe, open_source
+    try:
+        source = open_source(args.source or args.snapshot, SUPABASE_URL, SUPABASE_KEY)
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    print(describe(source))
+    count_rows, fetch_pages = source.count, source.iter_pages
 
+    ids = [args.id] if args.id else None
+    found = set()   # ids that came back, for --ids-file's missing list
+    if args.ids_file:
+        try:
+            ids, bad = read_ids_file(args.ids_file)
+        except OSError as e:
+            print(f"❌ {e}")
+            sys.exit(1)
+        for n, value in bad[:10]:
+            print(f"⚠️  {args.ids_file}:{n} is not a UUID: {value}")
+        print(f"🆔 {len(ids)} respondent id(s) from {args.ids_file}"
+              + (f"  ({len(bad)} line(s) skipped)" if bad else ""))
+        if not ids:
+            return
+
+    # Incremental runs resume after the last high-water mark; an explicit
+    # --id is always fetched, but still skipped if its PDF is current.
+    manifest = load_manifest(args.output) if args.incremental else None
+    after = None
+    retry = []
+    if manifest and not ids:
+        retry = manifest.get("failed", [])
+        if manifest["high_water"]:
+            after = (manifest["high_water"]["submitted_at"], manifest["high_water"]["id"])
+            print(f"🔁 Incremental: responses after {after[0]}"
+                  + (f" + {len(retry)} earlier failure(s)" if retry else ""))
+    failed_ids = set(retry)
+
+    total = count_rows(ids=ids, after=after)
     if args.limit:
-        rows = rows[:args.limit]
+        total = min(total, args.limit)
+    if after and retry:
+        total += count_rows(ids=retry)
+    if not total:
+        print("✅ Nothing new to render." if after else "⚠️  No responses found.")
+        if args.ids_file:
+            _report_missing(ids, found, args.output)
+        return
 
-    total = len(rows)
     print(f"📋 Generating {total} report(s) → {args.output}/\n")
 
-    emailed_ok  = 0
-    emailed_err = 0
-
-    for i, row in enumerate(rows, 1):
-        try:
-            path    = generate_pdf(row, args.output)
-            profile = score_flavour_profile(row)
-            avatar_clean = profile["avatar_name"].encode("ascii", "ignore").decode()
-            level   = row.get("q2_level", "?")
-            email   = (row.get("email") or "").strip()
-
-            email_status = ""
-            if args.send_emails and email:
+    import pandas as pd
+    from pipeline import Pipeline
+    failed      = 0
+    skipped     = 0
+    i = 0
+
+    # The run is a chain of stages joined by bounded queues (see pipeline.py):
+    #   fetch → score → render → write    each on its own thread; rendering
+    #                                     fans out to a process pool
+    #   → this thread                     progress, manifest, queueing emails
+    #   → mailer.py                       SMTP on its own threads
+    # so Supabase, the CPUs, the disk and SMTP all stay busy at once, and a
+    # slow stage holds the ones before it back instead of letting pages and
+    # rendered PDFs pile up in memory. Items stay in order end to end, which
+    # keeps the [i/total] lines and the manifest's high-water mark ordered.
+    workers = args.workers if args.workers > 0 else (os.cpu_count() or 1)
+    configure_chart_cache(args.chart_cache, renderer=args.chart_renderer)
+    chart_stats = {"hits": 0, "disk_hits": 0, "misses": 0}
+    mailer = open_mailer(args.output, args.mail_workers) if args.send_emails else None
+    mail_stats = None
+    mail_busy = 0.0
+    pool = None
+    bundles = ReportBundles(args.output, per_bundle) if per_bundle else None
+    if bundles and workers > 1:
+        print("   (--combine draws on one canvas per PDF, so it renders in this process)")
+    elif workers > 1 and total > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        spool = profiling.PROFILER.spool_dir if profiling.PROFILER else None
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_render_process,
+                                   initargs=(args.chart_cache, 512, args.chart_renderer, spool))
+
+    def fetch(_):
+        pages = fetch_pages(ids=ids, limit=args.limit, after=after, prefetch=False)
+        if after and retry:
+            pages = itertools.chain(fetch_pages(ids=retry, prefetch=False), pages)
+        return profiling.iter_spans("fetch", pages)
+
+    def score(pages):
+        """One item per row (no profile if its PDF is current), then a page-end marker."""
+        for rows in pages:
+            digests = [row_hash(row) for row in rows] if manifest else [None] * len(rows)
+            stale = [not (manifest and is_up_to_date(manifest, row, d)) for row, d in zip(rows, digests)]
+            todo = [row for row, is_stale in zip(rows, stale) if is_stale]
+            with profiling.span("score", n=len(todo)):
+                profiles = iter(score_profiles(pd.DataFrame(todo)).to_dict("records") if todo else [])
+            for row, digest, is_stale in zip(rows, digests, stale):
+                yield {"row": row, "digest": digest, "profile": next(profiles) if is_stale else None}
+            yield {"page": rows}
+
+    # Enough reports in the pool to keep every process busy, few enough
+    # that finished PDFs don't queue up while the write stage catches up
+    window = workers * 2 if pool else 0
+
+    def render(items):
+        """Rendered items, in order; PDF bytes travel on to the write stage."""
+        pending, in_flight = deque(), 0
+        for item in items:
+            if item.get("profile") is not None:
+                job = (item["row"], args.output, item["profile"])
+                if bundles:
+                    t0 = time.perf_counter()
+                    path, err, delta = bundles.render(job)
+                    item.update(path=path, data=None, err=err, delta=delta)
+                    render_stage.work(time.perf_counter() - t0)
+                elif pool:
+                    item["future"] = pool.submit(_render_bytes_job, job)
+                    in_flight += 1
+                else:
+                    item["result"] = _render_bytes_job(job)
+            pending.append(item)
+            # Hand on the head as soon as it is ready, not only when the
+            # window is full, so the write stage isn't kept waiting
+            while pending and ("future" not in pending[0] or pending[0]["future"].done()
+                               or in_flight > window):
+                in_flight -= "future" in pending[0]
+                yield _rendered(pending.popleft())
+        while pending:
+            yield _rendered(pending.popleft())
+
+    def _rendered(item):
+        if "future" in item:
+            item["result"] = item.pop("future").result()
+        if "result" in item:
+            data, err, delta, secs = item.pop("result")
+            render_stage.work(secs)
+            item.update(path=None if err else report_path(item["row"], args.output),
+                        data=data, err=err, delta=delta)
+        return item
+
+    def write(items):
+        for item in items:
+            if item.get("data") is not None:
                 try:
-                    send_email(email, path, row, profile)
-                    email_status = f"  ✉️  sent → {email}"
-                    emailed_ok += 1
-                except Exception as mail_err:
-                    email_status = f"  ⚠️  email FAILED ({mail_err})"
-                    emailed_err += 1
-            elif args.send_emails and not email:
-                email_status = "  (no email)"
-
-            print(f"  [{i:>3}/{total}] {level}  {avatar_clean:<20}  → {os.path.basename(path)}{email_status}")
-
-        except Exception as e:
-            print(f"  [{i:>3}/{total}] ERROR for {row.get('id','?')}: {e}")
-
-    print(f"\n✅ Done! {total} PDF(s) saved to ./{args.output}/")
-    if args.send_emails:
-        print(f"   📧 Emails sent: {emailed_ok}  |  Failed: {emailed_err}")
+                    write_pdf(item["path"], item["data"], str(item["row"].get("id")))
+                except OSError as e:
+                    item.update(path=None, data=None, err=str(e))
+            yield item
+
+    # tracemalloc and cProfile only follow the main thread, so --profile runs
+    # the stages in turn (worker processes still render in parallel)
+    pipe = Pipeline(threaded=not args.profile)
+    pipe.add("fetch", fetch, depth=2, count=len, unit="rows")
+    pipe.add("score", score, count=lambda item: item.get("profile") is not None, unit="rows")
+    render_stage = pipe.add("render", render, depth=workers * 2 if pool else None,
+                            count=lambda item: "delta" in item, unit="PDFs", workers=workers if pool else 1)
+    if not bundles:   # bundles are saved by the render stage
+        pipe.add("write", write, count=lambda item: item.get("data") is not None, unit="PDFs")
+
+    try:
+        for item in pipe.run():
+            if "page" in item:
+                rows = item["page"]
+                if args.ids_file:
+                    found.update(str(row.get("id")) for row in rows)
+                if manifest:
+                    # Failed rows are remembered by id, so the high-water mark can
+                    # keep moving; retried rows are older and never move it back.
+                    last = (rows[-1]["submitted_at"], rows[-1]["id"])
+                    hw = manifest["high_water"]
+                    if not ids and (not hw or last > (hw["submitted_at"], hw["id"])):
+                        manifest["high_water"] = {"submitted_at": last[0], "id": last[1]}
+                    manifest["failed"] = sorted(failed_ids)
+                    with profiling.span("manifest"):
+                        save_manifest(args.output, manifest)
+                continue
+
+            row, profile = item["row"], item["profile"]
+            i += 1
+            if profile is None:
+                print(f"  [{i:>3}/{total}] {row.get('q2_level', '?')}  unchanged, skipped")
+                skipped += 1
+                continue
+            for k, v in item["delta"].items():
+                chart_stats[k] += v
+            path, err = item["path"], item["err"]
+            if err is not None:
+                print(f"  [{i:>3}/{total}] ERROR for {row.get('id','?')}: {err}")
+                failed += 1
+                failed_ids.add(str(row.get("id")))
+                continue
+            if manifest:
+                manifest["reports"][str(row.get("id"))] = {"hash": item["digest"], "path": path}
+                failed_ids.discard(str(row.get("id")))
+            try:
+                avatar_clean = profile["avatar_name"].encode("ascii", "ignore").decode()
+                level   = row.get("q2_level", "?")
+                email   = (row.get("email") or "").strip()
+
+                email_status = ""
+                if mailer and email:
+                    make_message = functools.partial(build_message, email, path, row, profile)
+                    if mailer.submit(str(row.get("id")), email, make_message):
+                        email_status = f"  ✉️  queued → {email}"
+                    else:
+                        email_status = f"  ✉️  already sent → {email}"
+                elif args.send_emails and not email:
+                    email_status = "  (no email)"
+
+                print(f"  [{i:>3}/{total}] {level}  {avatar_clean:<20}  → {os.path.basename(path)}{email_status}")
+
+            except Exception as e:
+                print(f"  [{i:>3}/{total}] ERROR for {row.get('id','?')}: {e}")
+                failed += 1
+    finally:
+        if pool:
+            pool.shutdown(cancel_futures=True)
+        if bundles:
+            bundle_files = bundles.close()
+        if mailer:
+            with profiling.span("mail_wait"):
+                mail_stats = mailer.close()
+                mail_busy = mailer.busy
+
+    if bundles:
+        print(f"\n✅ Done! {i - failed} report(s) in {len(bundle_files)} PDF(s) saved to ./{args.output}/")
+        print(f"   📑 Page index → {os.path.join(args.output, PAGE_INDEX_NAME)}")
     else:
+        print(f"\n✅ Done! {i - failed - skipped} PDF(s) saved to ./{args.output}/")
+    if skipped:
+        print(f"   ⏭️  Unchanged, skipped: {skipped}")
+    if failed:
+        print(f"   ⚠️  Failed: {failed}")
+    if args.ids_file:
+        if args.limit and len(found) >= args.limit:
+            print(f"   ❓ --limit {args.limit} reached; the remaining ids were not looked up")
+        else:
+            _report_missing(ids, found, args.output)
+    charts = sum(chart_stats.values())
+    if charts:
+        cached = chart_stats["hits"] + chart_stats["disk_hits"]
+        print(f"   🖼️  Chart cache: {cached}/{charts} hits ({round(100 * cached / charts)}%)"
+              f"  ·  {chart_stats['disk_hits']} from disk  ·  {chart_stats['misses']} rendered")
+    if mail_stats:
+        print(f"   📧 Emails sent: {mail_stats['sent']}  |  Failed: {mail_stats['failed']}"
+              f"  |  Already sent: {mail_stats['skipped']}")
+    elif not bundles:
         print(f"   Tip: add --send-emails to automatically email each PDF to respondents")
+    if mail_stats:
+        pipe.record("email", mail_stats["sent"] + mail_stats["failed"], mail_busy,
+                    unit="msgs", workers=args.mail_workers)
+    pipe.print_stats()
 
 
 if __name__ == "__main__":
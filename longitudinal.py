@@ -0,0 +1,304 @@
+"""
+we-are-what-we-eat · Longitudinal Cohort (Phase 5)
+==================================================
+Follows the same children from wave to wave (P3 → P6, one survey a year)
+and compares their Flavour DNA over time.
+
+  • waves are linked by a pseudonymous key: a keyed hash (HMAC-SHA256) of
+    the parent's email and the child's gender, with a secret kept next to
+    the cohort file. The key is stable across waves but reveals neither
+    value; rows without an email can't be linked and are left out. Siblings
+    of the same gender share a key: a key answered for two different levels
+    in one wave is left out and reported, since it can't be linked reliably
+  • each wave is stored as scored vectors only — key, wave, level, the six
+    dimension scores, neophobia score and dominant dimension as small
+    integers — in one Arrow file (cohort.arrow), under 40 bytes a child
+  • --add-wave scores the source page by page, so raw rows never pile up
+  • --compare reads just the columns it needs from two waves, memory-mapped,
+    and joins them on the key with numpy: per-child deltas in every
+    dimension and neophobia_score, plus the avatar transition matrix
+
+Usage:
+  pip install pyarrow pandas
+  python longitudinal.py --add-wave 2026                   # responses submitted in 2026
+  python longitudinal.py --add-wave 2027 --source wave2.db
+  python longitudinal.py --compare 2026 2027               # → cohort_2026_2027.csv
+"""
+
+import os
+import sys
+import hmac
+import hashlib
+import argparse
+from datetime import datetime, timezone
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:
+    print("Run: pip install pyarrow")
+    sys.exit(1)
+
+import numpy as np
+
+from scoring import AVATAR_NAMES, DEFAULT_AVATAR, DIMENSIONS
+
+COHORT_FILE = "cohort.arrow"
+SECRET_FILE = ".cohort_secret"   # losing it means new waves can't be linked to old ones
+KEY_BYTES   = 16
+
+SCHEMA = pa.schema(
+    [("key", pa.binary(KEY_BYTES)), ("wave", pa.int16()),
+     ("q2_level", pa.dictionary(pa.int8(), pa.string())), ("submitted_at", pa.timestamp("us", tz="UTC"))]
+    + [(d, pa.int8()) for d in DIMENSIONS]
+    + [("neo_score", pa.int8()), ("dominant", pa.int8())]   # dominant: index into DIMENSIONS
+)
+
+
+# ── LINKING ────────────────────────────────────────────────────────────────────
+
+def load_secret(path=SECRET_FILE):
+    """The linking secret, created (once) on first use."""
+    if not os.path.exists(path):
+        with open(path, "wb") as f:
+            f.write(os.urandom(32))
+        os.chmod(path, 0o600)
+        print(f"🔑 New linking secret → {path}  (keep it: later waves are linked with it)")
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def pseudonym(row, secret):
+    """Stable 16-byte key for the child behind a response, or None if unlinkable."""
+    email = (row.get("email") or "").strip().lower()
+    if not email:
+        return None
+    ident = f"{email}\x1f{row.get('q3_gender') or ''}".encode("utf-8")
+    return hmac.new(secret, ident, hashlib.sha256).digest()[:KEY_BYTES]
+
+
+# ── BUILDING A WAVE ────────────────────────────────────────────────────────────
+
+def _parse_ts(value):
+    if not isinstance(value, datetime):
+        value = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def wave_table(pages, wave, secret, until=None):
+    """Score pages of responses (oldest first) into one wave's rows.
+
+    A child who answered twice in a wave keeps the later answer. A key seen
+    with two different levels belongs to more than one child (same-gender
+    siblings) and is dropped. Returns (table, responses read, responses that
+    could not be linked, keys answered more than once, keys dropped).
+    """
+    import pandas as pd
+    from scoring import score_profiles
+
+    latest = {}   # key → row of column values; later rows overwrite earlier
+    repeated, ambiguous = set(), set()
+    read = unlinked = 0
+    until = _parse_ts(until) if until else None
+    for page in pages:
+        if until:
+            page = [r for r in page if _parse_ts(r["submitted_at"]) < until]
+            if not page:
+                break   # pages are oldest first: nothing later can qualify
+        read += len(page)
+        keys = [pseudonym(r, secret) for r in page]
+        linked = [(k, r) for k, r in zip(keys, page) if k is not None]
+        unlinked += len(page) - len(linked)
+        if not linked:
+            continue
+        scores = score_profiles(pd.DataFrame([r for _, r in linked]))
+        dims = scores[DIMENSIONS].to_numpy()
+        dominant = scores["dominant"].map(DIMENSIONS.index).to_numpy()
+        for i, (key, row) in enumerate(linked):
+            if key in latest:
+                repeated.add(key)
+                if latest[key][0] != row.get("q2_level"):
+                    ambiguous.add(key)
+            latest[key] = (row.get("q2_level"), _parse_ts(row["submitted_at"]),
+                           dims[i], int(scores["neo_score"].iat[i]), int(dominant[i]))
+    for key in ambiguous:
+        del latest[key]
+
+    values = list(latest.values())
+    dims = np.array([v[2] for v in values], dtype=np.int8).reshape(-1, len(DIMENSIONS))
+    cols = {
+        "key": pa.array(list(latest), pa.binary(KEY_BYTES)),
+        "wave": pa.array(np.full(len(values), wave, dtype=np.int16)),
+        "q2_level": pa.array([v[0] for v in values], pa.string()).dictionary_encode(),
+        "submitted_at": pa.array([v[1] for v in values], SCHEMA.field("submitted_at").type),
+        **{d: pa.array(dims[:, j]) for j, d in enumerate(DIMENSIONS)},
+        "neo_score": pa.array(np.array([v[3] for v in values], dtype=np.int8)),
+        "dominant": pa.array(np.array([v[4] for v in values], dtype=np.int8)),
+    }
+    return pa.table(cols, schema=SCHEMA), read, unlinked, len(repeated), len(ambiguous)
+
+
+# ── STORAGE ────────────────────────────────────────────────────────────────────
+
+def open_cohort(path=COHORT_FILE):
+    """Memory-map the cohort file; returns an Arrow table (zero-copy)."""
+    return pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+
+
+def add_wave(table, path=COHORT_FILE):
+    """Store one wave, replacing that wave if it was added before. Atomic."""
+    parts = [table]
+    if os.path.exists(path):
+        old = open_cohort(path)
+        wave = table["wave"][0].as_py() if table.num_rows else None
+        parts.insert(0, old.filter(pc.not_equal(old["wave"], wave)) if wave is not None else old)
+    # IPC files need one dictionary per column across all record batches
+    merged = pa.concat_tables(parts).unify_dictionaries().combine_chunks()
+    tmp = path + ".tmp"
+    with pa.OSFile(tmp, "wb") as sink:
+        with pa.ipc.new_file(sink, merged.schema) as writer:
+            writer.write_table(merged)
+    os.replace(tmp, path)
+
+
+def waves(path=COHORT_FILE):
+    """{wave: children} for every wave stored."""
+    w = open_cohort(path).column("wave").to_numpy()
+    values, counts = np.unique(w, return_counts=True)
+    return dict(zip(values.tolist(), counts.tolist()))
+
+
+def load_wave(path, wave):
+    """One wave's keys, dimension matrix, neophobia and dominant as numpy arrays."""
+    table = open_cohort(path)
+    table = table.filter(pc.equal(table["wave"], wave)).select(["key", *DIMENSIONS, "neo_score", "dominant"])
+    key = table["key"].combine_chunks()
+    n = len(key)
+    keys = (np.frombuffer(key.buffers()[1], dtype=f"S{KEY_BYTES}", count=n, offset=key.offset * KEY_BYTES)
+            if n else np.zeros(0, dtype=f"S{KEY_BYTES}"))
+    return {
+        "key": keys,
+        "dims": np.column_stack([table[d].to_numpy() for d in DIMENSIONS]).astype(np.int16)
+                if n else np.zeros((0, len(DIMENSIONS)), dtype=np.int16),
+        "neo": table["neo_score"].to_numpy().astype(np.int16),
+        "dominant": table["dominant"].to_numpy().astype(np.int64),
+    }
+
+
+# ── COMPARISON ─────────────────────────────────────────────────────────────────
+
+def compare(path, wave_a, wave_b):
+    """Link two waves on the pseudonymous key.
+
+    Returns a dict: key (hex, per linked child), dims_delta (n × 6, b − a),
+    neo_delta, dominant_a, dominant_b, transitions (6 × 6 counts, rows =
+    wave_a avatar, columns = wave_b avatar), and each wave's size.
+    """
+    a, b = load_wave(path, wave_a), load_wave(path, wave_b)
+    _, ia, ib = np.intersect1d(a["key"], b["key"], assume_unique=True, return_indices=True)
+    transitions = np.zeros((len(DIMENSIONS), len(DIMENSIONS)), dtype=np.int64)
+    np.add.at(transitions, (a["dominant"][ia], b["dominant"][ib]), 1)
+    return {
+        # bytes() of an S16 item would drop trailing NULs: go through uint8
+        "key": [row.tobytes().hex() for row in a["key"][ia].view(np.uint8).reshape(-1, KEY_BYTES)],
+        "dims_delta": b["dims"][ib] - a["dims"][ia],
+        "neo_delta": b["neo"][ib] - a["neo"][ia],
+        "dominant_a": a["dominant"][ia],
+        "dominant_b": b["dominant"][ib],
+        "transitions": transitions,
+        "sizes": (len(a["key"]), len(b["key"])),
+    }
+
+
+def _avatar(i):
+    return AVATAR_NAMES.get(DIMENSIONS[i], DEFAULT_AVATAR)[0].encode("ascii", "ignore").decode().strip()
+
+
+def print_comparison(result, wave_a, wave_b):
+    n = len(result["key"])
+    size_a, size_b = result["sizes"]
+    print(f"\n  Wave {wave_a}: {size_a} children  ·  Wave {wave_b}: {size_b} children  ·  linked: {n}")
+    if not n:
+        return
+    print(f"\n  Mean change {wave_a} → {wave_b} (out of 10):")
+    for j, d in enumerate(DIMENSIONS):
+        print(f"    {d.capitalize():<15} {result['dims_delta'][:, j].mean():>+5.2f}")
+    print(f"    {'Neophobia':<15} {result['neo_delta'].mean():>+5.2f}  (out of 8, higher = more adventurous)")
+
+    print(f"\n  Avatar transitions (rows: {wave_a}, columns: {wave_b}):")
+    names = [_avatar(i) for i in range(len(DIMENSIONS))]
+    short = [name.split()[-1][:8] for name in names]
+    print(f"    {'':<16}" + "".join(f"{s:>9}" for s in short))
+    for i, name in enumerate(names):
+        print(f"    {name:<16}" + "".join(f"{c:>9}" for c in result["transitions"][i]))
+    stayed = int(np.trace(result["transitions"]))
+    print(f"\n  Same avatar in both waves: {stayed} ({round(100 * stayed / n)}%)")
+
+
+def write_deltas(result, csv_path):
+    """Per-child deltas (pseudonymous key only) as CSV."""
+    import pandas as pd
+    out = pd.DataFrame(result["dims_delta"], columns=[f"{d}_delta" for d in DIMENSIONS])
+    out.insert(0, "key", result["key"])
+    out["neophobia_delta"] = result["neo_delta"]
+    out["avatar_from"] = [DIMENSIONS[i] for i in result["dominant_a"]]
+    out["avatar_to"] = [DIMENSIONS[i] for i in result["dominant_b"]]
+    out.to_csv(csv_path, index=False)
+
+
+# ── CLI ────────────────────────────────────────────────────────────────────────
+
+def main():
+    parser = argparse.ArgumentParser(description="Link survey waves and compare children over time")
+    parser.add_argument("--cohort",   default=COHORT_FILE, help=f"Cohort file (default: {COHORT_FILE})")
+    parser.add_argument("--secret",   default=SECRET_FILE, help=f"Linking secret file (default: {SECRET_FILE})")
+    parser.add_argument("--add-wave", type=int, metavar="WAVE", help="Score and store a wave (e.g. 2026)")
+    parser.add_argument("--source",   default=None, help="With --add-wave: read from a local replica instead of Supabase (see sources.py)")
+    parser.add_argument("--since",    default=None, help="With --add-wave: first day of the wave (default: Jan 1 of WAVE)")
+    parser.add_argument("--until",    default=None, help="With --add-wave: day after the wave (default: Jan 1 of WAVE + 1)")
+    parser.add_argument("--compare",  type=int, nargs=2, metavar=("FROM", "TO"), help="Compare two stored waves")
+    parser.add_argument("--output-dir", default=".", help="Directory for the --compare CSV")
+    args = parser.parse_args()
+
+    if args.add_wave is None and not args.compare:
+        if not os.path.exists(args.cohort):
+            parser.error("nothing stored yet: start with --add-wave")
+        for wave, n in waves(args.cohort).items():
+            print(f"  Wave {wave}: {n} children")
+        return
+
+    if args.add_wave is not None:
+        from analyse import SUPABASE_URL, SUPABASE_KEY
+        from sources import describe, open_source
+        try:
+            source = open_source(args.source, SUPABASE_URL, SUPABASE_KEY)
+        except ValueError as e:
+            print(f"❌ {e}")
+            sys.exit(1)
+        print(describe(source))
+        since = args.since or f"{args.add_wave}-01-01"
+        until = args.until or f"{args.add_wave + 1}-01-01"
+        table, read, unlinked, repeated, ambiguous = wave_table(source.iter_pages(since=since), args.add_wave,
+                                           load_secret(args.secret), until=until)
+        add_wave(table, args.cohort)
+        print(f"✅ Wave {args.add_wave}: {table.num_rows} children from {read} response(s) → {args.cohort}"
+              + (f"  ({unlinked} without an email, not linkable)" if unlinked else ""))
+        if repeated:
+            print(f"⚠️  {repeated} key(s) answered more than once this wave: kept the latest answer "
+                  f"(a resubmission, or siblings of the same gender in the same level)")
+        if ambiguous:
+            print(f"⚠️  {ambiguous} key(s) answered for different levels — siblings of the same gender "
+                  f"sharing an email — left out of the wave")
+
+    if args.compare:
+        wave_a, wave_b = args.compare
+        result = compare(args.cohort, wave_a, wave_b)
+        print_comparison(result, wave_a, wave_b)
+        if result["key"]:
+            csv_path = os.path.join(args.output_dir, f"cohort_{wave_a}_{wave_b}.csv")
+            write_deltas(result, csv_path)
+            print(f"\n✅ Per-child changes → {csv_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""
+we-are-what-we-eat · Report Mail Dispatcher
+===========================================
+Used by generate_report.py --send-emails.
+
+Sends report emails from a small pool of worker threads, each holding one
+authenticated SMTP connection that is reused across messages instead of
+reconnecting, re-running STARTTLS and logging in for every recipient.
+
+  • bounded queue: submit() blocks when mail falls behind rendering
+  • transient failures (4xx replies, dropped connections, timeouts) are
+    retried with exponential backoff; permanent 5xx failures are not
+  • every outcome is appended to a JSONL log, so a rerun skips anything
+    that was already sent instead of emailing the family twice
+"""
+
+import json
+import os
+import queue
+import random
+import smtplib
+import threading
+import time
+from datetime import datetime
+
+import profiling
+
+
+def _is_transient(err):
+    """Worth retrying: a 4xx reply, a dropped connection or a network error.
+
+    Every smtplib.SMTPException is also an OSError, so those are decided
+    first; anything else SMTP reports (5xx, refused recipients, unsupported
+    commands) fails at once instead of holding a worker through the backoff.
+    """
+    if isinstance(err, smtplib.SMTPServerDisconnected):
+        return True
+    if isinstance(err, smtplib.SMTPResponseException):
+        return 400 <= err.smtp_code < 500
+    if isinstance(err, smtplib.SMTPRecipientsRefused):
+        codes = [code for code, _ in err.recipients.values()]
+        return bool(codes) and all(400 <= code < 500 for code in codes)
+    if isinstance(err, smtplib.SMTPException):
+        return False
+    return isinstance(err, OSError)   # socket errors and timeouts
+
+
+class MailDispatcher:
+    """Pool of persistent SMTP connections fed from a bounded queue."""
+
+    def __init__(self, host, port, username, password, workers=2, log_path=None,
+                 max_retries=4, backoff=2.0, max_per_connection=90, queue_size=None):
+        self.host        = host
+        self.port        = port
+        self.username    = username
+        self.password    = password
+        self.log_path    = log_path
+        self.max_retries = max_retries
+        self.backoff     = backoff
+        # Gmail drops a connection after ~100 messages; recycle before that
+        self.max_per_connection = max_per_connection
+
+        self.stats = {"sent": 0, "failed": 0, "skipped": 0}
+        self.busy  = 0.0   # seconds the workers spent building and sending, summed
+        self._lock = threading.Lock()
+        self._outcomes = self._load_outcomes(log_path)
+        self._queue = queue.Queue(maxsize=queue_size or workers * 4)
+        self._threads = [
+            threading.Thread(target=self._worker, name=f"mail-{n}", daemon=True)
+            for n in range(workers)
+        ]
+        for t in self._threads:
+            t.start()
+
+    # ── outcome log ──────────────────────────────────────────────────────────
+
+    @staticmethod
+    def _load_outcomes(log_path):
+        """(key, address) → latest logged outcome, 'sent' or 'failed'."""
+        outcomes = {}
+        if not log_path or not os.path.exists(log_path):
+            return outcomes
+        with open(log_path) as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    continue   # torn last line from an interrupted run
+                outcomes[(rec["key"], rec["to"])] = rec["status"]
+        return outcomes
+
+    def _record(self, key, to_address, status, error=None, attempts=1):
+        with self._lock:
+            self.stats[status] += 1
+            self._outcomes[(key, to_address)] = status
+            if not self.log_path:
+                return
+            rec = {"key": key, "to": to_address, "status": status, "attempts": attempts,
+                   "error": error, "at": datetime.now().isoformat()}
+            with open(self.log_path, "a") as f:
+                f.write(json.dumps(rec) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+    def already_sent(self, key, to_address):
+        return self._outcomes.get((key, to_address)) == "sent"
+
+    def outcome(self, key, to_address):
+        """'sent', 'failed' (retries used up or a permanent error) or None if not settled."""
+        return self._outcomes.get((key, to_address))
+
+    # ── sending ──────────────────────────────────────────────────────────────
+
+    def submit(self, key, to_address, make_message):
+        """Queue one email; `make_message()` builds the MIME message lazily.
+
+        Returns False (and sends nothing) if the log says it already went out.
+        """
+        if self.already_sent(key, to_address):
+            with self._lock:
+                self.stats["skipped"] += 1
+            return False
+        self._queue.put((key, to_address, make_message))
+        return True
+
+    def _connect(self):
+        server = smtplib.SMTP(self.host, self.port, timeout=60)
+        server.ehlo()
+        server.starttls()
+        server.ehlo()
+        server.login(self.username, self.password)
+        return server
+
+    def _worker(self):
+        server, sent_on_conn = None, 0
+        while True:
+            job = self._queue.get()
+            if job is None:
+                break
+            key, to_address, make_message = job
+            t0 = time.perf_counter()
+            try:
+                with profiling.span("email", id=key):
+                    msg = make_message().as_string()
+            except Exception as e:
+                self._record(key, to_address, "failed", f"could not build message: {e}")
+                self._add_busy(t0)
+                continue
+
+            for attempt in range(1, self.max_retries + 2):
+                try:
+                    with profiling.span("smtp", id=key):   # connecting counts too
+                        if server is None or sent_on_conn >= self.max_per_connection:
+                            _quit(server)
+                            server, sent_on_conn = self._connect(), 0
+                        server.sendmail(self.username, to_address, msg)
+                    sent_on_conn += 1
+                    self._record(key, to_address, "sent", attempts=attempt)
+                    break
+                except Exception as e:
+                    transient = _is_transient(e)
+                    if transient:   # start the retry on a fresh connection
+                        _quit(server)
+                        server = None
+                    if not transient or attempt > self.max_retries:
+                        self._record(key, to_address, "failed", str(e), attempts=attempt)
+                        print(f"  ⚠️  email FAILED → {to_address} ({e})")
+                        break
+                    delay = self.backoff * 2 ** (attempt - 1)
+                    time.sleep(delay + random.uniform(0, delay / 2))
+            self._add_busy(t0)
+        _quit(server)
+
+    def _add_busy(self, t0):
+        with self._lock:
+            self.busy += time.perf_counter() - t0
+
+    def close(self):
+        """Wait for the queue to drain and return the final stats."""
+        for _ in self._threads:
+            self._queue.put(None)
+        for t in self._threads:
+            t.join()
+        return dict(self.stats)
+
+
+def _quit(server):
+    if server is None:
+        return
+    try:
+        server.quit()
+    except Exception:
+        pass
@@ -0,0 +1,93 @@
+"""
+we-are-what-we-eat · Multi-Select Answers
+=========================================
+Shared by scoring.py, aggregate.py and analyse.py.
+
+The text[] columns (q18_cuisine, q19_adv, q24_healthy) arrive as one Python
+list of strings per row. MultiHot encodes such a column once into an
+n_rows × n_options boolean matrix — one column per option, in order of first
+appearance — so counts, per-row cardinality and co-occurrence are numpy
+reductions instead of exploding the lists again for every statistic.
+
+  encode(df)                   — {column: MultiHot} for every text[] column
+  MultiHot.counts()            — how many respondents ticked each option
+  MultiHot.cardinality(...)    — options ticked per respondent
+  MultiHot.cooccurrence()      — option × option table (ticked together)
+"""
+
+from collections import Counter
+
+import numpy as np
+
+MULTI_SELECT = ["q18_cuisine", "q19_adv", "q24_healthy"]
+
+
+class MultiHot:
+    """One-hot matrix for a checkbox question: rows = respondents, columns = options."""
+
+    def __init__(self, matrix, options):
+        self.matrix  = matrix        # bool, shape (n_rows, len(options))
+        self.options = options       # option labels, first appearance first
+
+    @classmethod
+    def from_series(cls, series):
+        """Encode a Series of lists. None / NaN cells and empty strings are skipped.
+
+        A checkbox can only be ticked once, so repeated values within a cell
+        collapse into one tick.
+        """
+        import pandas as pd
+
+        s = series.reset_index(drop=True).explode()
+        s = s[s.notna() & (s != "")]
+        # factorize numbers values in order of first appearance, which is also
+        # the order value_counts() breaks ties in
+        codes, uniques = pd.factorize(s)
+        matrix = np.zeros((len(series), len(uniques)), dtype=bool)
+        matrix[s.index.to_numpy(), codes] = True
+        return cls(matrix, list(uniques))
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    def column(self, option):
+        """Boolean mask of respondents who ticked `option` (all False if nobody did)."""
+        if option in self.options:
+            return self.matrix[:, self.options.index(option)]
+        return np.zeros(len(self), dtype=bool)
+
+    def counts(self):
+        """Counter of option → respondents, in first-appearance order."""
+        totals = self.matrix.sum(axis=0)
+        return Counter({o: int(c) for o, c in zip(self.options, totals) if c})
+
+    def cardinality(self, exclude=()):
+        """Number of options each respondent ticked, ignoring `exclude`."""
+        keep = [i for i, o in enumerate(self.options) if o not in exclude]
+        return self.matrix[:, keep].sum(axis=1, dtype=np.int64)
+
+    def cooccurrence(self):
+        """Square DataFrame: how many respondents ticked both row and column option.
+
+        The diagonal holds each option's own count.
+        """
+        import pandas as pd
+
+        m = self.matrix.astype(np.int32)
+        return pd.DataFrame(m.T @ m, index=self.options, columns=self.options)
+
+    def pairs(self):
+        """Counter of (option, option) → respondents who ticked both, each pair once."""
+        table = self.cooccurrence().to_numpy()
+        i, j = np.triu_indices(len(self.options), k=1)
+        return Counter({(self.options[a], self.options[b]): int(c)
+                        for a, b, c in zip(i, j, table[i, j]) if c})
+
+
+def encode(df, columns=MULTI_SELECT):
+    """MultiHot for each text[] column; a missing column encodes as no ticks."""
+    return {
+        col: MultiHot.from_series(df[col]) if col in df
+        else MultiHot(np.zeros((len(df), 0), dtype=bool), [])
+        for col in columns
+    }
@@ -0,0 +1,209 @@
+"""
+we-are-what-we-eat · Staged Pipeline
+====================================
+Used by generate_report.py.
+
+Runs a job as a chain of stages (fetch → score → render → write → …), each
+on its own thread and joined to the next by a bounded queue, so Supabase,
+the render processes, the disk and SMTP all work at the same time instead
+of taking turns.
+
+  • backpressure: a stage blocks when the queue after it is full, so a slow
+    stage holds everything upstream back instead of the whole table piling
+    up in memory
+  • one thread per stage keeps items in order from end to end
+  • an exception in any stage stops the others and is re-raised in the
+    thread consuming the results
+  • every stage counts its items, the time it spent working, starved
+    (waiting for input) and stalled (waiting for room downstream);
+    print_stats() shows which stage set the pace
+
+A stage is a function from an iterator of inputs to an iterable of outputs,
+so it can batch, split or hold items back (e.g. keep a window of jobs in a
+process pool) as long as it yields in order:
+
+  pipe = Pipeline()
+  pipe.add("fetch", lambda _: pages, count=len, unit="rows")
+  pipe.add("score", score_pages)
+  for item in pipe.run(): ...
+  pipe.print_stats()
+"""
+
+import queue
+import threading
+import time
+
+_DONE = object()
+
+
+class Stage:
+    """One step of a Pipeline and its counters."""
+
+    def __init__(self, name, fn, depth, count=None, unit="items", workers=1):
+        self.name    = name
+        self.fn      = fn
+        self.depth   = depth       # bound of the queue after this stage
+        self.count   = count       # output → items it stands for (default 1)
+        self.unit    = unit
+        self.workers = workers     # processes / threads sharing the work
+        self.items   = 0
+        self.elapsed = 0.0         # time spent producing outputs, input waits included
+        self.starved = 0.0
+        self.stalled = 0.0
+        self._work   = None
+
+    def work(self, seconds):
+        """Record work done elsewhere (a process pool); replaces the measured busy time."""
+        self._work = (self._work or 0.0) + seconds
+
+    @property
+    def busy(self):
+        return self._work if self._work is not None else max(0.0, self.elapsed - self.starved)
+
+
+def _metered(iterable, add):
+    """Yield from `iterable`, passing the time each step took to `add`."""
+    it = iter(iterable)
+    while True:
+        t0 = time.perf_counter()
+        try:
+            item = next(it)
+        except StopIteration:
+            add(time.perf_counter() - t0)
+            return
+        add(time.perf_counter() - t0)
+        yield item
+
+
+class Pipeline:
+    """Stages on their own threads, joined by bounded queues."""
+
+    def __init__(self, depth=64, threaded=True):
+        self.depth    = depth
+        self.threaded = threaded   # False runs every stage on the caller's thread
+        self.stages   = []
+        self.extra    = []         # stages run outside the pipeline (record())
+        self._stop    = threading.Event()
+        self._error   = None
+        self._started = None
+        self._wall    = 0.0
+
+    def add(self, name, fn, depth=None, count=None, unit="items", workers=1):
+        """Append a stage: `fn(inputs)` → outputs. Returns the Stage."""
+        stage = Stage(name, fn, depth or self.depth, count, unit, workers)
+        self.stages.append(stage)
+        return stage
+
+    def record(self, name, items, busy, unit="items", workers=1):
+        """Add a stage that ran elsewhere (e.g. mail threads) to print_stats()."""
+        stage = Stage(name, None, 0, unit=unit, workers=workers)
+        stage.items = items
+        stage.work(busy)
+        self.extra.append(stage)
+        return stage
+
+    # ── running ──────────────────────────────────────────────────────────────
+
+    def run(self):
+        """Start the stages; yields the last stage's outputs in order."""
+        self._started = time.perf_counter()
+        try:
+            yield from self._run_threaded() if self.threaded else self._run_serial()
+        finally:
+            self._wall = time.perf_counter() - self._started
+
+    def _run_serial(self):
+        items = iter(())
+        for stage in self.stages:
+            items = self._drive(stage, _metered(items, lambda s, st=stage: _add(st, "starved", s)))
+        yield from items
+
+    def _drive(self, stage, inputs):
+        for out in _metered(stage.fn(inputs), lambda s: _add(stage, "elapsed", s)):
+            stage.items += stage.count(out) if stage.count else 1
+            yield out
+
+    def _run_threaded(self):
+        inbox, threads = None, []
+        for stage in self.stages:
+            outbox = queue.Queue(maxsize=stage.depth)
+            t = threading.Thread(target=self._worker, args=(stage, inbox, outbox),
+                                 name=stage.name, daemon=True)
+            threads.append(t)
+            inbox = outbox
+        for t in threads:
+            t.start()
+        finished = False
+        try:
+            while True:
+                item = self._get(inbox)
+                if item is _DONE:
+                    break
+                yield item
+            finished = self._error is None
+        finally:
+            self._stop.set()
+            for t in threads:
+                # A stage stuck in a network call is a daemon; don't hang on it
+                t.join(None if finished else 5)
+        if self._error is not None:
+            raise self._error
+
+    def _worker(self, stage, inbox, outbox):
+        try:
+            inputs = self._inputs(stage, inbox) if inbox is not None else iter(())
+            for out in self._drive(stage, inputs):
+                t0 = time.perf_counter()
+                ok = self._put(outbox, out)
+                stage.stalled += time.perf_counter() - t0
+                if not ok:
+                    return
+            self._put(outbox, _DONE)
+        except BaseException as e:   # re-raised in the consuming thread
+            if self._error is None:
+                self._error = e
+            self._stop.set()
+
+    def _inputs(self, stage, inbox):
+        while True:
+            t0 = time.perf_counter()
+            item = self._get(inbox)
+            stage.starved += time.perf_counter() - t0
+            if item is _DONE:
+                return
+            yield item
+
+    def _get(self, q):
+        while True:
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                if self._stop.is_set():   # run() raises the error, if any
+                    return _DONE
+
+    def _put(self, q, item):
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    # ── reporting ────────────────────────────────────────────────────────────
+
+    def print_stats(self):
+        """One line per stage: items, busy time, capacity, time starved / stalled."""
+        print(f"   🚰 Pipeline stages ({self._wall:.2f}s wall):")
+        print(f"      {'stage':<12} {'items':>13} {'busy s':>8} {'max/s':>8} {'starved s':>10} {'stalled s':>10}")
+        for stage in self.stages + self.extra:
+            busy = stage.busy
+            rate = f"{stage.items * stage.workers / busy:,.0f}" if busy and stage.items else "—"
+            name = stage.name + (f" ×{stage.workers}" if stage.workers > 1 else "")
+            waits = (f"{stage.starved:>10.2f} {stage.stalled:>10.2f}"
+                     if stage.fn and self.threaded else f"{'—':>10} {'—':>10}")
+            print(f"      {name:<12} {stage.items:>8,} {stage.unit:<4} {busy:>8.2f} {rate:>8} {waits}")
+
+
+def _add(stage, field, seconds):
+    setattr(stage, field, getattr(stage, field) + seconds)
@@ -0,0 +1,306 @@
+"""
+we-are-what-we-eat · Stage Profiler
+===================================
+Used by analyse.py --profile and generate_report.py --profile.
+
+Records every stage of a run (fetch, score, chart, page1, page2, save,
+email, smtp, …) as a span with its wall time, CPU time and peak traced
+memory, and which respondent it was for where there is one, so a slow run
+shows whether the time went to Supabase, scoring, matplotlib, reportlab or
+SMTP.
+
+  • wall time is perf_counter; CPU time is the span's own thread, so mail
+    threads and the renderer don't count each other's work
+  • memory is tracemalloc's peak above the level at the start of the span,
+    measured on the main thread of each process (tracing slows a run down;
+    compare profiled runs with profiled runs)
+  • render processes (--workers N) record their own spans to a spool folder,
+    which finish() merges in
+  • finish() prints a table per stage and per respondent, writes
+    profile_trace.json (Chrome trace format: open in chrome://tracing or
+    https://ui.perfetto.dev) and, with cprofile, dumps cProfile stats of
+    the stage with the most exclusive time in this process
+
+Instrumenting code costs one check when profiling is off:
+
+  with profiling.span("chart", id=row_id): ...
+  for page in profiling.iter_spans("fetch", pages): ...
+"""
+
+import os
+import json
+import time
+import threading
+import tracemalloc
+from contextlib import nullcontext
+
+TRACE_NAME = "profile_trace.json"
+PROFILER = None      # the active Profiler, if any
+_OFF = nullcontext()
+
+
+class Profiler:
+    """Collects spans for this process (and, via the spool, its workers)."""
+
+    def __init__(self, spool_dir=None, memory=True, cprofile=False, owner=True):
+        self.spans     = []
+        self.spool_dir = spool_dir
+        self.memory    = memory
+        self.cprofile  = cprofile
+        self.owner     = owner     # False in render processes, which only spool
+        self.profiles  = {}        # stage → cProfile.Profile (main thread only)
+        self.threads   = {}        # native thread id → name, for the trace
+        self.started   = time.perf_counter_ns()
+        self.cpu0      = time.process_time_ns()
+        self.peak      = 0
+        self._local    = threading.local()
+        self._spool    = None
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        if spool_dir and not owner:
+            self._spool = open(os.path.join(spool_dir, f"{os.getpid()}.jsonl"), "a", buffering=1)
+
+    def span(self, name, **args):
+        """Context manager timing one stage; `args` (id=…, n=…) go into the trace."""
+        return _Span(self, name, args)
+
+    def _add(self, span):
+        tid = threading.get_native_id()
+        self.threads.setdefault(tid, threading.current_thread().name)
+        span.update(pid=os.getpid(), tid=tid, thread=self.threads[tid])
+        self.spans.append(span)
+        if self._spool:
+            self._spool.write(json.dumps(span, default=str) + "\n")
+
+    # ── results ──────────────────────────────────────────────────────────────
+
+    def collect(self):
+        """This process's spans plus everything the render processes spooled."""
+        import glob
+
+        spans = list(self.spans)
+        for path in glob.glob(os.path.join(self.spool_dir or "", "*.jsonl")) if self.spool_dir else []:
+            with open(path) as f:
+                for line in f:
+                    try:
+                        spans.append(json.loads(line))
+                    except ValueError:
+                        continue   # torn last line from a killed worker
+        return spans
+
+    def finish(self, out_dir, respondents=None):
+        """Print the summary, write the trace (and cProfile dump); returns the trace path."""
+        global PROFILER
+        wall = (time.perf_counter_ns() - self.started) / 1e9
+        cpu = (time.process_time_ns() - self.cpu0) / 1e9
+        spans = self.collect()
+        if self.memory:
+            self.peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+        if PROFILER is self:
+            PROFILER = None
+
+        print_summary(spans, wall, cpu, self.peak, respondents)
+        os.makedirs(out_dir or ".", exist_ok=True)
+        trace_path = os.path.join(out_dir, TRACE_NAME)
+        write_trace(trace_path, spans)
+        print(f"\n  🧭 Trace → {trace_path}  (chrome://tracing or ui.perfetto.dev)")
+        if self.cprofile:
+            self._dump_hottest(out_dir, spans)
+        if self.spool_dir:
+            import shutil
+            shutil.rmtree(self.spool_dir, ignore_errors=True)
+        return trace_path
+
+    def _dump_hottest(self, out_dir, spans):
+        import pstats
+
+        totals = stage_totals(spans)
+        ranked = sorted(totals, key=lambda s: -totals[s]["self"])
+        local = [s for s in ranked if s in self.profiles]
+        if not local:
+            print("  ⚠️  No stage ran in this process; nothing for cProfile to dump")
+            return
+        stage = local[0]
+        if stage != ranked[0]:
+            print(f"  ⚠️  Hottest stage '{ranked[0]}' ran in worker processes; "
+                  f"use --workers 1 to profile it. Dumping '{stage}' instead.")
+        path = os.path.join(out_dir, f"profile_{stage}.pstats")
+        self.profiles[stage].dump_stats(path)
+        print(f"  🔬 cProfile of '{stage}' → {path}  (python -m pstats {path})")
+        pstats.Stats(path).sort_stats("cumulative").print_stats(12)
+
+
+class _Span:
+    """One timed stage. Nested spans on a thread hand memory peaks and the
+    cProfile hook back to their parent, so every stage gets exclusive counts."""
+
+    __slots__ = ("prof", "name", "args", "frame", "t0", "c0")
+
+    def __init__(self, prof, name, args):
+        self.prof, self.name, self.args = prof, name, args
+
+    def __enter__(self):
+        p = self.prof
+        stack = p._local.__dict__.setdefault("stack", [])
+        main = threading.current_thread() is threading.main_thread()
+        frame = {"child": 0, "peak": 0, "base": None, "cprof": None}
+        if p.memory and main:
+            current, peak = tracemalloc.get_traced_memory()
+            if stack:
+                stack[-1]["peak"] = max(stack[-1]["peak"], peak)
+            tracemalloc.reset_peak()
+            frame["base"] = current
+        if p.cprofile and main:
+            import cProfile
+            outer = stack[-1]["cprof"] if stack else None
+            frame["cprof"] = p.profiles.setdefault(self.name, cProfile.Profile())
+            if outer is not frame["cprof"]:
+                if outer:
+                    outer.disable()
+                frame["cprof"].enable()
+        stack.append(frame)
+        self.frame = frame
+        self.t0, self.c0 = time.perf_counter_ns(), time.thread_time_ns()
+        return self
+
+    def __exit__(self, *exc):
+        dur = time.perf_counter_ns() - self.t0
+        cpu = time.thread_time_ns() - self.c0
+        p, frame = self.prof, self.frame
+        stack = p._local.stack
+        stack.pop()
+        parent = stack[-1] if stack else None
+        if frame["cprof"]:
+            outer = parent["cprof"] if parent else None
+            if outer is not frame["cprof"]:
+                frame["cprof"].disable()
+                if outer:
+                    outer.enable()
+        peak = None
+        if frame["base"] is not None:
+            high = max(frame["peak"], tracemalloc.get_traced_memory()[1])
+            peak = high - frame["base"]
+            p.peak = max(p.peak, high)
+            if parent:
+                parent["peak"] = max(parent["peak"], high)
+        if parent:
+            parent["child"] += dur
+        p._add({"name": self.name, "ts": self.t0 // 1000, "dur": dur / 1000,
+                "self": (dur - frame["child"]) / 1000, "cpu": cpu / 1000, "peak": peak,
+                "args": self.args})
+        return False
+
+
+# ── INSTRUMENTATION ────────────────────────────────────────────────────────────
+
+def enable(spool=False, memory=True, cprofile=False):
+    """Start profiling this process; `spool` makes a folder for render processes."""
+    global PROFILER
+    import tempfile
+    spool_dir = tempfile.mkdtemp(prefix="wawwe-profile-") if spool else None
+    PROFILER = Profiler(spool_dir, memory=memory, cprofile=cprofile)
+    return PROFILER
+
+
+def enable_worker(spool_dir, memory=True):
+    """Process-pool initializer side: spool this process's spans for the parent."""
+    global PROFILER
+    if spool_dir:
+        PROFILER = Profiler(spool_dir, memory=memory, owner=False)
+
+
+def span(name, **args):
+    """Time a stage if profiling is on; otherwise a shared no-op context."""
+    return PROFILER.span(name, **args) if PROFILER else _OFF
+
+
+def iter_spans(name, iterable, **args):
+    """Yield from `iterable`, timing each step (e.g. waiting for the next page)."""
+    if not PROFILER:
+        yield from iterable
+        return
+    it = iter(iterable)
+    while True:
+        with PROFILER.span(name, **args):
+            try:
+                item = next(it)
+            except StopIteration:
+                return
+        yield item
+
+
+# ── REPORTING ──────────────────────────────────────────────────────────────────
+
+def stage_totals(spans):
+    """stage → calls, wall/self/CPU seconds, max peak bytes, respondents."""
+    totals = {}
+    for s in spans:
+        t = totals.setdefault(s["name"], {"calls": 0, "wall": 0.0, "self": 0.0, "cpu": 0.0,
+                                           "peak": None, "ids": set(), "n": 0})
+        t["calls"] += 1
+        t["wall"] += s["dur"] / 1e6
+        t["self"] += s["self"] / 1e6
+        t["cpu"] += s["cpu"] / 1e6
+        if s["peak"] is not None:
+            t["peak"] = max(t["peak"] or 0, s["peak"])
+        args = s.get("args") or {}
+        if "id" in args:
+            t["ids"].add(args["id"])
+        t["n"] += args.get("n", 0)
+    return totals
+
+
+def _ms(seconds):
+    return f"{seconds * 1000:,.2f}"
+
+
+def print_summary(spans, wall, cpu, peak, respondents=None):
+    """The per-stage table, then the slowest respondents."""
+    totals = stage_totals(spans)
+    print(f"\n{'═'*78}")
+    print(f"  PROFILE  ·  {wall:.2f}s wall  ·  {cpu:.2f}s CPU (this process)"
+          f"  ·  {peak / 2**20:,.1f} MB peak traced")
+    print(f"{'═'*78}")
+    print(f"  {'stage':<20} {'calls':>6} {'wall s':>9} {'self s':>9} {'CPU s':>9}"
+          f" {'peak MB':>8} {'ms/resp':>9}")
+    for stage, t in sorted(totals.items(), key=lambda kv: -kv[1]["self"]):
+        per = len(t["ids"]) or t["n"] or respondents
+        peak_mb = f"{t['peak'] / 2**20:,.1f}" if t["peak"] is not None else "—"
+        print(f"  {stage:<20} {t['calls']:>6,} {t['wall']:>9.3f} {t['self']:>9.3f} {t['cpu']:>9.3f}"
+              f" {peak_mb:>8} {(_ms(t['wall'] / per) if per else '—'):>9}")
+
+    per_id = {}
+    for s in spans:
+        rid = (s.get("args") or {}).get("id")
+        if rid is not None:
+            per_id[rid] = per_id.get(rid, 0.0) + s["dur"] / 1e6
+    if not per_id:
+        return
+    times = sorted(per_id.values())
+    p95 = times[min(len(times) - 1, int(0.95 * len(times)))]
+    print(f"\n  Per respondent ({len(times):,}):  mean {_ms(sum(times) / len(times))} ms"
+          f"  ·  p95 {_ms(p95)} ms  ·  max {_ms(times[-1])} ms")
+    for rid, secs in sorted(per_id.items(), key=lambda kv: -kv[1])[:5]:
+        stages = "  ".join(f"{s['name']} {_ms(s['dur'] / 1e6)}" for s in spans
+                           if (s.get("args") or {}).get("id") == rid)
+        print(f"    {str(rid):<38} {_ms(secs):>9} ms   {stages}")
+
+
+def write_trace(path, spans):
+    """Chrome trace-event JSON: one complete ("X") event per span."""
+    events = []
+    names = {}
+    for s in spans:
+        names[(s["pid"], s["tid"])] = s.get("thread", "")
+        args = dict(s.get("args") or {}, cpu_ms=round(s["cpu"] / 1000, 3))
+        if s["peak"] is not None:
+            args["peak_kb"] = round(s["peak"] / 1024, 1)
+        events.append({"name": s["name"], "ph": "X", "ts": s["ts"], "dur": s["dur"],
+                       "pid": s["pid"], "tid": s["tid"], "args": args})
+    for (pid, tid), name in names.items():
+        events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}})
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, default=str)
+    os.replace(tmp, path)
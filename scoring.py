@@ -0,0 +1,188 @@
+"""
+we-are-what-we-eat · Flavour Profile Scoring
+============================================
+Shared by analyse.py and generate_report.py.
+
+Maps survey answers to the 6 Flavour Dimensions (0–10 scale each), picks the
+dominant dimension's Food Avatar and computes the Food Neophobia score.
+
+  score_flavour_profile(row)  — one respondent (dict-like row)
+  score_profiles(df)          — a whole DataFrame at once, same results
+"""
+
+import numpy as np
+
+from multiselect import encode
+
+# pandas is imported inside the functions that build frames, so modules that
+# only need the constants below don't pay for it at start-up
+
+# Dimensions: Sweet · Salty · Sour · Umami · Crunchy · Adventurous
+DIMENSIONS = ["sweet", "salty", "sour", "umami", "crunchy", "adventurous"]
+
+FLAVOUR_MAP = {
+    # Q5 primary flavour → dimension +4 pts
+    "q5_flavour": {
+        "Sweet":           {"sweet": 4},
+        "Salty":           {"salty": 4},
+        "Sour & Tangy":    {"sour": 4},
+        "Savoury / Umami": {"umami": 4},
+        "Slightly Bitter": {"umami": 2},
+    },
+    # Q4 texture → crunchy dimension
+    "q4_texture": {
+        "Crunchy & Crispy": {"crunchy": 4},
+        "Chewy":            {"crunchy": 1},
+        "Soft & Creamy":    {"sweet": 1},
+        "Fluffy & Airy":    {"sweet": 1},
+        "Juicy & Wet":      {"sour": 1},
+    },
+    # Q6 snack
+    "q6_snack": {
+        "Chips / Crisps":     {"salty": 2, "crunchy": 2},
+        "Chocolate":          {"sweet": 2},
+        "Biscuits / Cookies": {"sweet": 1, "crunchy": 1},
+        "Fresh Fruit":        {"sour": 1, "adventurous": 1},
+        "Seaweed Snack":      {"salty": 1, "crunchy": 2, "adventurous": 2},
+        "Ice Cream":          {"sweet": 2},
+        "Nuts or Seeds":      {"salty": 1, "crunchy": 2, "adventurous": 1},
+    },
+    # Q9 trying new foods → adventurous
+    "q9_new": {
+        "Yes, definitely!":    {"adventurous": 3},
+        "Maybe once or twice": {"adventurous": 2},
+        "Not really":          {"adventurous": 0},
+        "No":                  {"adventurous": 0},
+    },
+    # Q10 reaction to unfamiliar food → adventurous
+    "q10_new_food": {
+        "Try it straight away!": {"adventurous": 3},
+        "Ask what it is first":  {"adventurous": 2},
+        "Depends how it looks":  {"adventurous": 1},
+        "I usually avoid it":    {"adventurous": 0},
+    },
+    # Q20 substitute willingness → adventurous
+    "q20_substitute": {
+        "Definitely yes!":             {"adventurous": 2},
+        "Maybe, if it tastes similar": {"adventurous": 1},
+        "Not sure":                    {"adventurous": 0},
+        "Probably not":                {"adventurous": 0},
+    },
+}
+
+AVATAR_NAMES = {
+    # Dominant dimension → avatar
+    "sweet":       ("🍭 Sweet Seeker",   "You love sweet flavours and creamy textures!"),
+    "salty":       ("🧂 Salt Captain",   "Bold salty and savoury tastes are your zone!"),
+    "sour":        ("🍋 Sour Sparks",    "Tangy, sharp, and zingy — you love the tingle!"),
+    "umami":       ("🍜 Umami Master",   "Deep savoury flavours are your happy place!"),
+    "crunchy":     ("🥨 Crunch Hero",    "Texture is everything — you live for the crunch!"),
+    "adventurous": ("🌍 Food Explorer",  "You're a natural adventurer who loves trying new things!"),
+}
+DEFAULT_AVATAR = ("🌱 Food Friend", "You have a balanced palate!")
+
+# Lower score = more neophobic (avoids new food)
+# 0–8: 0-2 Neophobic, 3-5 Moderate, 6-8 Adventurous
+NEOPHOBIA_WEIGHTS = {
+    "q9_new":       {"Yes, definitely!": 3, "Maybe once or twice": 2, "Not really": 1, "No": 0},
+    "q10_new_food": {"Try it straight away!": 3, "Ask what it is first": 2,
+                     "Depends how it looks": 1, "I usually avoid it": 0},
+    "q20_substitute": {"Definitely yes!": 2, "Maybe, if it tastes similar": 1,
+                       "Not sure": 0, "Probably not": 0},
+}
+
+CUISINE_BONUS_CAP = 4
+ADV_FOODS_BONUS_CAP = 4
+ADV_FOODS_NONE = "None of these yet!"
+DIM_CAP = 10
+
+
+def score_flavour_profile(row):
+    """Score a single respondent's flavour dimensions and neophobia."""
+    dims = {d: 0 for d in DIMENSIONS}
+    for col, mapping in FLAVOUR_MAP.items():
+        val = row.get(col)
+        if val and val in mapping:
+            for dim, pts in mapping[val].items():
+                dims[dim] += pts
+    # Cuisine diversity → adventurous bonus. Distinct ticked options, as
+    # multiselect.py counts them: a repeated or blank entry adds nothing
+    cuisines = set(row.get("q18_cuisine") or []) - {None, ""}
+    dims["adventurous"] += min(len(cuisines), CUISINE_BONUS_CAP)
+    # Adventurous foods tried → adventurous bonus
+    adv_foods = set(row.get("q19_adv") or []) - {None, "", ADV_FOODS_NONE}
+    dims["adventurous"] += min(len(adv_foods), ADV_FOODS_BONUS_CAP)
+    # Cap at 10
+    dims = {k: min(v, DIM_CAP) for k, v in dims.items()}
+    dominant = max(dims, key=dims.get)
+    name, desc = AVATAR_NAMES.get(dominant, DEFAULT_AVATAR)
+    neo_score = sum(NEOPHOBIA_WEIGHTS[q].get(row.get(q, ""), 0) for q in NEOPHOBIA_WEIGHTS)
+    return {**dims, "dominant": dominant, "avatar_name": name, "avatar_desc": desc,
+            "neo_score": neo_score}
+
+
+# ── BATCH SCORING ──────────────────────────────────────────────────────────────
+# The answer maps above compiled into (n_answers + 1) × 6 point tables. The
+# extra all-zero last row is where unknown / missing answers land: pandas
+# encodes them as category code -1, which indexes the last row directly.
+
+def _point_table(mapping):
+    table = np.zeros((len(mapping) + 1, len(DIMENSIONS)), dtype=np.int64)
+    for i, pts in enumerate(mapping.values()):
+        for dim, p in pts.items():
+            table[i, DIMENSIONS.index(dim)] = p
+    return table
+
+FLAVOUR_TABLES = {col: (list(mapping), _point_table(mapping)) for col, mapping in FLAVOUR_MAP.items()}
+NEOPHOBIA_TABLES = {
+    col: (list(weights), np.array(list(weights.values()) + [0], dtype=np.int64))
+    for col, weights in NEOPHOBIA_WEIGHTS.items()
+}
+_ADV = DIMENSIONS.index("adventurous")
+_AVATAR_NAME = np.array([AVATAR_NAMES.get(d, DEFAULT_AVATAR)[0] for d in DIMENSIONS], dtype=object)
+_AVATAR_DESC = np.array([AVATAR_NAMES.get(d, DEFAULT_AVATAR)[1] for d in DIMENSIONS], dtype=object)
+
+
+def _answer_codes(df, col, answers):
+    """Position of each row's answer in `answers`; -1 when missing or unknown."""
+    import pandas as pd
+    if col not in df:
+        return np.full(len(df), -1, dtype=np.int64)
+    return pd.Categorical(df[col], categories=answers).codes.astype(np.int64)
+
+
+def score_profiles(df, multi=None):
+    """Score every row of `df` at once.
+
+    `multi` is multiselect.encode(df), if the caller already has it.
+    Returns a DataFrame aligned to df.index with the same keys as
+    score_flavour_profile(): the 6 dimensions, dominant, avatar_name,
+    avatar_desc and neo_score.
+    """
+    import pandas as pd
+
+    n = len(df)
+    dims = np.zeros((n, len(DIMENSIONS)), dtype=np.int64)
+    for col, (answers, table) in FLAVOUR_TABLES.items():
+        dims += table[_answer_codes(df, col, answers)]
+
+    if multi is None:
+        multi = encode(df, ["q18_cuisine", "q19_adv"])
+    cuisines = multi["q18_cuisine"].cardinality()
+    adv_foods = multi["q19_adv"].cardinality(exclude=[ADV_FOODS_NONE])
+    dims[:, _ADV] += np.minimum(cuisines, CUISINE_BONUS_CAP) + np.minimum(adv_foods, ADV_FOODS_BONUS_CAP)
+    np.minimum(dims, DIM_CAP, out=dims)
+
+    # argmax keeps the first maximum, like max() over the dimension dict
+    dominant = dims.argmax(axis=1) if n else np.zeros(0, dtype=np.int64)
+
+    neo = np.zeros(n, dtype=np.int64)
+    for col, (answers, weights) in NEOPHOBIA_TABLES.items():
+        neo += weights[_answer_codes(df, col, answers)]
+
+    out = pd.DataFrame(dims, columns=DIMENSIONS, index=df.index)
+    out["dominant"] = np.array(DIMENSIONS, dtype=object)[dominant]
+    out["avatar_name"] = _AVATAR_NAME[dominant]
+    out["avatar_desc"] = _AVATAR_DESC[dominant]
+    out["neo_score"] = neo
+    return out
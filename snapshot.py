@@ -0,0 +1,257 @@
+"""
+we-are-what-we-eat · Local Columnar Snapshot
+============================================
+Keeps an on-disk Arrow copy of the survey_responses table so repeated
+analyses and report runs don't pull the whole table over the network.
+
+  • refreshed incrementally: only rows after the snapshot's newest
+    (submitted_at, id) are fetched from Supabase
+  • stored as an Arrow IPC file and read back memory-mapped, so opening it
+    costs almost nothing and only the columns used are touched
+  • single-choice answer columns are dictionary-encoded (they arrive in
+    pandas as categoricals); text[] columns stay list<string>
+
+Usage:
+  pip install pyarrow supabase pandas
+  python snapshot.py                         # create / refresh snapshot
+  python snapshot.py --full                  # rebuild from scratch
+  python analyse.py --snapshot survey_responses.arrow --level P3
+  python generate_report.py --snapshot survey_responses.arrow --limit 5
+"""
+
+import os
+import sys
+import json
+import argparse
+from datetime import datetime, timezone
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:
+    print("Run: pip install pyarrow")
+    sys.exit(1)
+
+SNAPSHOT_FILE = "survey_responses.arrow"
+
+ARRAY_COLUMNS = ["q18_cuisine", "q19_adv", "q24_healthy"]
+ANSWER_COLUMNS = [
+    "q1_who", "q2_level", "q3_gender",
+    "q4_texture", "q5_flavour", "q6_snack", "q7_spicy", "q8_fruit", "q9_new", "q10_new_food",
+    "q11_veg", "q12_drinks", "q13_fried", "q14_family", "q15_snack_decide", "q16_breakfast", "q17_school",
+    "q20_substitute", "q21_intro", "q22_convo",
+    "q23_feel", "q25_improve",
+]
+
+_CATEGORY = pa.dictionary(pa.int32(), pa.string())
+_TS = pa.timestamp("us", tz="UTC")
+
+# Column order follows the survey_responses table
+COLUMNS = (["id", "submitted_at"] + ANSWER_COLUMNS[:17] + ARRAY_COLUMNS[:2]
+           + ANSWER_COLUMNS[17:21] + ["q24_healthy", "q25_improve", "email"])
+
+
+def _column_type(col):
+    if col == "submitted_at":
+        return _TS
+    if col in ARRAY_COLUMNS:
+        return pa.list_(pa.string())
+    if col in ANSWER_COLUMNS:
+        return _CATEGORY
+    return pa.string()
+
+
+SCHEMA = pa.schema([(col, _column_type(col)) for col in COLUMNS])
+
+
+# ── CONVERSION ─────────────────────────────────────────────────────────────────
+
+def _parse_ts(value):
+    """ISO string / datetime → aware datetime (naive values are taken as UTC)."""
+    if value is None:
+        return None
+    if not isinstance(value, datetime):
+        value = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def _iso(value):
+    """Timestamps back to PostgREST's ISO form, so rows look like fetched ones."""
+    return value.astimezone(timezone.utc).isoformat() if value is not None else None
+
+
+def rows_to_table(rows):
+    """Supabase row dicts → Arrow table in the snapshot schema."""
+    cols = {}
+    for field in SCHEMA:
+        values = [r.get(field.name) for r in rows]
+        if field.name == "submitted_at":
+            values = [_parse_ts(v) for v in values]
+        if field.type == _CATEGORY:
+            cols[field.name] = pa.array(values, pa.string()).dictionary_encode()
+        else:
+            cols[field.name] = pa.array(values, field.type)
+    return pa.table(cols, schema=SCHEMA)
+
+
+def table_to_rows(table):
+    """Arrow table → list of row dicts shaped like the Supabase response."""
+    rows = table.to_pylist()
+    for r in rows:
+        r["submitted_at"] = _iso(r["submitted_at"])
+    return rows
+
+
+# ── READ / WRITE ───────────────────────────────────────────────────────────────
+
+def open_snapshot(path=SNAPSHOT_FILE):
+    """Memory-map the snapshot; returns an Arrow table (zero-copy)."""
+    source = pa.memory_map(path, "r")
+    return pa.ipc.open_file(source).read_all()
+
+
+def high_water(table):
+    """(submitted_at, id) of the newest row, as stored in the file metadata."""
+    meta = (table.schema.metadata or {}).get(b"high_water")
+    return tuple(json.loads(meta)) if meta else None
+
+
+def write_snapshot(table, path=SNAPSHOT_FILE):
+    """Write atomically, recording the high-water mark in the schema metadata."""
+    if table.num_rows:
+        last = table.slice(table.num_rows - 1).to_pylist()[0]
+        mark = json.dumps([_iso(last["submitted_at"]), last["id"]])
+        table = table.replace_schema_metadata({"high_water": mark})
+    # IPC files need one dictionary per column across all record batches
+    table = table.unify_dictionaries().combine_chunks()
+    tmp = path + ".tmp"
+    with pa.OSFile(tmp, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp, path)
+
+
+def refresh_snapshot(client, path=SNAPSHOT_FILE, full=False):
+    """Append rows newer than the snapshot's high-water mark.
+
+    Returns (new_rows, total_rows).
+    """
+    from fetch import iter_pages
+
+    old = None if full or not os.path.exists(path) else open_snapshot(path)
+    after = high_water(old) if old is not None else None
+    parts = [old.replace_schema_metadata(None)] if old is not None else []
+    added = 0
+    for page in iter_pages(client, after=after):
+        parts.append(rows_to_table(page))
+        added += len(page)
+    if not added and old is not None:
+        return 0, old.num_rows
+    table = pa.concat_tables(parts) if parts else rows_to_table([])
+    write_snapshot(table, path)
+    return added, table.num_rows
+
+
+# ── QUERIES ────────────────────────────────────────────────────────────────────
+# Same --level / --since / --id filters and (submitted_at, id) keyset as
+# fetch.py, evaluated with Arrow compute before anything reaches Python.
+
+def filter_table(table, level=None, since=None, ids=None, after=None):
+    mask = None
+
+    def both(m, cond):
+        return cond if m is None else pc.and_(m, cond)
+
+    if level:
+        mask = both(mask, pc.equal(table["q2_level"].cast(pa.string()), level))
+    if since:
+        since_ts = pa.scalar(_parse_ts(since), _TS)
+        mask = both(mask, pc.greater_equal(table["submitted_at"], since_ts))
+    if ids is not None:
+        mask = both(mask, pc.is_in(table["id"], pa.array(list(ids), pa.string())))
+    if after and after[1] is None:
+        mask = both(mask, pc.greater_equal(table["submitted_at"], pa.scalar(_parse_ts(after[0]), _TS)))
+    elif after:
+        ts = pa.scalar(_parse_ts(after[0]), _TS)
+        newer = pc.or_(pc.greater(table["submitted_at"], ts),
+                       pc.and_(pc.equal(table["submitted_at"], ts), pc.greater(table["id"], after[1])))
+        mask = both(mask, newer)
+    return table if mask is None else table.filter(mask)
+
+
+def read_frame(path=SNAPSHOT_FILE, level=None, since=None, columns=None):
+    """Filtered snapshot as a pandas DataFrame (answer columns as categoricals)."""
+    table = filter_table(open_snapshot(path), level=level, since=since)
+    if columns:
+        table = table.select(columns)
+    return _to_frame(table)
+
+
+def _to_frame(table):
+    import pandas as pd
+
+    df = table.to_pandas()
+    for col in df.columns:
+        if col in ARRAY_COLUMNS:
+            # Arrow hands lists back as numpy arrays; keep Supabase's shape
+            df[col] = table[col].to_pylist()
+        elif isinstance(df[col].dtype, pd.CategoricalDtype):
+            # Categories in order of first appearance, unused ones dropped, so
+            # value_counts() lists (and breaks ties) exactly as for strings
+            df[col] = df[col].cat.set_categories(list(df[col].dropna().unique()))
+    return df
+
+
+def iter_pages(path=SNAPSHOT_FILE, level=None, since=None, ids=None, limit=None,
+               page_size=1000, prefetch=False, after=None):
+    """fetch.iter_pages() counterpart reading from the snapshot."""
+    table = filter_table(open_snapshot(path), level=level, since=since, ids=ids, after=after)
+    if limit is not None:
+        table = table.slice(0, limit)
+    for batch in table.to_batches(max_chunksize=page_size):
+        yield table_to_rows(pa.Table.from_batches([batch]))
+
+
+def iter_frames(path=SNAPSHOT_FILE, level=None, since=None, page_size=10_000):
+    """read_frame() in DataFrames of `page_size` rows, straight from Arrow."""
+    table = filter_table(open_snapshot(path), level=level, since=since)
+    for batch in table.to_batches(max_chunksize=page_size):
+        yield _to_frame(pa.Table.from_batches([batch], schema=table.schema))
+
+
+def count_responses(path=SNAPSHOT_FILE, level=None, since=None, ids=None, after=None):
+    """fetch.count_responses() counterpart reading from the snapshot."""
+    return filter_table(open_snapshot(path), level=level, since=since, ids=ids, after=after).num_rows
+
+
+def level_counts(path=SNAPSHOT_FILE, since=None):
+    """{q2_level: responses}, largest first, counted by Arrow."""
+    column = filter_table(open_snapshot(path), since=since)["q2_level"].cast(pa.string())
+    counts = {vc["values"]: vc["counts"] for vc in pc.value_counts(column).to_pylist()}
+    return dict(sorted(counts.items(), key=lambda kv: (-kv[1], str(kv[0]))))
+
+
+# ── CLI ────────────────────────────────────────────────────────────────────────
+
+def main():
+    from analyse import SUPABASE_URL, SUPABASE_KEY
+
+    parser = argparse.ArgumentParser(description="Create or refresh the local survey_responses snapshot")
+    parser.add_argument("--path", default=SNAPSHOT_FILE, help=f"Snapshot file (default: {SNAPSHOT_FILE})")
+    parser.add_argument("--full", action="store_true",   help="Rebuild from scratch instead of appending")
+    args = parser.parse_args()
+
+    try:
+        from supabase import create_client
+    except ImportError:
+        print("Run: pip install supabase")
+        sys.exit(1)
+
+    print("🔌 Connecting to Supabase…")
+    client = create_client(SUPABASE_URL, SUPABASE_KEY)
+    added, total = refresh_snapshot(client, args.path, full=args.full)
+    print(f"✅ {args.path}: +{added} new response(s), {total} total")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,462 @@
+"""
+we-are-what-we-eat · Data Sources
+=================================
+Shared by analyse.py and generate_report.py (--source).
+
+Where survey responses are read from. Every backend pages through
+survey_responses oldest first on the same (submitted_at, id) keyset and
+understands the same --level / --since / --id filters; the SQL backends
+turn them into WHERE clauses so only matching rows leave the database.
+
+  supabase                  the live table (default)
+  postgres://user@host/db   a Postgres copy of survey_responses
+  sqlite:///survey.db       a local SQLite replica (also: any *.db / *.sqlite path)
+  responses.jsonl / .csv    a file of rows, filtered in memory
+  survey_responses.arrow    a snapshot.py snapshot
+
+Make a local replica:
+  python sources.py --to survey.db                     # from Supabase
+  python sources.py --from responses.jsonl --to survey.db
+  python analyse.py --source survey.db --level P3
+"""
+
+import os
+import ast
+import csv
+import sys
+import json
+import argparse
+from collections import Counter
+from datetime import datetime, timezone
+
+from fetch import PAGE_SIZE, TABLE, _by_id_batch, _prefetch
+from multiselect import MULTI_SELECT
+
+SQLITE_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS {TABLE} (
+  id            TEXT PRIMARY KEY,
+  submitted_at  TEXT NOT NULL,      -- ISO 8601, UTC
+  q1_who        TEXT, q2_level TEXT, q3_gender TEXT,
+  q4_texture    TEXT, q5_flavour TEXT, q6_snack TEXT,
+  q7_spicy      TEXT, q8_fruit TEXT, q9_new TEXT, q10_new_food TEXT,
+  q11_veg       TEXT, q12_drinks TEXT, q13_fried TEXT,
+  q14_family    TEXT, q15_snack_decide TEXT, q16_breakfast TEXT, q17_school TEXT,
+  q18_cuisine   TEXT, q19_adv TEXT,  -- JSON arrays
+  q20_substitute TEXT, q21_intro TEXT, q22_convo TEXT,
+  q23_feel      TEXT, q24_healthy TEXT, q25_improve TEXT,  -- q24: JSON array
+  email         TEXT
+);
+CREATE INDEX IF NOT EXISTS {TABLE}_keyset ON {TABLE} (submitted_at, id);
+CREATE INDEX IF NOT EXISTS {TABLE}_level  ON {TABLE} (q2_level, submitted_at, id);
+"""
+SQLITE_COLUMNS = ["id", "submitted_at",
+                  "q1_who", "q2_level", "q3_gender", "q4_texture", "q5_flavour", "q6_snack",
+                  "q7_spicy", "q8_fruit", "q9_new", "q10_new_food", "q11_veg", "q12_drinks",
+                  "q13_fried", "q14_family", "q15_snack_decide", "q16_breakfast", "q17_school",
+                  "q18_cuisine", "q19_adv", "q20_substitute", "q21_intro", "q22_convo",
+                  "q23_feel", "q24_healthy", "q25_improve", "email"]
+
+
+def _parse_ts(value):
+    """ISO string / datetime → aware datetime (naive values are taken as UTC)."""
+    if not isinstance(value, datetime):
+        value = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def _iso(value):
+    """Timestamps in PostgREST's ISO form, so every backend yields the same rows."""
+    return _parse_ts(value).astimezone(timezone.utc).isoformat()
+
+
+# ── BACKENDS ───────────────────────────────────────────────────────────────────
+# iter_pages() and count() take the same arguments as fetch.iter_pages() and
+# fetch.count_responses(), minus the client.
+
+class Source:
+    label = "source"
+    remote = False   # True when reading goes over the network
+
+    def iter_pages(self, level=None, since=None, ids=None, limit=None,
+                   page_size=PAGE_SIZE, prefetch=True, after=None):
+        raise NotImplementedError
+
+    def count(self, level=None, since=None, ids=None, after=None):
+        raise NotImplementedError
+
+    def read_frame(self, level=None, since=None):
+        """All matching rows as one DataFrame, built page by page."""
+        import pandas as pd
+        frames = [pd.DataFrame(page) for page in self.iter_pages(level=level, since=since)]
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+    def iter_frames(self, level=None, since=None, page_size=PAGE_SIZE):
+        """Matching rows as a DataFrame per page, oldest first."""
+        import pandas as pd
+        for page in self.iter_pages(level=level, since=since, page_size=page_size):
+            yield pd.DataFrame(page)
+
+    def level_counts(self, since=None):
+        """{q2_level: responses}, largest first, without pandas (analyse.py --counts)."""
+        counts = Counter()
+        for page in self.iter_pages(since=since):
+            counts.update(row.get("q2_level") for row in page)
+        return dict(counts.most_common())
+
+
+class SupabaseSource(Source):
+    def __init__(self, url, key):
+        try:
+            from supabase import create_client
+        except ImportError:
+            print("Run: pip install supabase")
+            sys.exit(1)
+        self.label = "Supabase"
+        self.remote = True
+        self.client = create_client(url, key)
+
+    def iter_pages(self, **kw):
+        from fetch import iter_pages
+        return iter_pages(self.client, **kw)
+
+    def count(self, **kw):
+        from fetch import count_responses
+        return count_responses(self.client, **kw)
+
+    def level_counts(self, since=None):
+        """One head-only count request per level the form offers, instead of
+        downloading every row; the remainder is reported without a level."""
+        from fetch import count_responses
+        from synthetic import form_options
+        counts = Counter()
+        for level in form_options()["q2_level"]:
+            counts[level] = count_responses(self.client, level=level, since=since)
+        rest = count_responses(self.client, since=since) - sum(counts.values())
+        if rest:
+            counts[None] = rest   # missing, or a level the form doesn't offer
+        return {level: n for level, n in counts.most_common() if n}
+
+
+class SnapshotSource(Source):
+    def __init__(self, path):
+        import snapshot
+        self._snapshot = snapshot
+        self.label = f"snapshot {path}"
+        self.path = path
+
+    def iter_pages(self, **kw):
+        return self._snapshot.iter_pages(self.path, **kw)
+
+    def count(self, **kw):
+        return self._snapshot.count_responses(self.path, **kw)
+
+    def level_counts(self, since=None):
+        return self._snapshot.level_counts(self.path, since=since)
+
+    def read_frame(self, level=None, since=None):
+        # Straight from Arrow, answer columns as categoricals
+        return self._snapshot.read_frame(self.path, level=level, since=since)
+
+    def iter_frames(self, level=None, since=None, page_size=PAGE_SIZE):
+        return self._snapshot.iter_frames(self.path, level=level, since=since, page_size=page_size)
+
+
+class SQLSource(Source):
+    """Keyset paging over a DB-API connection; filters become WHERE clauses."""
+
+    param = "?"      # DB-API paramstyle placeholder
+    id_batch = 900   # ids per query: below SQLite's oldest 999-parameter limit
+
+    def _where(self, level, since, ids, after):
+        p = self.param
+        clauses, params = [], []
+        if level:
+            clauses.append(f"q2_level = {p}")
+            params.append(level)
+        if since:
+            clauses.append(f"submitted_at >= {self._ts(p)}")
+            params.append(self._ts_value(since))
+        if ids is not None:
+            clause, values = self._in_ids(list(ids))
+            clauses.append(clause)
+            params.extend(values)
+        if after and after[1] is None:
+            clauses.append(f"submitted_at >= {self._ts(p)}")
+            params.append(self._ts_value(after[0]))
+        elif after:
+            ts, row_id = after
+            clauses.append(f"(submitted_at > {self._ts(p)} OR "
+                           f"(submitted_at = {self._ts(p)} AND id > {self._id(p)}))")
+            params.extend([self._ts_value(ts), self._ts_value(ts), row_id])
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    # Per-dialect hooks
+    def _ts(self, p):
+        return p
+
+    def _id(self, p):
+        return p
+
+    def _ts_value(self, value):
+        return value
+
+    def _in_ids(self, ids):
+        return f"id IN ({', '.join([self.param] * len(ids))})", ids
+
+    def _row(self, row):
+        return row
+
+    def _fetch_pages(self, level, since, ids, limit, page_size, after):
+        cursor, remaining = after, limit
+        while remaining is None or remaining > 0:
+            size = page_size if remaining is None else min(page_size, remaining)
+            where, params = self._where(level, since, ids, cursor)
+            sql = f"SELECT * FROM {TABLE}{where} ORDER BY submitted_at, id LIMIT {int(size)}"
+            cur = self.conn.cursor()
+            cur.execute(sql, params)
+            names = [d[0] for d in cur.description]
+            rows = [self._row(dict(zip(names, r))) for r in cur.fetchall()]
+            cur.close()
+            if not rows:
+                return
+            yield rows
+            cursor = (rows[-1]["submitted_at"], rows[-1]["id"])
+            if remaining is not None:
+                remaining -= len(rows)
+
+    def iter_pages(self, level=None, since=None, ids=None, limit=None,
+                   page_size=PAGE_SIZE, prefetch=True, after=None):
+        if ids is not None and not ids:
+            return iter(())
+        if ids is not None and len(ids) > self.id_batch:
+            return _by_id_batch(lambda batch: self._fetch_pages(level, since, batch, None, page_size, after),
+                                ids, limit, self.id_batch)
+        return self._fetch_pages(level, since, ids, limit, page_size, after)
+
+    def count(self, level=None, since=None, ids=None, after=None):
+        if ids is not None and not ids:
+            return 0
+        if ids is not None and len(ids) > self.id_batch:
+            ids = list(dict.fromkeys(map(str, ids)))
+            return sum(self.count(level, since, ids[i:i + self.id_batch], after)
+                       for i in range(0, len(ids), self.id_batch))
+        where, params = self._where(level, since, ids, after)
+        cur = self.conn.cursor()
+        cur.execute(f"SELECT COUNT(*) FROM {TABLE}{where}", params)
+        n = cur.fetchone()[0]
+        cur.close()
+        return n
+
+    def level_counts(self, since=None):
+        where, params = self._where(None, since, None, None)
+        cur = self.conn.cursor()
+        cur.execute(f"SELECT q2_level, COUNT(*) AS n FROM {TABLE}{where} "
+                    f"GROUP BY q2_level ORDER BY n DESC, q2_level", params)
+        counts = dict(cur.fetchall())
+        cur.close()
+        return counts
+
+
+class SQLiteSource(SQLSource):
+    """Local replica: timestamps as UTC ISO text, text[] columns as JSON."""
+
+    def __init__(self, path):
+        import sqlite3
+        if not os.path.exists(path):
+            raise ValueError(f"no such SQLite file: {path}")
+        self.label = f"SQLite {path}"
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+
+    def _ts_value(self, value):
+        # Stored timestamps are UTC ISO strings, which sort as text; a bare
+        # date stays a prefix and compares correctly as it is
+        return value if len(str(value)) == 10 else _iso(value)
+
+    def _row(self, row):
+        for col in MULTI_SELECT:
+            if row.get(col) is not None:
+                row[col] = json.loads(row[col])
+        return row
+
+
+class PostgresSource(SQLSource):
+    param = "%s"
+
+    def __init__(self, dsn):
+        try:
+            import psycopg as driver
+        except ImportError:
+            try:
+                import psycopg2 as driver
+            except ImportError:
+                print("Run: pip install psycopg")
+                sys.exit(1)
+        self.label = "Postgres"
+        self.remote = True
+        self.conn = driver.connect(dsn)
+        self.conn.autocommit = True
+
+    def _ts(self, p):
+        return f"{p}::timestamptz"
+
+    def _id(self, p):
+        return f"{p}::uuid"
+
+    def _in_ids(self, ids):
+        return "id = ANY(%s::uuid[])", [ids]
+
+    def _row(self, row):
+        # Same shapes PostgREST returns: uuid and timestamptz as strings
+        row["id"] = str(row["id"])
+        row["submitted_at"] = _iso(row["submitted_at"])
+        return row
+
+    def iter_pages(self, prefetch=True, **kw):
+        pages = super().iter_pages(**kw)
+        return _prefetch(pages) if prefetch else pages
+
+
+class FileSource(Source):
+    """JSONL or CSV rows, loaded once and filtered in memory.
+
+    Fine for a few hundred thousand rows; load bigger files into SQLite first.
+    """
+
+    def __init__(self, path):
+        if not os.path.exists(path):
+            raise ValueError(f"no such file: {path}")
+        self.label = path
+        self.path = path
+        self._rows = None
+
+    @staticmethod
+    def _csv_row(row):
+        row = {k: (v if v != "" else None) for k, v in row.items()}
+        for col in MULTI_SELECT:
+            v = row.get(col)
+            if v is not None:
+                # responses.csv holds Python list reprs; JSON arrays also work
+                row[col] = json.loads(v) if v.startswith('["') else ast.literal_eval(v)
+        return row
+
+    def rows(self):
+        if self._rows is None:
+            with open(self.path, newline="", encoding="utf-8") as f:
+                if self.path.endswith(".csv"):
+                    rows = [self._csv_row(r) for r in csv.DictReader(f)]
+                else:
+                    rows = [json.loads(line) for line in f if line.strip()]
+            for r in rows:
+                r["submitted_at"] = _iso(r["submitted_at"])
+            self._rows = sorted(rows, key=lambda r: (_parse_ts(r["submitted_at"]), str(r["id"])))
+        return self._rows
+
+    def _matching(self, level, since, ids, after):
+        since = _parse_ts(since) if since else None
+        ids = set(map(str, ids)) if ids is not None else None
+        after = (_parse_ts(after[0]), None if after[1] is None else str(after[1])) if after else None
+        for r in self.rows():
+            if level and r.get("q2_level") != level:
+                continue
+            key = (_parse_ts(r["submitted_at"]), str(r["id"]))
+            if since and key[0] < since:
+                continue
+            if ids is not None and key[1] not in ids:
+                continue
+            if after and (key[0] < after[0] if after[1] is None else key <= after):
+                continue
+            yield r
+
+    def iter_pages(self, level=None, since=None, ids=None, limit=None,
+                   page_size=PAGE_SIZE, prefetch=True, after=None):
+        page = []
+        for n, r in enumerate(self._matching(level, since, ids, after)):
+            if limit is not None and n >= limit:
+                break
+            page.append(dict(r))
+            if len(page) == page_size:
+                yield page
+                page = []
+        if page:
+            yield page
+
+    def count(self, level=None, since=None, ids=None, after=None):
+        return sum(1 for _ in self._matching(level, since, ids, after))
+
+
+def open_source(spec=None, supabase_url=None, supabase_key=None):
+    """Backend for a --source value (None / "supabase" = the live table).
+
+    Raises ValueError for a spec that names no known backend.
+    """
+    if spec in (None, "", "supabase"):
+        return SupabaseSource(supabase_url, supabase_key)
+    if spec.startswith(("postgres://", "postgresql://")):
+        return PostgresSource(spec)
+    if spec.startswith("sqlite:///"):
+        return SQLiteSource(spec[len("sqlite:///"):])
+    ext = os.path.splitext(spec)[1].lower()
+    if ext in (".db", ".sqlite", ".sqlite3"):
+        return SQLiteSource(spec)
+    if ext in (".jsonl", ".csv"):
+        return FileSource(spec)
+    if ext == ".arrow":
+        return SnapshotSource(spec)
+    raise ValueError(f"unknown data source: {spec!r} (expected supabase, postgres://…, "
+                     "sqlite:///…, *.db, *.jsonl, *.csv or *.arrow)")
+
+
+# ── LOCAL REPLICA ──────────────────────────────────────────────────────────────
+
+def sqlite_values(row):
+    """A row as SQLITE_COLUMNS values: UTC ISO timestamp, text[] as JSON."""
+    r = dict(row, submitted_at=_iso(row["submitted_at"]))
+    for col in MULTI_SELECT:
+        if r.get(col) is not None:
+            r[col] = json.dumps(list(r[col]))
+    return [r.get(col) for col in SQLITE_COLUMNS]
+
+
+def write_sqlite(path, pages):
+    """Insert (or replace) pages of rows into a SQLite replica; returns rows written."""
+    import sqlite3
+    conn = sqlite3.connect(path)
+    conn.executescript(SQLITE_SCHEMA)
+    sql = (f"INSERT OR REPLACE INTO {TABLE} ({', '.join(SQLITE_COLUMNS)}) "
+           f"VALUES ({', '.join('?' * len(SQLITE_COLUMNS))})")
+    written = 0
+    for page in pages:
+        values = [sqlite_values(r) for r in page]
+        with conn:   # one transaction per page
+            conn.executemany(sql, values)
+        written += len(values)
+    conn.close()
+    return written
+
+
+def describe(source):
+    """The 'where are we reading from' line both scripts print."""
+    return f"🔌 Connecting to {source.label}…" if source.remote else f"📦 Reading {source.label}…"
+
+
+def main():
+    from analyse import SUPABASE_URL, SUPABASE_KEY
+
+    parser = argparse.ArgumentParser(description="Copy survey responses into a local SQLite replica")
+    parser.add_argument("--from", dest="source", default=None, help="Source to copy (default: Supabase)")
+    parser.add_argument("--to",   required=True,  help="SQLite file to create / update")
+    args = parser.parse_args()
+
+    try:
+        source = open_source(args.source, SUPABASE_URL, SUPABASE_KEY)
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    dest = args.to[len("sqlite:///"):] if args.to.startswith("sqlite:///") else args.to
+    print(f"📥 Copying {source.label} → {dest}…")
+    n = write_sqlite(dest, source.iter_pages())
+    print(f"✅ {n} response(s) written")
+
+
+if __name__ == "__main__":
+    main()
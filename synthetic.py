@@ -0,0 +1,186 @@
+"""
+we-are-what-we-eat · Synthetic Survey Responses
+===============================================
+Generates realistic survey_responses rows for benchmarks and offline
+testing, at any size from a hundred to a million rows, without touching
+the live Supabase table.
+
+  • every radio / checkbox answer comes from the options in index.html
+  • the scored questions (Q4–Q6, Q9, Q10, Q20) use the answer keys of
+    FLAVOUR_MAP / NEOPHOBIA_WEIGHTS in scoring.py, so every Flavour Avatar
+    and neophobia band is reached
+  • answers are skewed (some options are much more popular than others) and
+    reproducible for a given --seed
+  • rows come out oldest first, in pages, so memory stays flat
+
+Usage:
+  python synthetic.py --rows 100000                      # → synthetic.arrow
+  python synthetic.py --rows 5000 --out synthetic.jsonl  # JSON lines instead
+  python analyse.py --snapshot synthetic.arrow
+  python generate_report.py --snapshot synthetic.arrow --limit 20
+"""
+
+import os
+import sys
+import json
+import uuid
+import argparse
+from datetime import datetime, timedelta, timezone
+from html.parser import HTMLParser
+
+import numpy as np
+
+from multiselect import MULTI_SELECT
+from scoring import ADV_FOODS_NONE, FLAVOUR_MAP, NEOPHOBIA_WEIGHTS
+
+FORM_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "index.html")
+PAGE_SIZE = 10_000
+START     = datetime(2026, 3, 1, tzinfo=timezone.utc)   # survey launch
+SPAN_DAYS = 120
+EMAIL_RATE = 0.4                                       # share who opt in to a report
+
+# Average chance of ticking a checkbox option (popular ones more, others less)
+TICK_RATE = {"q18_cuisine": 0.35, "q19_adv": 0.25, "q24_healthy": 0.4}
+# Exclusive "none" options: ticked only by respondents who ticked nothing else
+NONE_OPTION = {"q19_adv": ADV_FOODS_NONE, "q24_healthy": "I'm not sure yet"}
+
+
+# ── VOCABULARY ─────────────────────────────────────────────────────────────────
+
+class _FormOptions(HTMLParser):
+    """Collects name → [value, …] for every radio / checkbox in the form."""
+
+    def __init__(self):
+        super().__init__()
+        self.options = {}
+
+    def handle_starttag(self, tag, attrs):
+        a = dict(attrs)
+        if tag == "input" and a.get("type") in ("radio", "checkbox") and a.get("name", "").startswith("q"):
+            self.options.setdefault(a["name"], []).append(a.get("value", ""))
+
+
+def form_options(path=FORM_FILE):
+    """name → [value, …] for every radio / checkbox question in the form."""
+    parser = _FormOptions()
+    with open(path, encoding="utf-8") as f:
+        parser.feed(f.read())
+    return parser.options
+
+
+def form_vocabulary(path=FORM_FILE):
+    """Answer options per question, as used for the synthetic rows."""
+    vocab = form_options(path)
+    # Scored questions: the answers scoring.py recognises
+    for col, mapping in {**FLAVOUR_MAP, **NEOPHOBIA_WEIGHTS}.items():
+        vocab[col] = list(mapping)
+    for col, none in NONE_OPTION.items():
+        vocab[col] = [o for o in vocab.get(col, []) if not o.lower().startswith(("none", "i'm not sure"))] + [none]
+    return vocab
+
+
+def _skewed(k, rng):
+    """Zipf-like popularity for k options, in a shuffled order."""
+    p = 1.0 / np.arange(1, k + 1) ** 0.8
+    rng.shuffle(p)
+    return p / p.sum()
+
+
+# ── GENERATION ─────────────────────────────────────────────────────────────────
+
+def _uuids(n, rng):
+    raw = rng.integers(0, 256, size=(n, 16), dtype=np.uint8)
+    return [str(uuid.UUID(bytes=b.tobytes(), version=4)) for b in raw]
+
+
+def generate_pages(n, seed=0, page_size=PAGE_SIZE, vocab=None, start=START, span_days=SPAN_DAYS):
+    """Yield `n` synthetic rows, oldest first, as lists of row dicts.
+
+    Rows have the shape of the Supabase response (ISO submitted_at, text[]
+    columns as lists, None for a skipped email).
+    """
+    rng = np.random.default_rng(seed)
+    vocab = vocab or form_vocabulary()
+    single = {col: (np.array(opts, dtype=object), _skewed(len(opts), rng))
+              for col, opts in vocab.items() if col not in MULTI_SELECT}
+    multi = {}
+    for col in MULTI_SELECT:
+        opts = vocab[col]
+        none = NONE_OPTION.get(col)
+        picks = [o for o in opts if o != none]
+        rates = TICK_RATE[col] * _skewed(len(picks), rng) * len(picks)
+        multi[col] = (picks, np.clip(rates, 0.02, 0.95), none)
+
+    # Submissions spread over the survey window, denser near the start
+    # (exponential, truncated to the window; microseconds keep them distinct)
+    scale = span_days / 3
+    u = rng.random(n) * (1 - np.exp(-span_days / scale))
+    micros = np.sort((-scale * np.log1p(-u) * 86400e6).astype(np.int64))
+
+    for lo in range(0, n, page_size):
+        m = min(page_size, n - lo)
+        cols = {col: rng.choice(opts, size=m, p=p) for col, (opts, p) in single.items()}
+        for col, (picks, rates, none) in multi.items():
+            ticked = rng.random((m, len(picks))) < rates
+            lists = [[picks[j] for j in np.flatnonzero(r)] for r in ticked]
+            if none:
+                lists = [l or [none] for l in lists]
+            cols[col] = lists
+        opted_in = rng.random(m) < EMAIL_RATE
+        ids = _uuids(m, rng)
+        page = []
+        for i in range(m):
+            row = {col: values[i] for col, values in cols.items()}
+            row["id"] = ids[i]
+            row["submitted_at"] = (start + timedelta(microseconds=int(micros[lo + i]))).isoformat()
+            row["email"] = f"parent{lo + i}@example.com" if opted_in[i] else None
+            page.append(row)
+        yield page
+
+
+def generate(n, seed=0, **kw):
+    """All `n` rows as one list (see generate_pages)."""
+    return [row for page in generate_pages(n, seed=seed, **kw) for row in page]
+
+
+def write_rows(path, n, seed=0, page_size=PAGE_SIZE):
+    """Write `n` rows to a .arrow snapshot (snapshot.py format) or .jsonl file."""
+    pages = generate_pages(n, seed=seed, page_size=page_size)
+    if path.endswith(".jsonl"):
+        with open(path, "w") as f:
+            for page in pages:
+                for row in page:
+                    f.write(json.dumps(row) + "\n")
+        return
+    import pyarrow as pa
+    from snapshot import rows_to_table, write_snapshot
+    write_snapshot(pa.concat_tables(rows_to_table(page) for page in pages), path)
+
+
+# ── CLI ────────────────────────────────────────────────────────────────────────
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic survey responses")
+    parser.add_argument("--rows", type=int, default=1000, help="Number of responses (default: 1000)")
+    parser.add_argument("--seed", type=int, default=0,    help="Random seed (default: 0)")
+    parser.add_argument("--out",  default="synthetic.arrow",
+                        help="Output file: .arrow snapshot or .jsonl (default: synthetic.arrow)")
+    args = parser.parse_args()
+
+    if args.rows < 1:
+        print("❌ --rows must be at least 1")
+        sys.exit(1)
+    if not args.out.endswith(".jsonl"):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            print("Run: pip install pyarrow   (or write --out responses.jsonl)")
+            sys.exit(1)
+
+    print(f"🧪 Generating {args.rows:,} synthetic responses (seed {args.seed})…")
+    write_rows(args.out, args.rows, seed=args.seed)
+    print(f"✅ {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""
+we-are-what-we-eat · Flavour Twins
+==================================
+Used by analyse.py --twins.
+
+Finds the respondents whose Flavour DNA is closest to a given profile, and
+what those "flavour twins" already eat — substitution via similarity across
+the cohort rather than from a fixed table.
+
+Profiles are six integers from 0 to 10, so a cohort of any size occupies
+only a few hundred to a few thousand distinct points. TwinIndex groups
+respondents into one bucket per distinct vector (a grid with a cell per
+integer point) and keeps, per bucket, its members and how many of them
+ticked each q19_adv / q18_cuisine option. A query measures its distance to
+every bucket at once and widens the radius until k respondents are inside,
+so the cost follows the number of buckets, not the number of respondents.
+
+  TwinIndex.from_frame(df, scores)  — build from score_profiles() output
+  index.neighbours(profile, k)      — the k nearest respondents (id, distance)
+  index.accepted_foods(profile, k)  — share of those twins who tried each food
+  index.next_foods(multi)           — per respondent, what their twins tried that they haven't
+
+Usage:
+  python twins.py --source survey.db --id <uuid>   # one respondent's twins
+"""
+
+import sys
+import argparse
+
+import numpy as np
+
+from multiselect import encode
+from scoring import ADV_FOODS_NONE, DIM_CAP, DIMENSIONS
+
+FOOD_COLUMNS = ["q19_adv", "q18_cuisine"]
+_BASE = DIM_CAP + 1   # one grid cell per integer score
+
+
+def _vector(profile):
+    return np.array([int(profile[d]) for d in DIMENSIONS], dtype=np.int64)
+
+
+class TwinIndex:
+    """Nearest-neighbour index over 6-dimension flavour profile vectors."""
+
+    def __init__(self, vectors, ids, multi=None):
+        vectors = np.asarray(vectors, dtype=np.int64)
+        codes = vectors @ _BASE ** np.arange(len(DIMENSIONS))
+        keys, bucket, sizes = np.unique(codes, return_inverse=True, return_counts=True)
+
+        # Members of a bucket sit next to each other, in their original order
+        order = np.argsort(bucket, kind="stable")
+        self.rows    = order                                             # index position → input row
+        self.ids     = np.asarray(ids, dtype=object)[order]
+        self.starts  = np.cumsum(sizes) - sizes
+        self.sizes   = sizes
+        self.centres = vectors[order][self.starts]                       # bucket → vector
+        # bucket → option ticks, per food column
+        self.options = {}
+        self.ticks   = {}
+        for col, mh in (multi or {}).items():
+            self.options[col] = mh.options
+            self.ticks[col] = (np.add.reduceat(mh.matrix[order].astype(np.int64), self.starts, axis=0)
+                               if len(order) and mh.options
+                               else np.zeros((len(keys), len(mh.options)), dtype=np.int64))
+
+    @classmethod
+    def from_frame(cls, df, scores, multi=None):
+        """Index a DataFrame of responses and its score_profiles() result.
+
+        `multi` is multiselect.encode(df), if the caller already has it.
+        """
+        if multi is None:
+            multi = encode(df, FOOD_COLUMNS)
+        return cls(scores[DIMENSIONS].to_numpy(), df["id"].astype(str).to_numpy(),
+                   {col: multi[col] for col in FOOD_COLUMNS if col in multi})
+
+    def __len__(self):
+        return len(self.ids)
+
+    # ── queries ──────────────────────────────────────────────────────────────
+
+    def _nearest_buckets(self, vector, k):
+        """Buckets within the smallest radius that holds ≥ k respondents, nearest first."""
+        d2 = ((self.centres - vector) ** 2).sum(axis=1)
+        # Squared distances are small integers: count respondents per distance
+        per_distance = np.bincount(d2, weights=self.sizes)
+        radius = int(np.searchsorted(np.cumsum(per_distance), min(k, len(self)) - 0.5))
+        inside = np.flatnonzero(d2 <= radius)
+        inside = inside[np.argsort(d2[inside], kind="stable")]
+        return inside, d2[inside]
+
+    def neighbours(self, profile, k=10, exclude=None):
+        """The `k` respondents closest to `profile` as (id, distance) pairs.
+
+        Ties keep submission order. `exclude` drops one id (the respondent
+        being asked about) from the result.
+        """
+        want = k + (exclude is not None)
+        out = []
+        for b, d2 in zip(*self._nearest_buckets(_vector(profile), want)):
+            dist = float(np.sqrt(d2))
+            for rid in self.ids[self.starts[b]:self.starts[b] + self.sizes[b]]:
+                if rid != exclude:
+                    out.append((rid, dist))
+                if len(out) == k:
+                    return out
+        return out
+
+    def accepted_foods(self, profile, k=50, column="q19_adv"):
+        """(option, share of twins who ticked it) for the ≥ k nearest respondents.
+
+        Whole buckets are counted, so respondents tied at the cut-off all
+        count. Most accepted first; "None of these yet!" is left out.
+        """
+        buckets, _ = self._nearest_buckets(_vector(profile), k)
+        if column not in self.ticks or not len(buckets):
+            return []
+        counts = self.ticks[column][buckets].sum(axis=0)
+        n = self.sizes[buckets].sum()
+        ranked = sorted(((o, c / n) for o, c in zip(self.options[column], counts)
+                         if c and o != ADV_FOODS_NONE), key=lambda oc: -oc[1])
+        return [(o, round(float(share), 3)) for o, share in ranked]
+
+    def next_foods(self, multi, k=50, column="q19_adv"):
+        """Per respondent, the food their twins tried most that they haven't.
+
+        `multi` is the encode() result the index was built from. Returns one
+        option (or None) per respondent in the frame's row order; each
+        neighbourhood is looked up once per distinct profile.
+        """
+        mh = multi[column]
+        out = np.full(len(mh), None, dtype=object)
+        if not len(mh) or column not in self.ticks:
+            return out
+        skip = np.array([o == ADV_FOODS_NONE for o in mh.options], dtype=bool)
+        for b in range(len(self.sizes)):
+            buckets, _ = self._nearest_buckets(self.centres[b], k)
+            counts = self.ticks[column][buckets].sum(axis=0)
+            counts[skip] = 0
+            ranking = np.argsort(-counts, kind="stable")
+            ranking = ranking[counts[ranking] > 0]
+            for r in self.rows[self.starts[b]:self.starts[b] + self.sizes[b]]:
+                untried = ranking[~mh.matrix[r, ranking]]
+                if len(untried):
+                    out[r] = mh.options[untried[0]]
+        return out
+
+
+# ── CLI ────────────────────────────────────────────────────────────────────────
+
+def main():
+    from analyse import SUPABASE_URL, SUPABASE_KEY
+    from sources import describe, open_source
+    from scoring import score_profiles
+
+    parser = argparse.ArgumentParser(description="Find a respondent's flavour twins")
+    parser.add_argument("--id",     required=True,            help="Respondent UUID")
+    parser.add_argument("--k",      type=int, default=10,     help="Twins to list (default: 10)")
+    parser.add_argument("--source", default=None,             help="Read from a local replica instead of Supabase (see sources.py)")
+    args = parser.parse_args()
+
+    try:
+        source = open_source(args.source, SUPABASE_URL, SUPABASE_KEY)
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    print(describe(source))
+    df = source.read_frame().reset_index(drop=True)
+    match = df.index[df["id"].astype(str) == args.id]
+    if not len(match):
+        print(f"⚠️  No response with id {args.id}")
+        sys.exit(1)
+
+    multi = encode(df, FOOD_COLUMNS)
+    scores = score_profiles(df, multi)
+    index = TwinIndex.from_frame(df, scores, multi)
+    me = scores.loc[match[0]]
+
+    print(f"\n  {args.id}  ·  {me['avatar_name']}  ·  "
+          + "  ".join(f"{d.capitalize()} {int(me[d])}" for d in DIMENSIONS))
+    print(f"\n  {args.k} nearest of {len(index):,} respondents:")
+    for rid, dist in index.neighbours(me, args.k, exclude=args.id):
+        print(f"    {rid}  distance {dist:.2f}")
+    for col, label in [("q19_adv", "Adventurous foods their twins tried"),
+                       ("q18_cuisine", "Cuisines their twins tried")]:
+        print(f"\n  {label}:")
+        for option, share in index.accepted_foods(me, column=col)[:6]:
+            print(f"    {option:<35} {round(100 * share):>3}%")
+
+
+if __name__ == "__main__":
+    main()
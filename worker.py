@@ -0,0 +1,263 @@
+"""
+we-are-what-we-eat · Report Worker
+==================================
+Long-running companion to generate_report.py: watches survey_responses for
+new submissions and renders (and optionally emails) each family's Food
+Avatar report within seconds of the form being sent, instead of waiting
+for the next manual run.
+
+  • polls for rows after the last (submitted_at, id) it finished — the same
+    keyset query generate_report.py --incremental uses, cheap on every
+    sources.py backend — every --interval seconds while idle. Each poll
+    reaches back --lookback seconds behind that mark: submitted_at is the
+    inserting transaction's start time, so a row can commit after a newer
+    one has been seen. Rows in the overlap that are already rendered are
+    recognised by their hash and skipped
+  • renders on a bounded process pool (--workers), in submission order;
+    the mail queue is bounded too, so a slow SMTP server holds rendering back
+  • checkpoints in <output>/manifest.json, shared with --incremental: the
+    high-water mark only moves once a row's PDF is on disk (or its id is in
+    the failed list), so a restart never drops a submission, and rows that
+    were already rendered are recognised by their hash and not redone
+  • emails go through mailer.py, whose log stops a restart from emailing a
+    family twice; emails queued but not yet sent are kept in the manifest
+    and queued again on restart, until the log says they were sent or
+    failed for good
+
+Usage:
+  python worker.py                            # watch Supabase → reports/
+  python worker.py --send-emails --workers 2
+  python worker.py --source survey.db --interval 2
+  python worker.py --once                     # catch up, then exit (cron)
+"""
+
+import os
+import sys
+import time
+import signal
+import argparse
+import functools
+import itertools
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import generate_report as gr
+from fetch import lookback_cursor
+
+POLL_INTERVAL  = 5      # seconds between polls while nothing new arrives
+RETRY_INTERVAL = 600    # seconds before a row that failed to render is tried again
+BATCH_SIZE     = 100    # rows fetched (and checkpointed) at a time
+LOOKBACK       = 300    # seconds re-read behind the high-water mark on every poll
+
+
+def _log(msg):
+    print(f"[{datetime.now():%H:%M:%S}] {msg}", flush=True)
+
+
+class ReportWorker:
+    """Renders new survey responses as they arrive, checkpointing as it goes."""
+
+    def __init__(self, source, out_dir, workers=1, mailer=None, chart_cache=None,
+                 renderer="matplotlib", batch_size=BATCH_SIZE, lookback=LOOKBACK):
+        self.source     = source
+        self.out_dir    = out_dir
+        self.mailer     = mailer
+        self.batch_size = batch_size
+        self.lookback   = lookback
+        self.stop       = threading.Event()
+        self.stats      = {"rendered": 0, "failed": 0, "queued": 0}
+
+        os.makedirs(out_dir, exist_ok=True)
+        self.manifest = gr.load_manifest(out_dir)
+        self.manifest.setdefault("pending_mail", {})   # id → address, queued but unconfirmed
+        # Earlier failures are due straight away; later ones wait RETRY_INTERVAL
+        self._failed_at = {rid: 0.0 for rid in self.manifest.get("failed", [])}
+
+        gr.configure_chart_cache(chart_cache, renderer=renderer)
+        self.pool = None
+        if workers > 1:
+            self.pool = ProcessPoolExecutor(max_workers=workers, initializer=gr.configure_chart_cache,
+                                            initargs=(chart_cache, 512, renderer))
+
+    # ── checkpoint ───────────────────────────────────────────────────────────
+
+    def _after(self):
+        """Keyset start of the next poll: `lookback` seconds before the mark."""
+        hw = self.manifest["high_water"]
+        return lookback_cursor((hw["submitted_at"], hw["id"]), self.lookback) if hw else None
+
+    def _checkpoint(self, rows=None):
+        """Move the high-water mark past `rows` and save the manifest."""
+        if rows:
+            # Retried rows are older than the mark and never move it back
+            last = (rows[-1]["submitted_at"], rows[-1]["id"])
+            hw = self.manifest["high_water"]
+            if not hw or last > (hw["submitted_at"], hw["id"]):
+                self.manifest["high_water"] = {"submitted_at": last[0], "id": last[1]}
+        self.manifest["failed"] = sorted(self._failed_at)
+        if self.mailer:
+            # Sent, or failed for good (the mailer has already retried): either
+            # way a restart mustn't queue it again
+            pending = self.manifest["pending_mail"]
+            self.manifest["pending_mail"] = {rid: to for rid, to in pending.items()
+                                             if self.mailer.outcome(rid, to) is None}
+        gr.save_manifest(self.out_dir, self.manifest)
+
+    # ── work ─────────────────────────────────────────────────────────────────
+
+    def _queue_mail(self, row, profile, path):
+        rid, email = str(row.get("id")), (row.get("email") or "").strip()
+        if not (self.mailer and email):
+            return ""
+        # Remembered before it is queued: a crash in between re-queues it,
+        # and the mailer's log drops it again if it did go out
+        self.manifest["pending_mail"][rid] = email
+        make_message = functools.partial(gr.build_message, email, path, row, profile)
+        if not self.mailer.submit(rid, email, make_message):
+            return f"  ✉️  already sent → {email}"
+        self.stats["queued"] += 1
+        return f"  ✉️  queued → {email}"
+
+    def process(self, rows):
+        """Render one batch of rows in order, then checkpoint it.
+
+        Returns how many rows needed rendering; the rest were already done.
+        """
+        import pandas as pd
+
+        digests = [gr.row_hash(row) for row in rows]
+        # A row that failed recently waits for its retry, even if the
+        # lookback brings it round again before then
+        now = time.time()
+        todo = [(row, d) for row, d in zip(rows, digests)
+                if not gr.is_up_to_date(self.manifest, row, d)
+                and now - self._failed_at.get(str(row.get("id")), 0.0) >= RETRY_INTERVAL]
+        if todo:
+            profiles = gr.score_profiles(pd.DataFrame([row for row, _ in todo])).to_dict("records")
+            jobs = [(row, self.out_dir, profile) for (row, _), profile in zip(todo, profiles)]
+            results = self.pool.map(gr._render_job, jobs) if self.pool else map(gr._render_job, jobs)
+            for (row, digest), profile, (path, err, _) in zip(todo, profiles, results):
+                rid = str(row.get("id"))
+                level = row.get("q2_level", "?")
+                if err is not None:
+                    _log(f"{level}  ERROR for {rid}: {err}")
+                    self._failed_at[rid] = time.time()
+                    self.stats["failed"] += 1
+                    continue
+                self._failed_at.pop(rid, None)
+                self.manifest["reports"][rid] = {"hash": digest, "path": path}
+                self.stats["rendered"] += 1
+                email_status = self._queue_mail(row, profile, path)
+                avatar_clean = profile["avatar_name"].encode("ascii", "ignore").decode().strip()
+                _log(f"{level}  {avatar_clean:<20}  → {os.path.basename(path)}{email_status}")
+        self._checkpoint(rows)
+        return len(todo)
+
+    def _due_retries(self):
+        now = time.time()
+        return [rid for rid, at in self._failed_at.items() if now - at >= RETRY_INTERVAL]
+
+    def poll(self):
+        """Handle everything submitted since the checkpoint; returns rows rendered or failed."""
+        pages = self.source.iter_pages(after=self._after(), page_size=self.batch_size, prefetch=False)
+        retry = self._due_retries()
+        if retry:
+            _log(f"Retrying {len(retry)} earlier failure(s)")
+            pages = itertools.chain(self.source.iter_pages(ids=retry, prefetch=False), pages)
+        new = 0
+        for rows in pages:
+            new += self.process(rows)
+            if self.stop.is_set():
+                break
+        return new
+
+    def requeue_mail(self):
+        """Queue again the emails a previous run queued but never confirmed."""
+        pending = {rid: to for rid, to in self.manifest["pending_mail"].items()
+                   if self.mailer.outcome(rid, to) is None}
+        failed = sum(self.mailer.outcome(rid, to) == "failed" for rid, to in self.manifest["pending_mail"].items())
+        if failed:
+            _log(f"Not re-queuing {failed} email(s) that failed for good (see {gr.EMAIL_LOG_NAME})")
+        if not pending:
+            return
+        _log(f"Re-queuing {len(pending)} unconfirmed email(s)")
+        for rows in self.source.iter_pages(ids=list(pending), prefetch=False):
+            for row in rows:
+                entry = self.manifest["reports"].get(str(row.get("id")))
+                if entry and os.path.exists(entry["path"]):
+                    self._queue_mail(row, gr.score_flavour_profile(row), entry["path"])
+
+    def run(self, interval=POLL_INTERVAL, once=False):
+        """Poll until stopped (or, with `once`, until caught up)."""
+        if self.mailer:
+            self.requeue_mail()
+        try:
+            while not self.stop.is_set():
+                new = self.poll()
+                if once and not new and not self._due_retries():
+                    break
+                if not new:
+                    self.stop.wait(interval)
+        finally:
+            if self.pool:
+                self.pool.shutdown()
+            if self.mailer:
+                self.mailer.close()
+            self._checkpoint()
+        return dict(self.stats)
+
+
+# ── CLI ────────────────────────────────────────────────────────────────────────
+
+def main():
+    parser = argparse.ArgumentParser(description="Render Food Avatar reports as survey responses arrive")
+    parser.add_argument("--output",      type=str,   default="reports", help="Output folder (default: reports/)")
+    parser.add_argument("--source",      type=str,   default=None,  help="Watch a local replica instead of Supabase (see sources.py)")
+    parser.add_argument("--interval",    type=float, default=POLL_INTERVAL,
+                        help=f"Seconds between polls while idle (default: {POLL_INTERVAL})")
+    parser.add_argument("--workers",     type=int,   default=1,     help="Render PDFs on N processes (default: 1, 0 = all cores)")
+    parser.add_argument("--send-emails", action="store_true",       help="Email each report to respondents who left an email address")
+    parser.add_argument("--mail-workers", type=int,  default=2,     help="Parallel SMTP connections for --send-emails (default: 2)")
+    parser.add_argument("--chart-cache", type=str,   default=None,  help="Folder to keep rendered charts in between runs")
+    parser.add_argument("--chart-renderer", choices=gr.CHART_RENDERERS, default="matplotlib",
+                        help="matplotlib PNG charts, or vector charts drawn by reportlab")
+    parser.add_argument("--lookback",    type=float, default=LOOKBACK,
+                        help=f"Seconds re-read behind the last response seen, for late commits (default: {LOOKBACK})")
+    parser.add_argument("--once",        action="store_true",       help="Catch up with everything new, then exit")
+    args = parser.parse_args()
+
+    from sources import describe, open_source
+    try:
+        source = open_source(args.source, gr.SUPABASE_URL, gr.SUPABASE_KEY)
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    print(describe(source))
+
+    workers = args.workers if args.workers > 0 else (os.cpu_count() or 1)
+    mailer = gr.open_mailer(args.output, args.mail_workers) if args.send_emails else None
+    worker = ReportWorker(source, args.output, workers=workers, mailer=mailer,
+                          chart_cache=args.chart_cache, renderer=args.chart_renderer, lookback=args.lookback)
+
+    # Finish the batch in hand and checkpoint, rather than dying mid-write
+    def request_stop(signum, frame):
+        if worker.stop.is_set():
+            raise KeyboardInterrupt
+        _log("Stopping after the current batch (again to force)…")
+        worker.stop.set()
+    signal.signal(signal.SIGINT, request_stop)
+    signal.signal(signal.SIGTERM, request_stop)
+
+    hw = worker.manifest["high_water"]
+    print(f"👀 Watching for new responses → {args.output}/"
+          + (f"  (after {hw['submitted_at']})" if hw else "")
+          + ("" if args.once else f"  every {args.interval:g}s, Ctrl-C to stop"))
+    stats = worker.run(interval=args.interval, once=args.once)
+
+    print(f"\n✅ Rendered: {stats['rendered']}  |  Failed: {stats['failed']}"
+          + (f"  |  Emails queued: {stats['queued']}" if mailer else ""))
+
+
+if __name__ == "__main__":
+    main()